@@ -1,12 +1,13 @@
 # https://kapernikov.com/tutorial-image-classification-with-scikit-learn/
 
-import joblib
-from skimage.io import imread
-from skimage.transform import resize
 import os
 
 def resize_all(src, pklname, include, width, height):
     """ load an image, resize the image, create an array that stores image information and store in a dictionary. Writes dictionary to pickle file."""
+    # imported here so that importing this module doesn't pay for scikit-image and joblib
+    import joblib
+    from skimage.io import imread
+    from skimage.transform import resize
     
     # data initialization
     data = dict()
@@ -33,6 +34,7 @@ def resize_all(src, pklname, include, width, height):
                     
         joblib.dump(data, pklname)
 
-HOMEPATH = os.path.expanduser('~')
-data_path = "{0}/desktop/data_set/AnimalFace/Image".format(HOMEPATH)
-print(os.listdir(data_path))
+if __name__ == "__main__":
+    HOMEPATH = os.path.expanduser('~')
+    data_path = "{0}/desktop/data_set/AnimalFace/Image".format(HOMEPATH)
+    print(os.listdir(data_path))
\ No newline at end of file
@@ -0,0 +1,107 @@
+# Handles auxiliary per-pixel output channels (AOVs)
+
+# AOVs are filled by the tracers in the same pass as the colors (see the aovs argument of tracer.trace_rays) and
+# saved next to the image as one .npy file per channel: Images/name.ppm => Images/name_aovs/channel.npy.
+# the arrays have the image's [height, width] shape (and a last axis of 3 for vectors).
+
+import os
+
+import numpy as np
+
+from functions import calculate_surface_angles
+
+# channel => dtype, values per pixel, value of the pixels the channel does not apply to
+aov_channels = {
+    'mass_id' : (np.int32, 1, -1), # index of the hit mass in the scene's masses, -1 if no mass is hit
+    'latitude' : (np.float32, 1, np.nan), # latitude of the hit point [radians], +pi/2 at the mass' +y pole
+    'longitude' : (np.float32, 1, np.nan), # longitude of the hit point [radians, 0 to 2 pi], around the y axis from +x towards +z
+    'deflection' : (np.float32, 1, np.nan), # angle between the camera ray and the ray's final direction [radians]
+    'soi_visits' : (np.uint16, 1, 0), # number of times the ray entered a sphere of influence
+    'steps' : (np.uint32, 1, 0), # number of tracing steps the ray took (0 for rays of tiles that were filled without tracing, see Camera.tile_masses)
+    'escape_direction' : (np.float32, 3, np.nan), # final direction of rays that escape to the background
+    'surface_point' : (np.float64, 3, np.nan), # hit point relative to the center of the hit mass, in the tracing precision (see shading.py)
+    'fill_color' : (np.int16, 3, -1), # color of the pixels outside of a region capture that are filled instead of traced (see Camera.capture), -1 for traced pixels
+}
+
+def check_aov_names(names):
+    """ raises an exception for unknown channel names """
+    unknown_names = [name for name in names if name not in aov_channels]
+    if (len(unknown_names) > 0):
+        raise Exception("Unknown AOV channels: {0}. Use any of: {1}".format(", ".join(unknown_names), ", ".join(aov_channels)))
+
+def aov_shape(name, shape):
+    """ returns the array shape of a channel for pixel arrays of the shape """
+    return tuple(int(size) for size in shape) + ((3,) if aov_channels[name][1] == 3 else ())
+
+def create_aovs(names, ray_count):
+    """ returns a dictionary of channel name => array of ray_count values, filled with the channel's empty value """
+    check_aov_names(names)
+    return {name : np.full(aov_shape(name, [ray_count]), aov_channels[name][2], dtype = aov_channels[name][0]) for name in names}
+
+def aov_directory(image_file_path):
+    """ returns the folder of the AOVs of an image file """
+    return os.path.splitext(image_file_path)[0] + "_aovs"
+
+def save_aovs(aovs, image_file_path, width, height):
+    """ saves ray ordered AOVs next to the image file and returns their folder """
+    directory = aov_directory(image_file_path)
+    os.makedirs(directory, exist_ok = True)
+    for name, values in aovs.items():
+        np.save(os.path.join(directory, name + ".npy"), values.reshape(aov_shape(name, [height, width])))
+    return directory
+
+def create_aov_memmaps(names, image_file_path, width, height, resume = False):
+    """ creates the .npy files of the channels next to the image file and returns a dictionary of channel name => writable memory map with shape [height, width(, 3)].
+    with resume, the files of an interrupted capture are opened instead (see checkpoint.py). """
+    check_aov_names(names)
+    directory = aov_directory(image_file_path)
+    os.makedirs(directory, exist_ok = True)
+
+    memmaps = {}
+    for name in names:
+        if (resume):
+            memmaps[name] = np.lib.format.open_memmap(os.path.join(directory, name + ".npy"), mode = "r+")
+        else:
+            memmaps[name] = np.lib.format.open_memmap(os.path.join(directory, name + ".npy"), mode = "w+", dtype = aov_channels[name][0], shape = aov_shape(name, [height, width]))
+            memmaps[name][:] = aov_channels[name][2]
+    return memmaps
+
+""" Recording """
+# the tracers call these with the indices (into the AOV arrays) of the rays that an event happened to.
+# they do nothing if no AOVs were requested.
+
+def count_aov(aovs, name, ray_indices):
+    """ adds one to the channel for the rays """
+    if (aovs is not None and name in aovs):
+        aovs[name][ray_indices] += 1
+
+def deflection_angles(initial_directions, directions):
+    """ returns the angles between the (N,3) unit initial directions and the (N,3) directions (or momenta) """
+    cosines = np.sum(initial_directions*directions, axis = 1) / np.linalg.norm(directions, axis = 1)
+    return np.arccos(np.clip(cosines, -1, 1))
+
+def record_hits(aovs, ray_indices, mass_indices, hit_points, directions, initial_directions, masses):
+    """ records the rays that hit the masses mass_indices at the hit points with the final directions (or momenta) """
+    if (aovs is None or ray_indices.shape[0] == 0):
+        return
+    if ('mass_id' in aovs):
+        aovs['mass_id'][ray_indices] = mass_indices
+    if ('latitude' in aovs or 'longitude' in aovs):
+        theta, phi = calculate_surface_angles(hit_points, masses.position[mass_indices], masses.radius[mass_indices])
+        if ('latitude' in aovs):
+            aovs['latitude'][ray_indices] = np.pi/2 - theta
+        if ('longitude' in aovs):
+            aovs['longitude'][ray_indices] = phi
+    if ('deflection' in aovs):
+        aovs['deflection'][ray_indices] = deflection_angles(initial_directions, directions)
+    if ('surface_point' in aovs):
+        aovs['surface_point'][ray_indices] = hit_points - masses.position[mass_indices]
+
+def record_escapes(aovs, ray_indices, directions, initial_directions):
+    """ records the rays that escape to the background with the final directions (or momenta) """
+    if (aovs is None or ray_indices.shape[0] == 0):
+        return
+    if ('deflection' in aovs):
+        aovs['deflection'][ray_indices] = deflection_angles(initial_directions, directions)
+    if ('escape_direction' in aovs):
+        aovs['escape_direction'][ray_indices] = directions / np.linalg.norm(directions, axis = 1)[:, np.newaxis]
\ No newline at end of file
@@ -0,0 +1,58 @@
+# Renders many scene files in one process
+
+# python batch.py scene_1.json scene_2.toml ... [--workers 4] [--tile-size 64]
+#
+# python, numpy and the render modules are loaded once for the whole batch instead of once per render,
+# and scene files with the same masses share their scene setup (see description.cached_scene).
+# with --workers, the files are rendered in parallel by that many warm worker processes.
+
+import sys
+import argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import description
+
+def render_file(file_path, tile_size = None):
+    """ renders one scene file and returns the path of the image file """
+    file_description = description.load_description(file_path)
+    if (tile_size is not None):
+        file_description['tile_size'] = tile_size
+    return description.render(file_description)
+
+def main(arguments = None):
+    parser = argparse.ArgumentParser(description = "Renders scene files (.json or .toml) in one process.")
+    parser.add_argument("scene_files", nargs = "+", help = "scene files to render")
+    parser.add_argument("--workers", type = int, default = 1, help = "number of worker processes rendering files in parallel")
+    parser.add_argument("--tile-size", type = int, default = None, help = "trace every file in tiles of this size")
+    arguments = parser.parse_args(arguments)
+
+    # time
+    start_time = datetime.now()
+
+    failures = 0
+    if (arguments.workers > 1):
+        with ProcessPoolExecutor(arguments.workers) as executor:
+            futures = [executor.submit(render_file, file_path, arguments.tile_size) for file_path in arguments.scene_files]
+            for file_path, future in zip(arguments.scene_files, futures):
+                try:
+                    print("{0} => {1}".format(file_path, future.result()))
+                except Exception as error:
+                    failures += 1
+                    print("{0} failed: {1}".format(file_path, error))
+    else:
+        for file_path in arguments.scene_files:
+            try:
+                print("{0} => {1}".format(file_path, render_file(file_path, arguments.tile_size)))
+            except Exception as error:
+                failures += 1
+                print("{0} failed: {1}".format(file_path, error))
+
+    # time
+    end_time = datetime.now()
+    print("Rendered {0} of {1} scene files. Time Elapsed: {2}".format(len(arguments.scene_files) - failures, len(arguments.scene_files), end_time - start_time))
+
+    return 1 if failures > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
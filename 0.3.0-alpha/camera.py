@@ -1,17 +1,22 @@
 # NOTE: adding a random generation seed for stellar systems would be very cool.
 
 import numpy as np
-from functions import arctan, arccos, integrate_schwarzschild
-import pyrr
+from time import monotonic
+from datetime import datetime
+from functions import translation_matrix, scale_matrix, look_at_matrix
+from geometric_tests import cone_sphere_overlaps, spherical_rectangle_half_angles
 
-from geometric_tests import ray_sphere_intersection
-from mass import Mass
-from scene import Scene
-from image import Image
+from scene import resolve_scene
+from image import Image, create_ppm_memmap, open_ppm_memmap
 
-from constants import background_color, soi_factor
+from constants import precisions, weak_field_tolerance, background_color, culling_tile_size, checkpoint_interval
 
-from non_linear_ray_tracer_functions import inside_soi, outside_soi
+from tracer import trace_rays, mass_arrays
+from aovs import create_aovs, save_aovs, create_aov_memmaps, aov_shape, record_escapes
+from trajectories import trajectory_file_path
+
+# camera models (see camera_space_rays and wide_angle_rays)
+projections = ['pinhole', 'equirectangular', 'fisheye']
 
 class Camera():
     """ 
@@ -23,13 +28,39 @@ class Camera():
     + up : np vec3
     + resolution : np vec2
     + fov : double [degrees]
+    + projection : string ('pinhole', 'equirectangular' or 'fisheye')
+    + precision : string ('double' or 'single')
+    + integrator : string ('euler', 'leapfrog' or 'yoshida')
+    + gravitational_wave : dictionary {'amplitude' : double, 'frequency' : double} or None
+    + time : double, the time at which the rays leave the camera
+    + weak_field_tolerance : double [radians] or None
+    + scene : scene object or None, the scene of captures that don't pass one (the bound scene if None)
     - aspect_ratio : double
     - screen_depth : const double
+    - ray_bundle : (intrinsics, camera space ray positions, camera space ray directions) or None
     
     methods:
-    - initialize_rays() => ray_position : np vec3, ray_direction : vec3
+    - __getstate__() => dictionary of the pickled members
+    - camera_space_rays(tile : [x_start, y_start, x_end, y_end], pixels : (x : np array, y : np array)) => ray_position : np vec3, ray_direction : vec3
+    - wide_angle_rays(X : np array, Y : np array) => ray_position : np vec3, ray_direction : vec3
+    - initialize_rays(tile : [x_start, y_start, x_end, y_end], pixels : (x : np array, y : np array)) => ray_position : np vec3, ray_direction : vec3
+    + tiles(tile_size : int) => generator of [x_start, y_start, x_end, y_end]
     - ray_sphere_intersection (ray_position, ray_direction, sphere_position, sphere_radius) => t0 : double, surface_coordinate : np vec3
-    + capture(scene : scene object, ray_positions : np array of np vec3, ray_directions : np array of np vec3, mode : string)
+    - trace(ray_positions, ray_directions, scene, color_array, masses : MassArrays, show_progress : bool, time : double, aovs : dictionary, trajectories : TrajectoryRecorder, step_size : double) => color_array
+    - tile_cones(tiles : list of [x_start, y_start, x_end, y_end]) => cone_axes : np array of np vec3, cone_half_angles : np array of double
+    - tile_masses(tiles : list of [x_start, y_start, x_end, y_end], scene, masses : MassArrays) => list of np array of mass indices
+    - trace_tile(tile : [x_start, y_start, x_end, y_end], scene, color_array, masses : MassArrays, aovs : dictionary, step_size : double) => color_array
+    - trace_culled(ray_positions, ray_directions, scene, color_array, masses : MassArrays, is_traced : np array of bool, aovs : dictionary, trajectories : TrajectoryRecorder, ray_pixels : np array, step_size : double) => color_array
+    - traced_pixels(scene, masses : MassArrays) => np array of bool
+    - capture_result(color_array, aov_arrays : dictionary, file_name : string, output : string, resolution : [width, height], trajectories : TrajectoryRecorder) => file path or (pixels, aov_arrays)
+    - region_pixels(region : [x_start, y_start, x_end, y_end] or np array [height, width] of bool) => x : np array, y : np array, bounds : [x_start, y_start, x_end, y_end]
+    - capture_region(scene, region, crop : bool, fill : color, file_name : string, aovs : list of string, output : string, trajectories : TrajectoryRecorder, step_size : double, soi_factor : double) => file path or (pixels, aov_arrays)
+    - capture_scene(scene) => scene object
+    - capture_masses(scene, soi_factor : double) => MassArrays
+    - capture_tile(tile : [x_start, y_start, x_end, y_end], scene, masses : MassArrays, aovs : list of string, step_size : double) => pixels : np array [height, width, 3] of uint8, aov_arrays : dictionary
+    + capture(tile_size : int, file_name : string, coordinator : (host : string, port : int), timeout : double, progress : function(fraction), aovs : list of string, control : CaptureControl, checkpoint_interval : double, output : string, scene, region, crop : bool, fill : color, trajectories : TrajectoryRecorder, step_size : double, soi_factor : double)
+    + capture_stream(tile_size : int, progress : function(fraction), aovs : list of string, control : CaptureControl, scene, step_size : double, soi_factor : double) => generator of (tile, pixels, aov_arrays)
+    + capture_frames(times : list of double, file_name : string, progress : function(fraction), scene) => list of file paths
     """
     
     def __init__(self, **kwargs):
@@ -41,14 +72,59 @@ class Camera():
         self.resolution = np.array(kwargs['resolution'], dtype = np.int64)
         self.fov = kwargs['fov']
         
+        # 'pinhole' (default) projects onto a flat screen and fov is the vertical field of view.
+        # 'equirectangular' maps longitude and latitude linearly onto the image and fov is the longitude range (360 for a full-sphere map with a 2:1 resolution).
+        # 'fisheye' is an equidistant fisheye and fov is the field of view across the image diagonal (see wide_angle_rays).
+        self.projection = kwargs.get('projection', 'pinhole')
+        if (self.projection not in projections):
+            raise Exception("'{0}' is not a supported projection. Use one of: {1}".format(self.projection, ", ".join(projections)))
+        if (self.projection == 'equirectangular' and (self.fov > 360 or self.fov*self.resolution[1]/self.resolution[0] > 180)):
+            raise Exception("An equirectangular camera covers at most 360 degrees of longitude (fov) and 180 degrees of latitude (fov*height/width).")
+        if (self.projection == 'fisheye' and self.fov > 360):
+            raise Exception("A fisheye camera covers at most 360 degrees (fov).")
+        
+        # 'double' traces rays in float64 and stores colors as int64.
+        # 'single' traces rays in float32 and stores colors as uint8.
+        self.precision = kwargs.get('precision', 'double')
+        if (self.precision not in precisions):
+            raise Exception("'{0}' is not a supported precision. Use one of: {1}".format(self.precision, ", ".join(precisions)))
+        
+        # 'euler' (default), or the symplectic 'leapfrog' and 'yoshida' (see tracer.py)
+        self.integrator = kwargs.get('integrator', 'euler')
+        
+        # a plus polarized gravitational wave {'amplitude' : a, 'frequency' : w} that the rays are traced through
+        # instead of the curvature of the masses (see gravitational_wave.py). time is the time at which rays leave the camera.
+        self.gravitational_wave = kwargs.get('gravitational_wave', None)
+        if (self.gravitational_wave is not None and set(self.gravitational_wave) != {'amplitude', 'frequency'}):
+            raise Exception("A gravitational_wave must have exactly an 'amplitude' and a 'frequency'.")
+        self.time = kwargs.get('time', 0.0)
+        
+        # rays pass through an soi in closed form where that is accurate to this many radians (None integrates every ray)
+        self.weak_field_tolerance = kwargs.get('weak_field_tolerance', weak_field_tolerance)
+        
+        # the scene that the camera captures. captures fall back to the bound scene without one (see scene.py).
+        self.scene = kwargs.get('scene', None)
+        
         # private
         self.aspect_ratio = kwargs['resolution'][0] / kwargs['resolution'][1]
         self.screen_depth = 1.0
         
+        # the camera space rays of the whole image, kept between captures (see initialize_rays)
+        self.ray_bundle = None
+        
     #methods
     # private
-    def initialize_rays(self):
-        """ returns a numpy array of photon ray positions and photon ray directions for every pixel """
+    def __getstate__(self):
+        """ returns the members that are pickled, for example when the camera is sent to distributed workers (see distributed.py).
+        the ray bundle of the whole image is left out: it is as large as the image and is rebuilt where it is needed. """
+        state = self.__dict__.copy()
+        state['ray_bundle'] = None
+        return state
+    
+    def camera_space_rays(self, tile = None, pixels = None):
+        """ returns the photon ray positions and unit ray directions in camera space (the camera at the origin, looking down -z) for every pixel,
+        or only for the pixels x_start <= x < x_end, y_start <= y < y_end of tile = [x_start, y_start, x_end, y_end],
+        or only for the pixels = (x, y) of two arrays of pixel coordinates """
         # https://www.scratchapixel.com/lessons/3d-basic-rendering/ray-tracing-generating-camera-rays/generating-camera-rays
         
         """
@@ -63,23 +139,36 @@ class Camera():
         # 4) matrices and vectors are column major. this means vectors are columns, and matrix operation order is from right to left, with the vector being far right (math convention).)
         
         ### "array space"
-        # define the x and y axis values
-        x = np.arange(0, self.resolution[0], 1)
-        y = np.arange(0, self.resolution[1], 1)
-        
-        # make a 2D set of coordinates from the axis values
-        X, Y = np.meshgrid(x, y)
-        
-        # combine into a numpy array of np vec2
-        # seperate the x and y coordinate values
-        X = X.flatten()
-        Y = Y.flatten()
+        if (pixels is not None):
+            # the coordinates of scattered pixels (see region_pixels) are given directly
+            X, Y = np.asarray(pixels[0]), np.asarray(pixels[1])
+        else:
+            # define the x and y axis values
+            if (tile is None):
+                tile = [0, 0, self.resolution[0], self.resolution[1]]
+            x = np.arange(tile[0], tile[2], 1)
+            y = np.arange(tile[1], tile[3], 1)
+            
+            # make a 2D set of coordinates from the axis values
+            X, Y = np.meshgrid(x, y)
+            
+            # combine into a numpy array of np vec2
+            # seperate the x and y coordinate values
+            X = X.flatten()
+            Y = Y.flatten()
+        
+        # the wide-angle projections are not linear transformations of the screen
+        if (self.projection != 'pinhole'):
+            return self.wide_angle_rays(X, Y)
         Z = np.full(X.shape, -self.screen_depth) # by convention, the camera points in -z
         W = np.full(X.shape, 1)
+        
+        # ray state dtype for the render precision
+        float_type = precisions[self.precision][0]
         # w is the homogenous coordinate and is set to 1. this 4th dimension is necessary to do translation transformations as linear transformations.
         
         # combine the x and y coordinate values into one np array of np vec2 ray positions
-        ray_positions = np.vstack([X, Y, Z, W]).T # transpose to send column-major to row-major
+        ray_positions = np.vstack([X, Y, Z, W]).T.astype(float_type) # transpose to send column-major to row-major
         
         # why flatten it into a 1D array of np vec4 instead of leaving it as the more
         # intuitive 2D array of vec4 that would repesent the screen coordinates more geometrically?
@@ -96,21 +185,21 @@ class Camera():
         
         ### raster space
         # apply a translation to move the coordinates to the center of the pixels
-        # pyrr transformations assume a row vector. this code uses column vectors and thus all transformations must be transposed.
-        to_pixel_center = pyrr.matrix44.create_from_translation([0.5, 0.5, 0])
+        # the transformation matrices (see functions.py) assume a row vector, as pyrr did. this code uses column vectors and thus all transformations must be transposed.
+        to_pixel_center = translation_matrix([0.5, 0.5, 0])
         
         ### normalized device coordinate space (NDC space)
         # apply scaling to normalize screen side lengths to the range [0, 1]
-        to_ndc = pyrr.matrix44.create_from_scale([1/self.resolution[0], 1/self.resolution[1], 1])
+        to_ndc = scale_matrix([1/self.resolution[0], 1/self.resolution[1], 1])
         
         ### screen space
         # apply scaling so that sides range from [0, 2] 
         # apply translation so that side lengths are in the range [-1, 1]
         # apply mirror transformation to y to change the coordinate system so that y+ points up the screen and not down the screen (this is now possible since the range is from [-1, 1])
         
-        scale = pyrr.matrix44.create_from_scale([2, 2, 1])
-        translate = pyrr.matrix44.create_from_translation([-1, -1, 0])
-        mirror_y = pyrr.matrix44.create_from_scale([1, -1, 1])
+        scale = scale_matrix([2, 2, 1])
+        translate = translation_matrix([-1, -1, 0])
+        mirror_y = scale_matrix([1, -1, 1])
         
         # the '@' operator means "matmul"
         to_screen_space = scale @ translate @ mirror_y
@@ -118,191 +207,696 @@ class Camera():
         ### camera space
         # apply scaling to correct for fov and aspect ratio
         fov_correction = np.tan(np.radians(self.fov/2)) # store value in variable so that it only needs to be calculated once
-        to_camera_space = pyrr.matrix44.create_from_scale([self.aspect_ratio*fov_correction, fov_correction, 1])
+        to_camera_space = scale_matrix([self.aspect_ratio*fov_correction, fov_correction, 1])
         
-        ### to world
-        # translate positions by camera position in world
-        to_world = pyrr.matrix44.create_from_translation(self.position)
+        ### send ray positions to camera space
+        ray_positions = ray_positions @ (to_pixel_center @ to_ndc @ to_screen_space @ to_camera_space).astype(float_type)
+        
+        # reduce from homogenous to standard cartesian coordinates
+        ray_positions = ray_positions[:, 0:3]
+        
+        ### generate directions from the normalized ray positions
+        # the camera is at the origin of camera space, so a ray's direction is its position
+        ray_directions = ray_positions / np.linalg.norm(ray_positions, axis = 1)[:, np.newaxis]
+        
+        return ray_positions, ray_directions
+    
+    def wide_angle_rays(self, X, Y):
+        """ returns the camera space photon ray positions and unit ray directions of the pixels X, Y of the equirectangular and fisheye projections.
+        every ray is computed from its pixel in one vectorized step. the rays start on the sphere of radius screen_depth around the camera. """
+        # the pixel centers relative to the image center, +x to the right and +y up, in units of half of the image height
+        u = (2*(X + 0.5) - self.resolution[0]) / self.resolution[1]
+        v = (self.resolution[1] - 2*(Y + 0.5)) / self.resolution[1]
+        aspect_ratio = self.resolution[0] / self.resolution[1]
+        
+        if (self.projection == 'equirectangular'):
+            # longitude around +y (0 straight ahead down -z, positive to the right) and latitude (positive up) are proportional to u and v.
+            # the pixel centers of a 360 degree image are half a pixel from the seam, so no ray is traced twice.
+            radians_per_unit = np.radians(self.fov) / (2*aspect_ratio)
+            longitude = u*radians_per_unit
+            latitude = v*radians_per_unit
+            ray_directions = np.stack([np.cos(latitude)*np.sin(longitude), np.sin(latitude), -np.cos(latitude)*np.cos(longitude)], axis = 1)
+        else:
+            # the angle to the optical axis (-z) is proportional to the distance to the image center, fov/2 at the corners.
+            # the image center has no direction around the axis and looks straight ahead.
+            radius = np.sqrt(u*u + v*v)
+            angle = radius / np.sqrt(aspect_ratio**2 + 1) * np.radians(self.fov)/2
+            safe_radius = np.where(radius > 0, radius, 1)
+            ray_directions = np.stack([np.sin(angle)*u/safe_radius, np.sin(angle)*v/safe_radius, -np.cos(angle)], axis = 1)
+        
+        # ray state dtype for the render precision
+        float_type = precisions[self.precision][0]
+        ray_directions = ray_directions.astype(float_type)
+        
+        return ray_directions*float_type(self.screen_depth), ray_directions
+    
+    def initialize_rays(self, tile = None, pixels = None):
+        """ returns a numpy array of photon ray positions and photon ray directions for every pixel,
+        or only for the pixels x_start <= x < x_end, y_start <= y < y_end of tile = [x_start, y_start, x_end, y_end],
+        or only for the pixels = (x, y) of two arrays of pixel coordinates """
+        # the camera space rays only depend on the intrinsics (resolution, fov, aspect ratio, precision). the rays of the
+        # whole image are kept in ray_bundle, so a capture after a pose change only rotates and translates them.
+        # tiles and pixels are generated every time, so that tiled and region captures keep their memory use.
+        intrinsics = (tuple(self.resolution), self.fov, self.projection, self.aspect_ratio, self.screen_depth, self.precision)
+        if (tile is not None or pixels is not None):
+            ray_positions, ray_directions = self.camera_space_rays(tile, pixels)
+        elif (self.ray_bundle is not None and self.ray_bundle[0] == intrinsics):
+            ray_positions, ray_directions = self.ray_bundle[1], self.ray_bundle[2]
+        else:
+            ray_positions, ray_directions = self.camera_space_rays()
+            self.ray_bundle = (intrinsics, ray_positions, ray_directions)
         
-        ### ray directions and photon positions
-        # ray directions are derived from the positions by using a lookat matrix and normalizing the resulting vectors
+        ### to world
+        # ray directions are oriented by using a lookat matrix
         # a lookat matrix orients the direction by taking the eye position (camera position in world space), 
         # a target position that one seeks to look at, and an arbitrary up vector used to form a basis through cross products.
         # since the camera basis relies on a cross product between the up vector and the target, the target and
         # up vector may not be pointing in the same direction, as the cross product will fail.
         
-        lookat = pyrr.matrix44.create_look_at(self.position, self.target, self.up).T # only works when transposed. why?
+        # the inverse of the view matrix sends camera space to world space. its upper 3x3 block is the camera's rotation
+        # and its last row the camera position.
+        camera_to_world = np.linalg.inv(look_at_matrix(self.position, self.target, self.up))
+        float_type = precisions[self.precision][0]
+        rotation = camera_to_world[0:3, 0:3].astype(float_type)
         
-        ### create camera to world matrix
-        """ apply to_world after the positions are copied for ray directions """
-        camera_to_world = to_pixel_center @ to_ndc @ to_screen_space @ to_camera_space @ np.linalg.inv(lookat.T)
-        """ look_at is inverted because pyrr thinks objects are moving and not the camera? it is inverted for reasons I do not understand... """
-        
-        ### send ray positions to world space
-        ray_positions = ray_positions @ camera_to_world
-        
-        ### generate directions from oriented and normalized ray positions
-        #ray_directions = ray_positions*1 # copy position data to ray directions array
-        #ray_directions = ray_positions*1
-        
-        ray_directions = ray_positions @ np.linalg.inv(to_world)
-        
-        # reduce from homogenous to standard cartesian coordinates
-        ray_directions = ray_directions[:, 0:3]
-        ray_positions = ray_positions[:, 0:3]
-        
-        # normalize the directions
-        for i in range(ray_directions.shape[0]):
-            ray_directions[i] = ray_directions[i] / np.linalg.norm(ray_directions[i])
+        # positions are rotated and translated, directions only rotated (rotations keep them normalized)
+        ray_positions = ray_positions @ rotation + camera_to_world[3, 0:3].astype(float_type)
+        ray_directions = ray_directions @ rotation
         
         return ray_positions, ray_directions
     
+    def trace(self, ray_positions, ray_directions, scene, color_array, masses = None, show_progress = True, time = None, aovs = None, trajectories = None, step_size = None):
+        """ traces rays of this camera with its integrator, gravitational wave and weak-field tolerance (see tracer.trace_rays). time defaults to the camera's time.
+        step_size replaces the step size of the integrator (None keeps the integrator's own). """
+        if (time is None):
+            time = self.time
+        return trace_rays(ray_positions, ray_directions, scene, color_array, masses = masses, show_progress = show_progress, integrator = self.integrator, gravitational_wave = self.gravitational_wave, time = time, weak_field_tolerance = self.weak_field_tolerance, aovs = aovs, trajectories = trajectories, step_size = step_size)
+    
+    def tile_cones(self, tiles):
+        """ returns the world space axes and half angles of the cones from the camera position that contain the rays of every tile """
+        if (self.projection != 'pinhole'):
+            return self.wide_angle_tile_cones(tiles)
+        
+        # the corners of a tile in camera space (see camera_space_rays). the cone through the four corner rays contains the tile's rays.
+        tiles = np.array(tiles, dtype = np.float64).reshape([-1, 4])
+        fov_correction = np.tan(np.radians(self.fov/2))
+        x = (2*tiles[:, [0, 2, 0, 2]]/self.resolution[0] - 1)*self.aspect_ratio*fov_correction
+        y = (1 - 2*tiles[:, [1, 1, 3, 3]]/self.resolution[1])*fov_correction
+        corners = np.stack([x, y, np.full(x.shape, -self.screen_depth)], axis = 2)
+        
+        rotation = np.linalg.inv(look_at_matrix(self.position, self.target, self.up))[0:3, 0:3]
+        corners = corners @ rotation
+        corners /= np.linalg.norm(corners, axis = 2)[:, :, np.newaxis]
+        
+        cone_axes = np.sum(corners, axis = 1)
+        cone_axes /= np.linalg.norm(cone_axes, axis = 1)[:, np.newaxis]
+        cone_half_angles = np.max(np.arccos(np.clip(np.sum(corners*cone_axes[:, np.newaxis], axis = 2), -1, 1)), axis = 1)
+        
+        # a margin for the rounding of the ray directions
+        return cone_axes, cone_half_angles + 1e-6
+    
+    def wide_angle_tile_cones(self, tiles):
+        """ returns the world space axes and half angles of the cones from the camera position that contain the rays of every tile of a wide-angle projection """
+        # the pixel centers of the first and last column and row of every tile, relative to the image center (see wide_angle_rays)
+        tiles = np.array(tiles, dtype = np.float64).reshape([-1, 4])
+        u_low, u_high = (2*(tiles[:, 0] + 0.5) - self.resolution[0]) / self.resolution[1], (2*(tiles[:, 2] - 0.5) - self.resolution[0]) / self.resolution[1]
+        v_low, v_high = (self.resolution[1] - 2*(tiles[:, 3] - 0.5)) / self.resolution[1], (self.resolution[1] - 2*(tiles[:, 1] + 0.5)) / self.resolution[1]
+        aspect_ratio = self.resolution[0] / self.resolution[1]
+        
+        # the rays of a tile lie in a rectangle of longitude and latitude around a pole, the longitude half-width around its center
+        if (self.projection == 'equirectangular'):
+            # around +y, with the longitude and latitude of the rays
+            radians_per_unit = np.radians(self.fov) / (2*aspect_ratio)
+            center_longitude, half_width = (u_low + u_high)/2*radians_per_unit, (u_high - u_low)/2*radians_per_unit
+            latitude_low, latitude_high = v_low*radians_per_unit, v_high*radians_per_unit
+        else:
+            # around -z, with the angle around the optical axis as the longitude and the angle to the optical axis as the colatitude.
+            # the radius of a tile runs from its point closest to the image center to its farthest corner.
+            radians_per_unit = np.radians(self.fov)/2 / np.sqrt(aspect_ratio**2 + 1)
+            corner_u, corner_v = np.stack([u_low, u_high, u_low, u_high], axis = 1), np.stack([v_low, v_low, v_high, v_high], axis = 1)
+            radius_low = np.hypot(np.clip(0, u_low, u_high), np.clip(0, v_low, v_high))
+            radius_high = np.max(np.hypot(corner_u, corner_v), axis = 1)
+            latitude_low, latitude_high = np.pi/2 - radius_high*radians_per_unit, np.pi/2 - radius_low*radians_per_unit
+            
+            # a tile that holds the image center goes all the way around the axis. the corners of any other tile span its angles.
+            center_longitude = np.arctan2(v_low + v_high, u_low + u_high)
+            corner_longitudes = np.angle(np.exp(1j*(np.arctan2(corner_v, corner_u) - center_longitude[:, np.newaxis])))
+            center_longitude += (np.max(corner_longitudes, axis = 1) + np.min(corner_longitudes, axis = 1))/2
+            half_width = np.where(radius_low > 0, (np.max(corner_longitudes, axis = 1) - np.min(corner_longitudes, axis = 1))/2, np.pi)
+        
+        # the cone is centered on the center longitude. wide rectangles are held by narrower cones closer to their pole, so the
+        # narrowest cone of a few latitudes from the center latitude to the nearer pole is used.
+        center_latitude = (latitude_low + latitude_high)/2
+        pole_latitude = np.where(center_latitude >= 0, np.pi/2, -np.pi/2)
+        cone_latitudes = center_latitude + np.linspace(0, 1, 5)[:, np.newaxis]*(pole_latitude - center_latitude)
+        cone_half_angles = spherical_rectangle_half_angles(cone_latitudes, half_width, latitude_low, latitude_high)
+        narrowest = np.argmin(cone_half_angles, axis = 0)
+        cone_latitude = np.take_along_axis(cone_latitudes, narrowest[np.newaxis], axis = 0)[0]
+        cone_half_angles = np.take_along_axis(cone_half_angles, narrowest[np.newaxis], axis = 0)[0]
+        
+        # the axes around the pole, in camera space
+        a, b, c = np.cos(cone_latitude)*np.cos(center_longitude), np.cos(cone_latitude)*np.sin(center_longitude), np.sin(cone_latitude)
+        if (self.projection == 'equirectangular'):
+            cone_axes = np.stack([b, c, -a], axis = 1)
+        else:
+            cone_axes = np.stack([a, b, -c], axis = 1)
+        
+        rotation = np.linalg.inv(look_at_matrix(self.position, self.target, self.up))[0:3, 0:3]
+        cone_axes = cone_axes @ rotation
+        
+        # a margin for the rounding of the ray directions
+        return cone_axes, cone_half_angles + 1e-6
+    
+    def tile_masses(self, tiles, scene, masses):
+        """ returns the indices of the masses whose bounding sphere (soi or surface) projects onto every tile.
+        rays of a tile without masses travel straight to the background. """
+        if (scene.superposed or self.gravitational_wave is not None):
+            # every mass bends every ray in these scenes. their tracers skip rays that miss the whole scene on their own.
+            return [np.arange(masses.count) for tile in tiles]
+        
+        cone_axes, cone_half_angles = self.tile_cones(tiles)
+        bound_radii = np.maximum(masses.soi_radius, masses.radius).astype(np.float64)
+        overlaps = cone_sphere_overlaps(self.position.astype(np.float64), cone_axes, cone_half_angles, masses.position.astype(np.float64), bound_radii)
+        
+        return [np.flatnonzero(overlap) for overlap in overlaps]
+    
+    def trace_tile(self, tile, scene, color_array, masses, aovs = None, step_size = None):
+        """ traces the rays of a tile into color_array. a tile that no mass projects onto is filled with the background without tracing.
+        a tile with masses traces its rays against every mass, since rays bent by one mass may reach masses outside of the tile's cone. """
+        if (len(self.tile_masses([tile], scene, masses)[0]) > 0):
+            ray_positions, ray_directions = self.initialize_rays(tile)
+            return self.trace(ray_positions, ray_directions, scene, color_array, masses = masses, show_progress = False, aovs = aovs, step_size = step_size)
+        
+        color_array[:] = background_color
+        if (aovs is not None):
+            ray_positions, ray_directions = self.initialize_rays(tile)
+            record_escapes(aovs, np.arange(ray_directions.shape[0]), ray_directions, ray_directions)
+        return color_array
+    
+    def trace_culled(self, ray_positions, ray_directions, scene, color_array, masses, is_traced, aovs = None, trajectories = None, ray_pixels = None, step_size = None):
+        """ traces the rays is_traced into color_array and fills the other rays with the background.
+        the rays of the pixels of trajectories (see trajectories.py) are always traced, in a batch of their own that records their paths.
+        ray_pixels are the flat pixel indices y*width + x of the rays (every pixel of the image in order by default). """
+        is_recorded = np.full(is_traced.shape, False)
+        if (trajectories is not None):
+            if (ray_pixels is None):
+                ray_pixels = np.arange(is_traced.shape[0])
+            is_recorded = trajectories.ray_mask(ray_pixels, self.resolution[0])
+            trajectories.start(ray_pixels[is_recorded], self.resolution[0])
+        
+        is_skipped = ~is_traced & ~is_recorded
+        color_array[is_skipped] = background_color
+        record_escapes(aovs, np.flatnonzero(is_skipped), ray_directions[is_skipped], ray_directions[is_skipped])
+        
+        def trace_batch(is_batch, batch_trajectories, show_progress):
+            batch_colors = color_array[is_batch]
+            batch_aovs = None if aovs is None else {name : values[is_batch] for name, values in aovs.items()}
+            self.trace(ray_positions[is_batch], ray_directions[is_batch], scene, batch_colors, masses = masses, show_progress = show_progress, aovs = batch_aovs, trajectories = batch_trajectories, step_size = step_size)
+            
+            color_array[is_batch] = batch_colors
+            if (aovs is not None):
+                for name, values in batch_aovs.items():
+                    aovs[name][is_batch] = values
+        
+        # the recorded rays are split off, so every other ray is traced as without a recorder
+        trace_batch(is_traced & ~is_recorded, None, True)
+        if (np.any(is_recorded)):
+            trace_batch(is_recorded, trajectories, False)
+        return color_array
+    
+    def capture_scene(self, scene = None):
+        """ returns the scene to capture: the scene passed to the capture, else the camera's scene, else the bound scene """
+        return resolve_scene(self.scene if scene is None else scene)
+    
+    def capture_masses(self, scene, soi_factor = None):
+        """ returns the MassArrays of the scene for a capture with the soi_factor (the scene's by default).
+        raises an exception if the sois of the scene's masses overlap at the soi_factor. """
+        if (soi_factor is not None and scene.sois_overlap(soi_factor)):
+            raise Exception("The sois of the scene's masses overlap at the soi factor {0}. Capture with a smaller soi_factor.".format(soi_factor))
+        return mass_arrays(scene, precisions[self.precision][0], soi_factor)
+    
+    def capture_tile(self, tile, scene, masses, aovs = None, step_size = None):
+        """ traces a tile and returns its pixels as a [height, width, 3] uint8 array (the values of the image file) and its AOVs as a
+        dictionary of channel name => [height, width(, 3)] array (empty without aovs) """
+        height, width = tile[3] - tile[1], tile[2] - tile[0]
+        color_array = np.zeros([width*height, 3], dtype = precisions[self.precision][1])
+        aov_arrays = None if aovs is None else create_aovs(aovs, width*height)
+        self.trace_tile(tile, scene, color_array, masses, aovs = aov_arrays, step_size = step_size)
+        
+        pixels = color_array.astype(np.uint8).reshape([height, width, 3])
+        if (aov_arrays is None):
+            return pixels, {}
+        return pixels, {name : values.reshape(aov_shape(name, [height, width])) for name, values in aov_arrays.items()}
+    
     # public
-    def capture(self):
-        # add file_name and file_type support
-        """ captures and saves the scene as an image file """
+    def tiles(self, tile_size):
+        """ yields the [x_start, y_start, x_end, y_end] pixel rectangles of square tiles covering the image, row by row """
+        for y_start in range(0, self.resolution[1], tile_size):
+            for x_start in range(0, self.resolution[0], tile_size):
+                yield [x_start, y_start, min(x_start + tile_size, self.resolution[0]), min(y_start + tile_size, self.resolution[1])]
+    
+    def capture(self, tile_size = None, file_name = None, coordinator = None, timeout = 300.0, progress = None, aovs = None, control = None, checkpoint_interval = checkpoint_interval, output = 'file', scene = None, region = None, crop = True, fill = (0, 0, 0), trajectories = None, step_size = None, soi_factor = None):
+        # add file_type support
+        """ captures and saves the scene as an image file and returns the path of the file.
+        with a tile_size, rays are generated and traced one tile at a time and every finished tile is written straight
+        into a memory mapped binary ppm file, so memory use depends on the tile size and not on the resolution.
+        with a coordinator (host, port), the tiles are served over TCP to worker processes (see distributed.py)
+        instead of being traced here. tiles that a worker does not finish within timeout seconds are reassigned.
+        progress is called with the finished fraction of a tiled capture instead of printing it.
+        aovs is a list of auxiliary channels (see aovs.py) that are filled in the same pass and saved next to the image.
+        tiled captures checkpoint their finished tiles every checkpoint_interval seconds and resume from the checkpoint when
+        captured again with the same file_name and parameters. a control (see checkpoint.CaptureControl) pauses or cancels them between tiles.
+        with output = 'array', nothing is written to disk and (pixels, aov_arrays) is returned instead of a file path: the image as a
+        [height, width, 3] uint8 array and a dictionary of channel name => [height, width(, 3)] array (see capture_stream for tiles as they finish).
+        scene is the scene to capture. without one, the camera's scene or else the bound scene is captured.
+        region is a pixel rectangle [x_start, y_start, x_end, y_end] or a [height, width] boolean mask of the image. only the rays of its
+        pixels are generated and traced, and the image is the region's bounding rectangle (crop = True) or the whole frame (crop = False).
+        pixels outside of the region are set to the fill color (and their AOVs to the channel fill values, with the fill color in the fill_color channel).
+        trajectories is a TrajectoryRecorder (see trajectories.py) that records the photon paths of its pixels during the capture.
+        they are saved next to the image file (Images/name.ppm => Images/name_trajectories.npz), or kept in the recorder with output = 'array'.
+        step_size replaces the step size of the camera's integrator and soi_factor the soi factor of the scene for this capture,
+        for example with the cheapest setting found by convergence.py. """
+        if (output not in ('file', 'array')):
+            raise Exception("'{0}' is not a supported capture output. Use 'file' or 'array'.".format(output))
+        if (region is not None and (tile_size is not None or coordinator is not None or control is not None)):
+            raise Exception("Region captures trace only the pixels of the region in one pass. Capture them without a tile_size, coordinator or control.")
+        if (trajectories is not None and (tile_size is not None or coordinator is not None)):
+            raise Exception("Trajectories are recorded by captures that are traced in one pass. Capture without a tile_size or coordinator.")
+        if (trajectories is not None):
+            # flat pixel indices y*width + x of pixels outside of the frame would land on other pixels
+            is_outside = np.any((trajectories.pixels < 0) | (trajectories.pixels >= self.resolution), axis = 1)
+            if (np.any(is_outside)):
+                raise Exception("The trajectory pixels {0} are outside of the {1}x{2} image.".format(trajectories.pixels[is_outside].tolist(), self.resolution[0], self.resolution[1]))
         
         """ Check for Invalid Program State """
-        # check if there is a bound scene
-        if (Scene.bound_scene == -1):
-            # there is no bound scene
-            raise Exception("No scene is bound. A scene must be bound to capture.")
-        
         # raise exception if masses are too close to each other
         
         """ Initialization """
-        # current bound scene
-        scene = Scene.scenes[Scene.bound_scene]
+        # the given scene, the camera's scene or the bound scene
+        scene = self.capture_scene(scene)
+        
+        if (coordinator is not None):
+            # imported here so that local captures don't pay for the networking modules
+            from distributed import Coordinator
+            
+            if (tile_size is None):
+                raise Exception("A tile_size is needed to distribute a capture.")
+            if (aovs is not None):
+                raise Exception("AOVs are not supported by distributed captures. Capture them locally with a tile_size.")
+            if (control is not None):
+                raise Exception("Distributed captures can't be paused or cancelled. Capture locally with a tile_size.")
+            if (output != 'file'):
+                raise Exception("Distributed captures are written to a file. Capture locally for an array output.")
+            if (step_size is not None or soi_factor is not None):
+                raise Exception("Distributed captures trace with the default step size and the scene's soi factor. Capture locally with a tile_size.")
+            return Coordinator(self, scene, tile_size, timeout).run(coordinator[0], coordinator[1], file_name)
+        
+        if (tile_size is not None and output == 'array'):
+            # the finished tiles are assembled in memory
+            pixels = np.zeros([self.resolution[1], self.resolution[0], 3], dtype = np.uint8)
+            aov_arrays = {} if aovs is None else {name : values.reshape(aov_shape(name, [self.resolution[1], self.resolution[0]])) for name, values in create_aovs(aovs, self.resolution[0]*self.resolution[1]).items()}
+            for tile, tile_pixels, tile_aovs in self.capture_stream(tile_size, progress, aovs, control, scene, step_size, soi_factor):
+                pixels[tile[1]:tile[3], tile[0]:tile[2]] = tile_pixels
+                for name, values in tile_aovs.items():
+                    aov_arrays[name][tile[1]:tile[3], tile[0]:tile[2]] = values
+            return pixels, aov_arrays
+        if (tile_size is not None):
+            return self.capture_tiles(scene, tile_size, file_name, progress, aovs, control, checkpoint_interval, step_size, soi_factor)
+        if (control is not None):
+            raise Exception("Only tiled captures can be paused or cancelled. Capture with a tile_size.")
+        if (region is not None):
+            return self.capture_region(scene, region, crop, fill, file_name, aovs, output, trajectories, step_size, soi_factor)
         
         # initialize rays
         ray_positions, ray_directions = self.initialize_rays()
+        masses = self.capture_masses(scene, soi_factor)
         
         # conveniance variables
         mass_count = scene.masses.shape[0]
         ray_count = ray_positions.shape[0]
 
         # initialize color array
-        color_array = np.full([ray_count,3], -1) # fill color array with -1 for debugging
+        color_type = precisions[self.precision][1]
+        if (color_type == np.uint8):
+            color_array = np.zeros([ray_count,3], dtype = color_type) # uint8 cannot hold the -1 debugging value
+        else:
+            color_array = np.full([ray_count,3], -1, dtype = color_type) # fill color array with -1 for debugging
         
-        """ There Are No Masses in the Scene """
-        # check if there are even any masses in the scene
-        if (mass_count == 0): # if the bound scene has no masses
-            # no calculation needed. return the background color.
-            color_array = np.full([self.resolution[0]*self.resolution[1], 3], np.full(3, background_color), dtype = np.int64)
+        # auxiliary channels, filled with the colors
+        aov_arrays = None if aovs is None else create_aovs(aovs, ray_count)
         
         """ For Every Ray """
-        for r in range(ray_count): # for every ray "r":
-            """ Progress Bar """
-            # progress percentage
-            print("{:.2f}".format(r/ray_positions.shape[0]*100), "%")
-            
-            is_outside_soi = True
-            mass_index = 0
-            for m in range(mass_count):
-                if (np.linalg.norm(ray_positions[r] - scene.masses[m].position) < scene.masses[m].rs*soi_factor):
-                    is_outside_soi = False
-                    mass_index = m
-                    break
-            
-            if (is_outside_soi):
-                outside_soi(ray_positions[r], ray_directions[r], scene, r, ray_count, mass_count, color_array)
-            else:
-                inside_soi(ray_positions[r], ray_directions[r], scene, r, mass_index, ray_count, mass_count, color_array)
-            
-            
-            """ OLD CODE """
-            """ Initialize Intersection and t0 Arrays """
-            """
-            # make an array of ray intersection points and t0 values for every mass
-            intersection_array = np.full(ray_positions.shape, np.array([np.nan, np.nan, np.nan]))
-            t0_array = np.full(mass_count, np.nan)
-            """
+        # all rays are traced together. the per-ray outside_soi and inside_soi in
+        # non_linear_ray_tracer_functions.py are the reference for the batched version.
+        self.trace_culled(ray_positions, ray_directions, scene, color_array, masses, self.traced_pixels(scene, masses), aovs = aov_arrays, trajectories = trajectories, step_size = step_size)
+        
+        """ OLD CODE """
+        """ Initialize Intersection and t0 Arrays """
+        """
+        # make an array of ray intersection points and t0 values for every mass
+        intersection_array = np.full(ray_positions.shape, np.array([np.nan, np.nan, np.nan]))
+        t0_array = np.full(mass_count, np.nan)
+        """
+        
+        """ For Every Mass: Check Intersection Between Ray and Mass """
+        """
+        for m in range(mass_count): # for every mass "m"
+            # fill arrays with intersection points and t0 values for the given ray and every mass in the scene
+            intersection_array[m], t0_array[m] = ray_sphere_intersection(ray_positions[r], ray_directions[r], scene.masses[m].position, scene.masses[m].radius)
             
-            """ For Every Mass: Check Intersection Between Ray and Mass """
-            """
-            for m in range(mass_count): # for every mass "m"
-                # fill arrays with intersection points and t0 values for the given ray and every mass in the scene
-                intersection_array[m], t0_array[m] = ray_sphere_intersection(ray_positions[r], ray_directions[r], scene.masses[m].position, scene.masses[m].radius)
+        # find the lowest positive t0 value. this value corresponds with the closest intersection.
+        # first set all negative t0 values as +infinity so that the lowest non-negative t0 may be easily found.
+        """
+        
+        """ Calculate Closest Intersection """
+        """
+        for i, element in enumerate(t0_array):
+            if element < 0 or np.isnan(element):
+                t0_array[i] = np.inf # setting negative values to +infinity so that they cannot be considered in closest intersection
+        
+        # if there are no positive t0 values (excluding +inf), there is no intersection
+        if (np.all(t0_array == np.inf)):
+            color_array[r] = background_color
+            continue
+        
+        # calculate index of t0 corresponding with closest intersected mass
+        index = np.argmin(t0_array)
+        
+        # store intersection point and t0
+        intersection_point = intersection_array[index]
+        t0 = t0_array[index]
+        
+        # the intersected mass
+        mass = scene.masses[index]
+        
+        # the position and direction of the ray that intersected the mass
+        ray_position = ray_positions[index]
+        ray_direction = ray_directions[index]
+        """
+        
+        """ lighting """
+        """
+        # simple color finding algorithm. change later
+        
+        #sphere_theta = np.arccos((surface_coordinate)[2] / radius)
+        #sphere_phi = np.arctan((surface_coordinate)[1], (surface_coordinate)[0])
+        
+        # the position of the intersection in the mass' coordinates (same coordinates but translated so that the origin is th ecenter of the mass)
+        surface_coordinate = intersection_point - mass.position
+        surface_normal = surface_coordinate / np.linalg.norm(surface_coordinate)
+        
+        #what is actually going on here? how is the ray direction not equivelent to intersection_point - camera_position?
+        direction_from_camera = intersection_point - self.position; direction_from_camera /= np.linalg.norm(direction_from_camera)
+        #direction_from_camera = ray_direction - ray_position; direction_from_camera /= np.linalg.norm(direction_from_camera)
+        #direction_from_camera = ray_position - self.position
+        
+        #vp.arrow(pos = vec3(ray_position), axis = vec3(direction_from_camera), color = vp.color.orange)
+        
+        lighting_coefficient = abs(np.dot(direction_from_camera, -surface_normal)) # surface normal lighting, flip surface normal so it points out of the surface.
+        
+        sphere_theta = arccos((surface_coordinate)[1] / mass.radius)
+        if ((surface_coordinate[0] == 0) or (surface_coordinate[2] == 0)): 
+            # for the exact poles, the checkered color pattern is problematic.
+            # what color should the exact center of the pole have?
+            # this reflects in the arctan to find phi.
+            # what is phi when there is only a vertical component? at the poles it could be any angle.
+            # just set angle to zero to prevent nan issues in the arctan function.
+            sphere_phi = 0
+        else:
+            sphere_phi = arctan((surface_coordinate)[2], (surface_coordinate)[0])
+        
+        texture_angle = 2*np.pi / mass.checkered_subdivision
+        
+        theta_condition = (int(sphere_theta / texture_angle) % 2 == 0)
+        phi_condition = (int(sphere_phi / texture_angle) % 2 == 0)
+        
+        if (theta_condition ^ phi_condition):
+            color = np.array(lighting_coefficient * mass.color1, dtype = np.int64)
+        else:
+            color = np.array(lighting_coefficient * mass.color2, dtype = np.int64)
+        
+        # store color corresponding to ray
+        color_array[r] = color
+        """
+        
+        return self.capture_result(color_array, aov_arrays, file_name, output, trajectories = trajectories)
+    
+    # private
+    def traced_pixels(self, scene, masses, pixels = None):
+        """ returns which rays of the whole image (or of the pixels (x, y)) are traced: the rays of the tiles that a mass or soi projects onto (see tile_masses).
+        with pixels, only the tiles that hold one of them are culled. """
+        if (pixels is not None):
+            x, y = pixels
+            columns = -(-self.resolution[0] // culling_tile_size)
+            tile_indices, pixel_tiles = np.unique((y // culling_tile_size)*columns + x // culling_tile_size, return_inverse = True)
+            tiles = [[column*culling_tile_size, row*culling_tile_size, min((column + 1)*culling_tile_size, self.resolution[0]), min((row + 1)*culling_tile_size, self.resolution[1])] for row, column in zip(*np.divmod(tile_indices.tolist(), columns))]
+            is_tile_traced = np.array([len(tile_masses) > 0 for tile_masses in self.tile_masses(tiles, scene, masses)])
+            return is_tile_traced[pixel_tiles.reshape(-1)]
+        
+        tiles = list(self.tiles(culling_tile_size))
+        is_traced = np.full([self.resolution[1], self.resolution[0]], False)
+        for tile, tile_masses in zip(tiles, self.tile_masses(tiles, scene, masses)):
+            is_traced[tile[1]:tile[3], tile[0]:tile[2]] = len(tile_masses) > 0
+        return is_traced.flatten()
+    
+    def capture_result(self, color_array, aov_arrays, file_name, output = 'file', resolution = None, trajectories = None):
+        """ saves the traced colors (and aovs and recorded trajectories) of the whole image, or of an image of the resolution [width, height],
+        to an image file and returns its path, or returns them as (pixels, aov_arrays) with output = 'array' (see capture) """
+        width, height = self.resolution if resolution is None else resolution
+        if (output == 'array'):
+            pixels = color_array.astype(np.uint8).reshape([height, width, 3])
+            if (aov_arrays is None):
+                return pixels, {}
+            return pixels, {name : values.reshape(aov_shape(name, [height, width])) for name, values in aov_arrays.items()}
+        
+        # save color data to image file
+        image = Image(width, height, color_array)
+        if (file_name is None):
+            file_path = image.save(file_type = 'ppm')
+        else:
+            file_path = image.save(file_name = file_name, file_type = 'ppm')
+        
+        if (aov_arrays is not None):
+            save_aovs(aov_arrays, file_path, width, height)
+        if (trajectories is not None):
+            trajectories.save(trajectory_file_path(file_path))
+        
+        return file_path
+    
+    def region_pixels(self, region):
+        """ returns the x and y coordinates of the pixels of a region (see capture), in image order, and the bounding rectangle
+        [x_start, y_start, x_end, y_end] of the region """
+        region = np.asarray(region)
+        
+        if (region.dtype == bool):
+            if (region.shape != (self.resolution[1], self.resolution[0])):
+                raise Exception("A region mask must have the shape [height, width] = [{0}, {1}] of the image.".format(self.resolution[1], self.resolution[0]))
+            y, x = np.nonzero(region)
+            if (x.shape[0] == 0):
+                raise Exception("The region mask selects no pixels.")
+            return x, y, [int(x.min()), int(y.min()), int(x.max()) + 1, int(y.max()) + 1]
+        
+        if (region.shape != (4,)):
+            raise Exception("A region must be a pixel rectangle [x_start, y_start, x_end, y_end] or a [height, width] boolean mask.")
+        x_start, y_start, x_end, y_end = [int(value) for value in region]
+        if (not (0 <= x_start < x_end <= self.resolution[0] and 0 <= y_start < y_end <= self.resolution[1])):
+            raise Exception("The region {0} is empty or outside of the {1}x{2} image.".format([x_start, y_start, x_end, y_end], self.resolution[0], self.resolution[1]))
+        X, Y = np.meshgrid(np.arange(x_start, x_end), np.arange(y_start, y_end))
+        return X.flatten(), Y.flatten(), [x_start, y_start, x_end, y_end]
+    
+    def capture_region(self, scene, region, crop, fill, file_name, aovs = None, output = 'file', trajectories = None, step_size = None, soi_factor = None):
+        """ traces only the pixels of a region and saves or returns the region's bounding rectangle (crop) or the whole frame (see capture) """
+        color_type = precisions[self.precision][1]
+        masses = self.capture_masses(scene, soi_factor)
+        
+        # only the rays of the region are generated and traced, so the cost follows its pixel count
+        x, y, bounds = self.region_pixels(region)
+        ray_positions, ray_directions = self.initialize_rays(pixels = (x, y))
+        color_array = np.zeros([x.shape[0], 3], dtype = color_type)
+        aov_arrays = None if aovs is None else create_aovs(aovs, x.shape[0])
+        
+        # only the culling tiles of the region are culled (see traced_pixels)
+        is_traced = self.traced_pixels(scene, masses, (x, y))
+        self.trace_culled(ray_positions, ray_directions, scene, color_array, masses, is_traced, aovs = aov_arrays, trajectories = trajectories, ray_pixels = y*self.resolution[0] + x, step_size = step_size)
+        
+        """ Output Image """
+        # the pixels of the region are placed into the bounding rectangle or the whole frame, the rest is filled
+        if (not crop):
+            bounds = [0, 0, self.resolution[0], self.resolution[1]]
+        width, height = bounds[2] - bounds[0], bounds[3] - bounds[1]
+        image_indices = (y - bounds[1])*width + (x - bounds[0])
+        
+        image_colors = np.empty([width*height, 3], dtype = color_type)
+        image_colors[:] = fill
+        image_colors[image_indices] = color_array
+        
+        image_aovs = None
+        if (aov_arrays is not None):
+            image_aovs = create_aovs(aovs, width*height)
+            if ('fill_color' in image_aovs):
+                image_aovs['fill_color'][:] = fill
+            for name, values in aov_arrays.items():
+                image_aovs[name][image_indices] = values
+        
+        return self.capture_result(image_colors, image_aovs, file_name, output, [width, height], trajectories)
+    
+    def capture_tiles(self, scene, tile_size, file_name, progress = None, aovs = None, control = None, checkpoint_interval = checkpoint_interval, step_size = None, soi_factor = None):
+        """ out of core capture. traces the scene one tile at a time into a memory mapped image file (and memory mapped AOV files) and returns the file path.
+        the finished tiles are checkpointed and a capture with the same file_name and parameters resumes from the checkpoint (see checkpoint.py). """
+        # imported here so that whole image captures don't pay for the checkpoint modules
+        from checkpoint import CaptureCancelled, capture_fingerprint, find_checkpoint, save_checkpoint, remove_checkpoint
+        
+        # per-mass constants are shared by every tile
+        masses = self.capture_masses(scene, soi_factor)
+        
+        tiles = list(self.tiles(tile_size))
+        
+        """ Checkpoint """
+        # an interrupted capture of the same file name (or of a renamed file_name(i)) and parameters is continued
+        fingerprint = capture_fingerprint(self, scene, tile_size, aovs, step_size, soi_factor)
+        completed = None
+        if (file_name is not None):
+            file_path, completed = find_checkpoint(file_name, fingerprint)
+        
+        if (completed is None):
+            completed = set()
+            file_path, pixels = create_ppm_memmap(self.resolution[0], self.resolution[1], file_name)
+        else:
+            pixels = open_ppm_memmap(file_path, self.resolution[0], self.resolution[1])
+            print("Resuming {0} with {1} of {2} tiles finished".format(file_path, len(completed), len(tiles)))
+        aov_memmaps = {} if aovs is None else create_aov_memmaps(aovs, file_path, self.resolution[0], self.resolution[1], resume = len(completed) > 0)
+        
+        def checkpoint():
+            # the tiles are flushed as they are written, so every completed tile is on disk
+            save_checkpoint(file_path, fingerprint, completed)
+        
+        last_checkpoint = monotonic()
+        
+        """ For Every Tile """
+        try:
+            for t, tile in enumerate(tiles):
+                if (t in completed):
+                    continue
                 
-            # find the lowest positive t0 value. this value corresponds with the closest intersection.
-            # first set all negative t0 values as +infinity so that the lowest non-negative t0 may be easily found.
-            """
-            
-            """ Calculate Closest Intersection """
-            """
-            for i, element in enumerate(t0_array):
-                if element < 0 or np.isnan(element):
-                    t0_array[i] = np.inf # setting negative values to +infinity so that they cannot be considered in closest intersection
-            
-            # if there are no positive t0 values (excluding +inf), there is no intersection
-            if (np.all(t0_array == np.inf)):
-                color_array[r] = background_color
-                continue
-            
-            # calculate index of t0 corresponding with closest intersected mass
-            index = np.argmin(t0_array)
-            
-            # store intersection point and t0
-            intersection_point = intersection_array[index]
-            t0 = t0_array[index]
-            
-            # the intersected mass
-            mass = scene.masses[index]
-            
-            # the position and direction of the ray that intersected the mass
-            ray_position = ray_positions[index]
-            ray_direction = ray_directions[index]
-            """
-            
-            """ lighting """
-            """
-            # simple color finding algorithm. change later
-            
-            #sphere_theta = np.arccos((surface_coordinate)[2] / radius)
-            #sphere_phi = np.arctan((surface_coordinate)[1], (surface_coordinate)[0])
-            
-            # the position of the intersection in the mass' coordinates (same coordinates but translated so that the origin is th ecenter of the mass)
-            surface_coordinate = intersection_point - mass.position
-            surface_normal = surface_coordinate / np.linalg.norm(surface_coordinate)
-            
-            #what is actually going on here? how is the ray direction not equivelent to intersection_point - camera_position?
-            direction_from_camera = intersection_point - self.position; direction_from_camera /= np.linalg.norm(direction_from_camera)
-            #direction_from_camera = ray_direction - ray_position; direction_from_camera /= np.linalg.norm(direction_from_camera)
-            #direction_from_camera = ray_position - self.position
-            
-            #vp.arrow(pos = vec3(ray_position), axis = vec3(direction_from_camera), color = vp.color.orange)
-            
-            lighting_coefficient = abs(np.dot(direction_from_camera, -surface_normal)) # surface normal lighting, flip surface normal so it points out of the surface.
+                """ Pause and Cancel """
+                if (control is not None and not control.wait(on_pause = checkpoint)):
+                    checkpoint()
+                    raise CaptureCancelled("The capture of {0} was cancelled with {1} of {2} tiles finished. Capture it again to resume.".format(file_path, len(completed), len(tiles)))
+                
+                """ Progress Bar """
+                if (progress is None):
+                    print("{:.2f}".format(len(completed)/len(tiles)*100), "%")
+                else:
+                    progress(len(completed)/len(tiles))
+                
+                tile_pixels, tile_aovs = self.capture_tile(tile, scene, masses, aovs, step_size)
+                
+                # write the finished tile to the files
+                pixels[tile[1]:tile[3], tile[0]:tile[2]] = tile_pixels
+                pixels.flush()
+                for name, memmap in aov_memmaps.items():
+                    memmap[tile[1]:tile[3], tile[0]:tile[2]] = tile_aovs[name]
+                    memmap.flush()
+                completed.add(t)
+                
+                if (monotonic() - last_checkpoint >= checkpoint_interval):
+                    checkpoint()
+                    last_checkpoint = monotonic()
+        except (KeyboardInterrupt, SystemExit):
+            # keep the finished tiles of an interrupted capture
+            checkpoint()
+            raise
+        
+        if (progress is None):
+            print("{:.2f}".format(100), "%")
+        else:
+            progress(1.0)
+        
+        del pixels
+        aov_memmaps.clear()
+        remove_checkpoint(file_path)
+        print("Saved Image Successfully")
+        
+        return file_path
+        
+    
+    # public
+    def capture_stream(self, tile_size, progress = None, aovs = None, control = None, scene = None, step_size = None, soi_factor = None):
+        """ traces the scene (see capture) one tile at a time and yields (tile, pixels, aov_arrays) for every finished tile, without writing any file.
+        tile is [x_start, y_start, x_end, y_end], pixels is the tile's [height, width, 3] uint8 array and aov_arrays is a dictionary of
+        channel name => [height, width(, 3)] array (empty without aovs). a tile is only traced when the next one is requested, so a consumer
+        that stops iterating stops the capture. a control (see checkpoint.CaptureControl) pauses or cancels it between tiles.
+        step_size and soi_factor replace the integrator's step size and the scene's soi factor (see capture). """
+        scene = self.capture_scene(scene)
+        
+        # per-mass constants are shared by every tile
+        masses = self.capture_masses(scene, soi_factor)
+        tiles = list(self.tiles(tile_size))
+        
+        """ For Every Tile """
+        for t, tile in enumerate(tiles):
+            """ Pause and Cancel """
+            if (control is not None and not control.wait()):
+                # imported here so that captures without a control don't pay for the checkpoint modules
+                from checkpoint import CaptureCancelled
+                raise CaptureCancelled("The capture was cancelled with {0} of {1} tiles finished.".format(t, len(tiles)))
             
-            sphere_theta = arccos((surface_coordinate)[1] / mass.radius)
-            if ((surface_coordinate[0] == 0) or (surface_coordinate[2] == 0)): 
-                # for the exact poles, the checkered color pattern is problematic.
-                # what color should the exact center of the pole have?
-                # this reflects in the arctan to find phi.
-                # what is phi when there is only a vertical component? at the poles it could be any angle.
-                # just set angle to zero to prevent nan issues in the arctan function.
-                sphere_phi = 0
+            """ Progress Bar """
+            if (progress is None):
+                print("{:.2f}".format(t/len(tiles)*100), "%")
             else:
-                sphere_phi = arctan((surface_coordinate)[2], (surface_coordinate)[0])
-            
-            texture_angle = 2*np.pi / mass.checkered_subdivision
+                progress(t/len(tiles))
             
-            theta_condition = (int(sphere_theta / texture_angle) % 2 == 0)
-            phi_condition = (int(sphere_phi / texture_angle) % 2 == 0)
-            
-            if (theta_condition ^ phi_condition):
-                color = np.array(lighting_coefficient * mass.color1, dtype = np.int64)
+            tile_pixels, tile_aovs = self.capture_tile(tile, scene, masses, aovs, step_size)
+            yield tile, tile_pixels, tile_aovs
+        
+        if (progress is None):
+            print("{:.2f}".format(100), "%")
+        else:
+            progress(1.0)
+    
+    def capture_frames(self, times, file_name = None, progress = None, scene = None):
+        """ captures one frame for every time in times and returns the paths of the frame files (binary ppm, named file_name_0000, file_name_0001, ...).
+        the rays are generated once and every frame traces them again with a shifted time, so an animation of a
+        gravitational wave only pays for the tracing. progress is called with the finished fraction of the frames. """
+        if (self.gravitational_wave is None):
+            raise Exception("Frames of different times only differ with a gravitational_wave. Use capture for a still image.")
+        
+        scene = self.capture_scene(scene)
+        
+        if (file_name is None):
+            file_name = datetime.now().strftime("%d-%m-%Y_%H-%M-%S-%f")
+        
+        # the rays and per-mass constants are shared by every frame
+        float_type, color_type = precisions[self.precision]
+        masses = mass_arrays(scene, float_type)
+        ray_positions, ray_directions = self.initialize_rays()
+        color_array = np.zeros([ray_positions.shape[0], 3], dtype = color_type)
+        
+        file_paths = []
+        
+        """ For Every Frame """
+        for f, time in enumerate(times):
+            """ Progress Bar """
+            if (progress is None):
+                print("{:.2f}".format(f/len(times)*100), "%")
             else:
-                color = np.array(lighting_coefficient * mass.color2, dtype = np.int64)
+                progress(f/len(times))
+            
+            self.trace(ray_positions, ray_directions, scene, color_array, masses = masses, show_progress = False, time = time)
             
-            # store color corresponding to ray
-            color_array[r] = color
-            """
+            file_path, pixels = create_ppm_memmap(self.resolution[0], self.resolution[1], "{0}_{1:04d}".format(file_name, f))
+            pixels[:] = color_array.reshape([self.resolution[1], self.resolution[0], 3])
+            pixels.flush()
+            del pixels
             
-        # progress percentage
-        print("{:.2f}".format(100), "%")
+            file_paths.append(file_path)
         
-        # save color data to image file
-        image = Image(self.resolution[0], self.resolution[1], color_array)
-        image.save(file_type = 'ppm')
-        
\ No newline at end of file
+        if (progress is None):
+            print("{:.2f}".format(100), "%")
+        else:
+            progress(1.0)
+        
+        print("Saved {0} Frames Successfully".format(len(file_paths)))
+        
+        return file_paths
\ No newline at end of file
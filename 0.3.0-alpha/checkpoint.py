@@ -0,0 +1,125 @@
+# Handles checkpoints, pausing and cancelling of tiled captures
+
+# a tiled capture writes every finished tile straight into its memory mapped image file (see Camera.capture_tiles).
+# the checkpoint is a sidecar file next to the image (Images/name.ppm => Images/name.ppm.checkpoint) that lists the
+# tiles whose pixels are on disk, together with a fingerprint of the capture parameters. capturing again with the
+# same file name and the same parameters continues from the checkpoint instead of starting over. a capture whose file name
+# was taken was written to Images/name(i).ppm (see image.image_file_path), so every Images/name(i).ppm is looked at (see find_checkpoint).
+#
+# the image file is flushed before the checkpoint is written, and the checkpoint is replaced atomically, so an
+# interrupted capture never lists a tile that is not on disk. the checkpoint is removed once the image is finished.
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+import numpy as np
+
+class CaptureCancelled(Exception):
+    """ raised by a capture that was cancelled through its CaptureControl. the finished tiles are kept in the checkpoint. """
+
+class CaptureControl():
+    """
+    Lets another thread pause, resume or cancel a running tiled capture. the capture checks it between tiles.
+
+    methods:
+    + pause()
+    + resume()
+    + cancel()
+    + is_paused() => bool
+    + is_cancelled() => bool
+    - wait(on_pause : function) => bool, blocks while paused and returns False if the capture was cancelled
+    """
+
+    def __init__(self):
+        self._running = threading.Event()
+        self._running.set()
+        self._cancelled = threading.Event()
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def cancel(self):
+        # a paused capture is woken up so that it can stop
+        self._cancelled.set()
+        self._running.set()
+
+    def is_paused(self):
+        return not self._running.is_set()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def wait(self, on_pause = None):
+        """ blocks while the capture is paused. on_pause is called once before blocking. returns False if the capture was cancelled. """
+        if (self.is_paused() and not self.is_cancelled()):
+            if (on_pause is not None):
+                on_pause()
+            self._running.wait()
+        return not self.is_cancelled()
+
+def capture_fingerprint(camera, scene, tile_size, aovs = None, step_size = None, soi_factor = None):
+    """ returns a hash of everything that changes the pixels of a tiled capture """
+    parameters = {
+        'camera' : [camera.position, camera.target, camera.up, camera.resolution, camera.fov, camera.projection, camera.precision, camera.integrator, camera.gravitational_wave, camera.time, camera.weak_field_tolerance],
+        'masses' : [[mass.position, mass.radius, mass.mass, mass.color, mass.texture, mass.checkered_subdivision] for mass in scene.masses],
+        'superposed' : scene.superposed,
+        'soi_factor' : scene.soi_factor if soi_factor is None else soi_factor,
+        'step_size' : step_size,
+        'metric' : scene.metric.parameters(),
+        'tile_size' : tile_size,
+        'aovs' : aovs,
+    }
+    text = json.dumps(parameters, sort_keys = True, default = lambda value: np.asarray(value).tolist())
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def checkpoint_path(image_file_path):
+    """ returns the path of the checkpoint of an image file """
+    return image_file_path + ".checkpoint"
+
+def load_checkpoint(image_file_path, fingerprint):
+    """ returns the set of finished tile indices of the image file's checkpoint, or None if there is no checkpoint of a capture with the fingerprint """
+    if not (os.path.exists(image_file_path) and os.path.exists(checkpoint_path(image_file_path))):
+        return None
+
+    try:
+        with open(checkpoint_path(image_file_path), "r") as file:
+            checkpoint = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    if (checkpoint.get('fingerprint') != fingerprint):
+        return None
+    return set(checkpoint['completed'])
+
+def find_checkpoint(file_name, fingerprint):
+    """ returns the path of the image file of the name (Images/file_name.ppm, or a renamed Images/file_name(i).ppm) whose checkpoint is
+    of a capture with the fingerprint and the set of its finished tile indices, or (None, None) if there is none """
+    # the names are taken in order (see image.image_file_path), so the search ends at the first name without a file
+    i = 0
+    file_path = os.path.join("Images", "{0}.ppm".format(file_name))
+    while (os.path.exists(file_path)):
+        completed = load_checkpoint(file_path, fingerprint)
+        if (completed is not None):
+            return file_path, completed
+        i += 1
+        file_path = os.path.join("Images", "{0}({1}).ppm".format(file_name, i))
+
+    return None, None
+
+def save_checkpoint(image_file_path, fingerprint, completed):
+    """ writes the finished tile indices to the image file's checkpoint, replacing the old checkpoint in one step """
+    temporary_path = checkpoint_path(image_file_path) + ".tmp"
+    with open(temporary_path, "w") as file:
+        json.dump({'fingerprint' : fingerprint, 'completed' : sorted(completed), 'time' : time.time()}, file)
+    os.replace(temporary_path, checkpoint_path(image_file_path))
+
+def remove_checkpoint(image_file_path):
+    """ removes the checkpoint of a finished image file """
+    if (os.path.exists(checkpoint_path(image_file_path))):
+        os.remove(checkpoint_path(image_file_path))
\ No newline at end of file
@@ -3,5 +3,30 @@
 import numpy as np
 
 background_color = np.array([255/2, 0, 255/2], dtype = np.int64)
-soi_factor = 5.0
-dt = 0.75
\ No newline at end of file
+soi_factor = 5.0 # default soi radius of the masses in schwarzschild radii (see Scene). rays only pass through sois in closed form in scenes with a much larger one.
+dt = 0.75
+symplectic_dt = 1.0 # step size of the leapfrog and yoshida integrators. a step moves a ray about n*symplectic_dt.
+event_iterations = 4 # root finding iterations that locate a mass or soi boundary crossing within a step
+max_iterations = 100000 # limit on batched tracing steps. rays still active after this many steps are trapped.
+weak_field_tolerance = 1e-4 # largest direction error [radians] of rays passing through an soi in closed form instead of being integrated. None integrates every ray.
+weak_field_max_ratio = 0.1 # rays with rs/L above this are always integrated
+min_bin_rays = 4096 # sois with fewer active rays are stepped together in one bin instead of one bin per mass (see tracer.py)
+culling_tile_size = 32 # pixel tiles of whole image captures that no mass or soi projects onto are filled with the background without tracing
+checkpoint_interval = 30.0 # seconds between checkpoints of the finished tiles of a tiled capture (see checkpoint.py)
+multiview_batch_rays = 1048576 # cameras of a multi-view capture are traced together until a batch holds this many rays (see multiview.py)
+trajectory_decimation = 8 # recorded photon paths keep every this many tracer iterations (see trajectories.py)
+
+# superposed scenes (see superposed.py)
+superposed_step_factor = 0.1 # a step moves a ray about this fraction of its distance to the closest mass surface
+superposed_min_step = 0.01 # shortest step, taken close to mass surfaces
+superposed_deflection_tolerance = 1e-3 # rays leave a superposed scene where the deflection still ahead of them is below this [radians]
+
+# gravitational wave renders (see gravitational_wave.py)
+gravitational_wave_dt = 0.5 # longest step of gravitational wave tracing
+gravitational_wave_steps_per_wavelength = 16 # shorter steps are taken for short wavelengths
+
+# render precisions: ray state dtype, color buffer dtype
+precisions = {
+    'double' : (np.float64, np.int64),
+    'single' : (np.float32, np.uint8),
+}
\ No newline at end of file
@@ -0,0 +1,234 @@
+# Measures the accuracy and cost of the integrator settings
+
+# python convergence.py [scene files] [--integrators euler leapfrog yoshida] [--steps ...] [--soi-factors ...]
+#                       [--resolution 135 90] [--max-pixel-error 0.001] [--max-deflection-error 1e-4] [--csv file] [--plot file]
+#
+# every scene is rendered at a ladder of step sizes, soi factors and integrators and compared against a
+# high accuracy reference trace (yoshida with a small step and the largest soi factor, every ray integrated):
+# - pixel error: the fraction of pixels whose color differs from the reference
+# - deflection error: the angle between the escape directions of rays that escape in both renders. rays grazing the
+#   photon sphere amplify any error, so the 99th percentile is used for the targets and the maximum is only reported.
+# - conservation drift: the relative change of the angular momentum L = n |x cross p| / |p| of probe rays
+#   integrated through the soi of each mass with the step function alone (L is conserved by the exact rays)
+# - cost: the render time and the total number of tracing steps
+# the cheapest setting that meets the error targets is printed, and cost can be plotted against error.
+
+import sys
+import csv
+import argparse
+import importlib.util
+from time import perf_counter
+
+import numpy as np
+
+import description
+from tracer import MassArrays, integrators, trace_rays
+from metrics import schwarzschild
+from constants import precisions, dt, symplectic_dt
+from aovs import create_aovs
+
+# default ladders. the step sizes are multiples of the default step of the integrator.
+step_multiples = [2.0, 1.0, 0.5, 0.25]
+soi_factors = [3.0, 5.0, 10.0, 20.0]
+
+# reference trace
+reference_integrator = 'yoshida'
+reference_step_size = 0.05
+
+# probe rays per mass for the conservation drift, and their step limit
+probe_ray_count = 32
+probe_max_steps = 100000
+
+def default_step_sizes(integrator):
+    """ returns the default step size ladder of an integrator """
+    default_step = dt if integrator == 'euler' else symplectic_dt
+    return [default_step*multiple for multiple in step_multiples]
+
+def render_setting(camera, scene, integrator, step_size, factor, weak_field_tolerance):
+    """ traces the camera's rays through the scene with the integrator, step size and soi factor without saving an image.
+    returns the colors, the escape directions (nan for rays that hit a mass), the total number of steps and the time it took [seconds]. """
+    float_type, color_type = precisions[camera.precision]
+    ray_positions, ray_directions = camera.initialize_rays()
+    color_array = np.zeros([ray_positions.shape[0], 3], dtype = color_type)
+    aovs = create_aovs(['escape_direction', 'steps'], ray_positions.shape[0])
+    masses = MassArrays(scene, float_type, factor)
+
+    # the setting is passed to the tracer, so neither the camera nor the integrators of other captures are changed
+    start_time = perf_counter()
+    trace_rays(ray_positions, ray_directions, scene, color_array, masses = masses, show_progress = False, integrator = integrator, gravitational_wave = camera.gravitational_wave, time = camera.time, weak_field_tolerance = weak_field_tolerance, aovs = aovs, step_size = step_size)
+    seconds = perf_counter() - start_time
+
+    return color_array, aovs['escape_direction'].astype(np.float64), int(np.sum(aovs['steps'], dtype = np.int64)), seconds
+
+def conservation_drift(integrator, step_size, rs, radius, soi_radius, metric = schwarzschild):
+    """ integrates probe rays through the soi of a mass at the origin with the integrator's step function in the metric and returns the largest relative drift of their angular momentum """
+    integrate = integrators[integrator][0]
+    origin = np.zeros(3)
+
+    # rays along +x with impact parameters between the mass surface and the soi boundary, starting on the boundary
+    impact_parameters = np.linspace(radius, soi_radius, probe_ray_count + 2)[1:-1]
+    positions = np.stack([-np.sqrt(soi_radius**2 - impact_parameters**2), impact_parameters, np.zeros(probe_ray_count)], axis = 1)
+    directions = np.tile([1.0, 0.0, 0.0], [probe_ray_count, 1])
+    if (integrator != 'euler'):
+        # the symplectic integrators evolve the photon momentum (|p| = n)
+        directions = directions*metric.refractive_index(positions, origin, rs)[:, np.newaxis]
+
+    def angular_momenta(positions, directions):
+        return metric.refractive_index(positions, origin, rs)*np.linalg.norm(np.cross(positions, directions), axis = 1) / np.linalg.norm(directions, axis = 1)
+
+    initial = angular_momenta(positions, directions)
+    final = initial.copy()
+    active = np.arange(probe_ray_count)
+
+    for step in range(probe_max_steps):
+        if (active.shape[0] == 0):
+            break
+        dx, dp = integrate(positions[active], directions[active], origin, rs, step_size, metric)
+        positions[active] += dx
+        directions[active] += dp
+        if (integrator == 'euler'):
+            directions[active] /= np.linalg.norm(directions[active], axis = 1)[:, np.newaxis]
+
+        # rays stop when they leave the soi or reach the mass
+        r = np.linalg.norm(positions[active], axis = 1)
+        is_done = (r >= soi_radius) | (r <= radius)
+        final[active[is_done]] = angular_momenta(positions[active[is_done]], directions[active[is_done]])
+        active = active[~is_done]
+
+    return np.max(np.abs(final - initial) / initial)
+
+def scene_drift(scene, integrator, step_size, factor):
+    """ returns the largest conservation drift of the integrator over the gravitating masses of the scene (0 if there are none) """
+    drifts = [conservation_drift(integrator, step_size, mass.rs, mass.radius, scene.metric.soi_radius(mass.rs, factor), scene.metric) for mass in scene.masses if mass.rs > 0 and scene.metric.soi_radius(mass.rs, factor) > mass.radius]
+    return max(drifts, default = 0.0)
+
+def compare(colors, escape_directions, reference_colors, reference_escape_directions):
+    """ returns the pixel error and the largest and 99th percentile deflection errors [radians] against the reference """
+    pixel_error = np.mean(np.any(colors.astype(np.int64) != reference_colors.astype(np.int64), axis = 1))
+
+    is_escaping = ~np.isnan(escape_directions[:, 0]) & ~np.isnan(reference_escape_directions[:, 0])
+    cosines = np.sum(escape_directions[is_escaping]*reference_escape_directions[is_escaping], axis = 1)
+    angles = np.arccos(np.clip(cosines, -1, 1))
+
+    if (angles.shape[0] == 0):
+        return pixel_error, 0.0, 0.0
+    return pixel_error, angles.max(), np.percentile(angles, 99)
+
+def convergence_report(scene_descriptions, integrator_names = None, step_sizes = None, factors = None, resolution = None):
+    """ renders every scene description at every setting and returns a list of result dictionaries, one per scene and setting """
+    integrator_names = list(integrators) if integrator_names is None else integrator_names
+    factors = soi_factors if factors is None else factors
+
+    results = []
+    for s, scene_description in enumerate(scene_descriptions):
+        scene_description = dict(scene_description)
+        if (resolution is not None):
+            scene_description['camera'] = dict(scene_description['camera'], resolution = resolution)
+        scene = description.build_scene(scene_description)
+        camera = description.build_camera(scene_description, scene)
+
+        # the reference uses the largest soi factor that the scene allows
+        reference_factor = max([factor for factor in factors if not scene.sois_overlap(factor)], default = scene.soi_factor)
+        print("scene {0}: reference trace ({1}, step {2}, soi factor {3})".format(s, reference_integrator, reference_step_size, reference_factor))
+        reference_colors, reference_escape_directions, reference_steps, reference_seconds = render_setting(camera, scene, reference_integrator, reference_step_size, reference_factor, None)
+
+        print("integrator   step     soi factor   pixel error   deflection error (99%, max)   conservation drift   steps        seconds")
+        for integrator in integrator_names:
+            for step_size in (default_step_sizes(integrator) if step_sizes is None else step_sizes):
+                for factor in factors:
+                    if (scene.sois_overlap(factor)):
+                        print("{0:<12} {1:<8.4g} {2:<12.4g} skipped, the sois overlap".format(integrator, step_size, factor))
+                        continue
+
+                    colors, escape_directions, steps, seconds = render_setting(camera, scene, integrator, step_size, factor, camera.weak_field_tolerance)
+                    pixel_error, max_deflection_error, deflection_error = compare(colors, escape_directions, reference_colors, reference_escape_directions)
+                    drift = scene_drift(scene, integrator, step_size, factor)
+
+                    results.append({'scene' : s, 'integrator' : integrator, 'step_size' : step_size, 'soi_factor' : factor, 'pixel_error' : pixel_error,
+                                    'deflection_error' : deflection_error, 'max_deflection_error' : max_deflection_error,
+                                    'conservation_drift' : drift, 'steps' : steps, 'seconds' : seconds})
+                    print("{0:<12} {1:<8.4g} {2:<12.4g} {3:<13.3e} {4:.3e}, {5:<18.3e} {6:<20.3e} {7:<12d} {8:.3f}".format(integrator, step_size, factor, pixel_error, deflection_error, max_deflection_error, drift, steps, seconds))
+
+    return results
+
+def cheapest_settings(results, max_pixel_error, max_deflection_error):
+    """ returns the (integrator, step size, soi factor) with the lowest total time that meets the pixel and (99th percentile) deflection error targets in every scene, or None """
+    settings = {}
+    for result in results:
+        key = (result['integrator'], result['step_size'], result['soi_factor'])
+        settings.setdefault(key, []).append(result)
+
+    scene_count = len(set(result['scene'] for result in results))
+    passing = [(sum(result['seconds'] for result in setting_results), key) for key, setting_results in settings.items()
+               if len(setting_results) == scene_count and all(result['pixel_error'] <= max_pixel_error and result['deflection_error'] <= max_deflection_error for result in setting_results)]
+
+    return min(passing)[1] if len(passing) > 0 else None
+
+def save_csv(results, file_path):
+    """ writes the results to a csv file """
+    with open(file_path, "w", newline = "") as file:
+        writer = csv.DictWriter(file, fieldnames = list(results[0]))
+        writer.writeheader()
+        writer.writerows(results)
+
+def plot_results(results, file_path):
+    """ plots the cost against the pixel and deflection errors of every integrator and saves the figure """
+    # imported here so that the harness runs without matplotlib
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    figure, axes = plt.subplots(1, 2, figsize = (12, 5))
+    for integrator in sorted(set(result['integrator'] for result in results)):
+        integrator_results = [result for result in results if result['integrator'] == integrator]
+        seconds = [result['seconds'] for result in integrator_results]
+        axes[0].scatter(seconds, [max(result['pixel_error'], 1e-6) for result in integrator_results], label = integrator)
+        axes[1].scatter(seconds, [max(result['deflection_error'], 1e-12) for result in integrator_results], label = integrator)
+
+    for axis, error in zip(axes, ["pixel error", "99th percentile deflection error [radians]"]):
+        axis.set_xscale("log")
+        axis.set_yscale("log")
+        axis.set_xlabel("render time [seconds]")
+        axis.set_ylabel(error)
+        axis.legend()
+
+    figure.tight_layout()
+    figure.savefig(file_path)
+    print("Saved plot to {0}".format(file_path))
+
+def main(arguments = None):
+    parser = argparse.ArgumentParser(description = "Measures the accuracy and cost of integrator settings against a reference trace.")
+    parser.add_argument("scene_files", nargs = "*", default = ["scenes/main.json"], help = "scene files (.json or .toml)")
+    parser.add_argument("--integrators", nargs = "+", default = None, choices = list(integrators), help = "integrators to compare")
+    parser.add_argument("--steps", nargs = "+", type = float, default = None, help = "step sizes (default: multiples of each integrator's default step)")
+    parser.add_argument("--soi-factors", nargs = "+", type = float, default = None, help = "soi factors")
+    parser.add_argument("--resolution", nargs = 2, type = int, default = None, help = "render resolution instead of the scene's")
+    parser.add_argument("--max-pixel-error", type = float, default = 1e-3, help = "pixel error target")
+    parser.add_argument("--max-deflection-error", type = float, default = 1e-4, help = "99th percentile deflection error target [radians]")
+    parser.add_argument("--csv", default = None, help = "file to write the results to")
+    parser.add_argument("--plot", default = None, help = "image file to plot cost against error to (needs matplotlib)")
+    arguments = parser.parse_args(arguments)
+
+    # fail before the renders rather than after them
+    if (arguments.plot is not None and importlib.util.find_spec("matplotlib") is None):
+        raise Exception("Plotting needs matplotlib. Install it or leave out --plot.")
+
+    scene_descriptions = [description.load_description(file_path) for file_path in arguments.scene_files]
+    results = convergence_report(scene_descriptions, arguments.integrators, arguments.steps, arguments.soi_factors, arguments.resolution)
+
+    if (arguments.csv is not None):
+        save_csv(results, arguments.csv)
+    if (arguments.plot is not None):
+        plot_results(results, arguments.plot)
+
+    cheapest = cheapest_settings(results, arguments.max_pixel_error, arguments.max_deflection_error)
+    if (cheapest is None):
+        print("No setting meets a pixel error of {0} and a deflection error of {1} radians.".format(arguments.max_pixel_error, arguments.max_deflection_error))
+    else:
+        print("Cheapest setting within the targets: integrator {0}, step {1}, soi factor {2}".format(*cheapest))
+        print("Render with it by giving the camera integrator = '{0}' and capturing with step_size = {1}, soi_factor = {2} (or \"step_size\" and \"soi_factor\" in a scene file).".format(*cheapest))
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
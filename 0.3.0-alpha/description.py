@@ -0,0 +1,132 @@
+# Builds scenes and cameras from plain descriptions and scene files
+
+# a description is a dictionary (for example decoded from JSON) of the keyword arguments of Camera and Mass:
+# {
+#     "camera" : {"position" : [0, 0, 10], "target" : [0, 0, -1], "up" : [0, 1, 0], "resolution" : [270, 180], "fov" : 90.0},
+#     "masses" : [{"position" : [0, 0, 0], "radius" : 2, "mass" : 0.5, "color" : [50, 225, 225], "texture" : "checkered", "checkered_subdivision" : 12}],
+#     "tile_size" : 64,
+#     "file_name" : "my_render",
+#     "superposed" : false,
+#     "soi_factor" : 5.0,
+#     "step_size" : 1.0,
+#     "metric" : {"name" : "reissner_nordstrom", "charge_ratio" : 0.5},
+#     "aovs" : ["mass_id", "deflection"]
+# }
+# scene files hold one description as JSON (.json) or TOML (.toml). "tile_size", "file_name", "superposed", "soi_factor", "step_size", "metric" and "aovs" are optional.
+# "aovs" lists auxiliary channels that are saved next to the image (see aovs.py).
+# superposed scenes allow masses with overlapping spheres of influence (see superposed.py).
+# "soi_factor" sets the soi radius of the masses in schwarzschild radii (see Scene). it is soi_factor of constants.py by default.
+# "step_size" replaces the step size of the camera's integrator (see Camera.capture and convergence.py for the cheapest setting).
+# "metric" names the spacetime around the masses and its parameters (see metrics.py). it is Schwarzschild by default.
+# the camera may name a "projection": "pinhole" (default), "equirectangular" or "fisheye" (see Camera).
+#
+# example TOML scene file:
+#   [camera]
+#   position = [0, 0, 10]
+#   target = [0, 0, -1]
+#   up = [0, 1, 0]
+#   resolution = [270, 180]
+#   fov = 90.0
+#
+#   [[masses]]
+#   position = [0, 0, 0]
+#   radius = 2
+#   mass = 0.5
+#   color = [50, 225, 225]
+#   texture = "checkered"
+#   checkered_subdivision = 12
+
+import os
+import json
+import threading
+from collections import OrderedDict
+
+from scene import Scene
+from camera import Camera
+from mass import Mass
+from metrics import create_metric
+from constants import soi_factor
+
+description_keys = {'camera', 'masses', 'tile_size', 'file_name', 'superposed', 'soi_factor', 'step_size', 'metric', 'aovs'}
+camera_keys = {'position', 'target', 'up', 'resolution', 'fov', 'projection', 'precision', 'integrator', 'gravitational_wave', 'time', 'weak_field_tolerance'}
+mass_keys = {'position', 'radius', 'mass', 'color', 'texture', 'checkered_subdivision'}
+
+def check_keys(description, allowed_keys, required_keys, name):
+    """ raises an exception if the description has unknown keys or is missing required keys """
+    unknown_keys = set(description) - allowed_keys
+    if (len(unknown_keys) > 0):
+        raise Exception("Unknown {0} keys: {1}".format(name, ", ".join(sorted(unknown_keys))))
+    missing_keys = required_keys - set(description)
+    if (len(missing_keys) > 0):
+        raise Exception("Missing {0} keys: {1}".format(name, ", ".join(sorted(missing_keys))))
+
+def build_scene(description):
+    """ creates and returns a new (unbound) scene with the masses of the description. it is passed to build_camera. """
+    scene = Scene(superposed = bool(description.get('superposed', False)), metric = create_metric(**description.get('metric', {})), soi_factor = float(description.get('soi_factor', soi_factor)), bind = False)
+    for mass_description in description.get('masses', []):
+        check_keys(mass_description, mass_keys, mass_keys, "mass")
+        Mass(scene = scene, **mass_description)
+    return scene
+
+def build_camera(description, scene = None):
+    """ returns a new camera of the scene for the camera description """
+    camera_description = description['camera']
+    check_keys(camera_description, camera_keys, camera_keys - {'projection', 'precision', 'integrator', 'gravitational_wave', 'time', 'weak_field_tolerance'}, "camera")
+    return Camera(scene = scene, **camera_description)
+
+""" Scene Files """
+def load_description(file_path):
+    """ reads a JSON or TOML scene file and returns its description """
+    extension = os.path.splitext(file_path)[1].lower()
+    
+    if (extension == '.json'):
+        with open(file_path, "r") as file:
+            description = json.load(file)
+    elif (extension == '.toml'):
+        # tomllib is part of the standard library from python 3.11
+        import tomllib
+        with open(file_path, "rb") as file:
+            description = tomllib.load(file)
+    else:
+        raise Exception("Cannot load scene file '{0}'. Scene files must be .json or .toml files.".format(file_path))
+    
+    check_keys(description, description_keys, {'camera'}, "scene file")
+    
+    # images are named after their scene files by default
+    description.setdefault('file_name', os.path.splitext(os.path.basename(file_path))[0])
+    
+    return description
+
+""" Rendering """
+# scenes built in this process by their mass descriptions. scenes with the same masses (and mode)
+# reuse the Scene, Mass and per-mass arrays of the first render instead of building them again.
+# the scenes are passed to the captures explicitly, so renders in different threads don't share a binding.
+# batch and service worker processes live long, so only the scene_cache_size most recently used scenes are kept.
+scene_cache = OrderedDict()
+scene_cache_size = 16
+scene_cache_lock = threading.Lock()
+
+def cached_scene(description):
+    """ returns a scene for the masses of the description, built once per process while it is among the most recently used scenes """
+    scene_key = json.dumps([description.get('masses', []), bool(description.get('superposed', False)), float(description.get('soi_factor', soi_factor)), description.get('metric', {})], sort_keys = True)
+    with scene_cache_lock:
+        if (scene_key in scene_cache):
+            scene_cache.move_to_end(scene_key)
+            return scene_cache[scene_key]
+    
+    # scenes are built outside of the lock, so renders of other cached scenes don't wait for them
+    scene = build_scene(description)
+    with scene_cache_lock:
+        scene = scene_cache.setdefault(scene_key, scene)
+        scene_cache.move_to_end(scene_key)
+        while (len(scene_cache) > scene_cache_size):
+            scene_cache.popitem(last = False)
+    
+    return scene
+
+def render(description, progress = None):
+    """ renders a description and returns the path of the image file """
+    scene = cached_scene(description)
+    camera = build_camera(description, scene)
+    
+    return camera.capture(tile_size = description.get('tile_size'), file_name = description.get('file_name'), progress = progress, aovs = description.get('aovs'), step_size = description.get('step_size'))
\ No newline at end of file
@@ -0,0 +1,212 @@
+# Handles distributed captures over TCP
+
+# a coordinator splits the image into tiles and serves them to any number of worker processes.
+# every worker receives the camera and scene once when it connects and then traces tiles until the image is done.
+# tiles of workers that die or time out are put back in the queue for the other workers.
+
+# NOTE: messages are pickled. only run workers and coordinators on machines and networks you trust.
+
+import sys
+import time
+import queue
+import socket
+import struct
+import pickle
+import threading
+import subprocess
+
+import numpy as np
+
+from image import create_ppm_memmap
+from tracer import mass_arrays
+from constants import precisions
+
+""" Message Protocol """
+# every message is a pickled tuple prefixed by its length as an unsigned 64 bit big endian integer.
+# coordinator => worker: ('setup', camera, scene), ('tile', tile_index, tile), ('done',)
+# worker => coordinator: ('result', tile_index, color_array)
+
+def send_message(connection, message):
+    """ pickles a message and sends it over the connection """
+    data = pickle.dumps(message, protocol = pickle.HIGHEST_PROTOCOL)
+    connection.sendall(struct.pack("!Q", len(data)) + data)
+
+def receive_exactly(connection, byte_count):
+    """ receives exactly byte_count bytes from the connection. raises ConnectionError if the connection closes first. """
+    chunks = []
+    while (byte_count > 0):
+        chunk = connection.recv(min(byte_count, 1 << 20))
+        if (len(chunk) == 0):
+            raise ConnectionError("The connection was closed.")
+        chunks.append(chunk)
+        byte_count -= len(chunk)
+    return b"".join(chunks)
+
+def receive_message(connection):
+    """ receives and unpickles one message from the connection """
+    length = struct.unpack("!Q", receive_exactly(connection, 8))[0]
+    return pickle.loads(receive_exactly(connection, length))
+
+class Coordinator():
+    """
+    Serves the tiles of a capture to workers and assembles the finished tiles in a memory mapped image file.
+
+    members:
+    + camera : camera object
+    + scene : scene object
+    + tile_size : int
+    + timeout : double [seconds], the time a worker has to finish one tile
+    - tiles : list of [x_start, y_start, x_end, y_end]
+    - pending : queue of tile indices
+    - completed : set of tile indices
+
+    methods:
+    + run(host : string, port : int, file_name : string) => file_path : string
+    - serve_worker(connection : socket)
+    """
+
+    def __init__(self, camera, scene, tile_size, timeout = 300.0):
+        self.camera = camera
+        self.scene = scene
+        self.tile_size = tile_size
+        self.timeout = timeout
+
+        self.tiles = list(camera.tiles(tile_size))
+        self.pending = queue.Queue()
+        for t in range(len(self.tiles)):
+            self.pending.put(t)
+        self.completed = set()
+
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+        self._pixels = None
+
+    def run(self, host = "localhost", port = 5050, file_name = None):
+        """ serves tiles to every worker that connects until all tiles are finished. returns the path of the image file. """
+        file_path, self._pixels = create_ppm_memmap(self.camera.resolution[0], self.camera.resolution[1], file_name)
+
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((host, port))
+        server.listen()
+        # poll so that the loop notices when the image is finished
+        server.settimeout(0.5)
+
+        print("Coordinator listening on {0}:{1} with {2} tiles".format(host, port, len(self.tiles)))
+
+        threads = []
+        try:
+            while not self._finished.is_set():
+                try:
+                    connection, address = server.accept()
+                except socket.timeout:
+                    continue
+                thread = threading.Thread(target = self.serve_worker, args = (connection, address), daemon = True)
+                thread.start()
+                threads.append(thread)
+        finally:
+            server.close()
+
+        for thread in threads:
+            thread.join()
+
+        self._pixels.flush()
+        self._pixels = None
+        print("Saved Image Successfully")
+
+        return file_path
+
+    def serve_worker(self, connection, address):
+        """ sends the camera and scene to a worker once and then serves it tiles until the image is finished or the worker fails """
+        tile_index = None
+        try:
+            connection.settimeout(self.timeout)
+            send_message(connection, ('setup', self.camera, self.scene))
+
+            while not self._finished.is_set():
+                try:
+                    tile_index = self.pending.get(timeout = 0.1)
+                except queue.Empty:
+                    continue
+
+                send_message(connection, ('tile', tile_index, self.tiles[tile_index]))
+                message = receive_message(connection)
+
+                if (message[0] != 'result' or message[1] != tile_index):
+                    raise ConnectionError("Unexpected message from worker {0}".format(address))
+
+                self.store_tile(tile_index, message[2])
+                tile_index = None
+
+            send_message(connection, ('done',))
+        except (OSError, ConnectionError, pickle.UnpicklingError, EOFError) as error:
+            # the worker died, timed out or misbehaved. give its tile to another worker.
+            print("Lost worker {0}: {1}".format(address, error))
+            if (tile_index is not None):
+                self.pending.put(tile_index)
+        finally:
+            connection.close()
+
+    def store_tile(self, tile_index, color_array):
+        """ writes a finished tile to the image file """
+        tile = self.tiles[tile_index]
+        with self._lock:
+            if (tile_index in self.completed):
+                return
+            self._pixels[tile[1]:tile[3], tile[0]:tile[2]] = np.asarray(color_array).reshape([tile[3] - tile[1], tile[2] - tile[0], 3])
+            self.completed.add(tile_index)
+
+            """ Progress Bar """
+            print("{:.2f}".format(len(self.completed) / len(self.tiles)*100), "%")
+
+            if (len(self.completed) == len(self.tiles)):
+                self._finished.set()
+
+def run_worker(host = "localhost", port = 5050, connect_attempts = 50):
+    """ connects to a coordinator and traces the tiles it serves until the image is finished """
+    # the coordinator may not be listening yet
+    for attempt in range(connect_attempts):
+        try:
+            connection = socket.create_connection((host, port))
+            break
+        except ConnectionRefusedError:
+            if (attempt == connect_attempts - 1):
+                raise
+            time.sleep(0.1)
+
+    try:
+        message = receive_message(connection)
+        if (message[0] != 'setup'):
+            raise ConnectionError("Expected the camera and scene from the coordinator.")
+        camera, scene = message[1], message[2]
+
+        # scene dependent data is set up once for every tile
+        float_type, color_type = precisions[camera.precision]
+        masses = mass_arrays(scene, float_type)
+
+        while True:
+            message = receive_message(connection)
+            if (message[0] == 'done'):
+                break
+
+            tile_index, tile = message[1], message[2]
+            color_array = np.zeros([(tile[2] - tile[0])*(tile[3] - tile[1]), 3], dtype = color_type)
+            camera.trace_tile(tile, scene, color_array, masses)
+
+            send_message(connection, ('result', tile_index, color_array.astype(np.uint8)))
+    except ConnectionError:
+        # the coordinator finished or went away
+        pass
+    finally:
+        connection.close()
+
+def start_local_workers(worker_count, host = "localhost", port = 5050):
+    """ starts worker_count worker processes on this machine and returns them """
+    return [subprocess.Popen([sys.executable, __file__, "worker", host, str(port)]) for w in range(worker_count)]
+
+if __name__ == "__main__":
+    # python distributed.py worker host port
+    if (len(sys.argv) == 4 and sys.argv[1] == "worker"):
+        run_worker(sys.argv[2], int(sys.argv[3]))
+    else:
+        print("usage: python distributed.py worker host port")
\ No newline at end of file
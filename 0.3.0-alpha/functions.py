@@ -38,6 +38,34 @@ def surface_color(sphere, intersection_point):
 """
 
 
+# 4x4 transformation matrices
+# these follow the row vector convention of pyrr (vector @ matrix), so they may be used as drop in
+# replacements for pyrr.matrix44.create_from_translation, create_from_scale and create_look_at.
+def translation_matrix(translation):
+    """ returns the 4x4 matrix that translates a row vector by the vec3 translation """
+    matrix = np.identity(4)
+    matrix[3, 0:3] = translation
+    return matrix
+
+def scale_matrix(scale):
+    """ returns the 4x4 matrix that scales a row vector by the vec3 scale """
+    return np.diag([scale[0], scale[1], scale[2], 1.0])
+
+def look_at_matrix(eye, target, up):
+    """ returns the 4x4 view matrix of a camera at eye looking at target (OpenGL convention, as pyrr.matrix44.create_look_at) """
+    eye = np.asarray(eye, dtype = np.float64)
+    
+    forward = target - eye; forward = forward / np.linalg.norm(forward)
+    side = np.cross(forward, up); side = side / np.linalg.norm(side)
+    up = np.cross(side, forward); up = up / np.linalg.norm(up)
+    
+    return np.array([
+        [side[0], up[0], -forward[0], 0.0],
+        [side[1], up[1], -forward[1], 0.0],
+        [side[2], up[2], -forward[2], 0.0],
+        [-np.dot(side, eye), -np.dot(up, eye), np.dot(forward, eye), 1.0]
+    ])
+
 # trig functions
 def arctan(y, x):
     """ returns the true ccw angle from the x-axis """
@@ -93,6 +121,117 @@ def integrate_schwarzschild(ray_position, ray_direction, mass_position, schwarzs
     
     return dx, dp
 
+def integrate_schwarzschild_batch(ray_positions, ray_directions, mass_positions, schwarzschild_radii, dt):
+    """ Batched form of integrate_schwarzschild. Takes (N,3) ray positions, (N,3) ray directions, (N,3) mass positions, (N,) Schwarzschild radii and a timestep dt.
+    Returns the (N,3) infinitesimal changes in ray positions and directions. """
+    
+    # 3-positions, 3-momenta, Schwarzschild radii
+    x = ray_positions - mass_positions
+    p = ray_directions
+    rs = schwarzschild_radii
+    
+    # radial distances, 3-momenta squared
+    r = np.sqrt(np.sum(x*x, axis = 1))
+    p_squared = np.sum(p*p, axis = 1)
+    
+    # equations of motion coefficients (for conveniance)
+    A = (1+rs/(4*r))**(-6)*(1-rs/(4*r))**(2)
+    B = -1/(2*r**3)*( (1-rs/(4*r))**(2)*(1+rs/(4*r))**(-7)*p_squared + (1-rs/(4*r))**(-1)*(1+rs/(4*r))**(-1) )*rs
+    
+    # change in positions, momenta
+    dx = A[:, np.newaxis]*p*dt # dx/dt * dt
+    dp = B[:, np.newaxis]*x*dt # dp/dt * dt
+    
+    return dx, dp
+
+# symplectic integrators
+# in isotropic coordinates the Schwarzschild metric is ds^2 = -a(r) dt^2 + b(r) (dx^2 + dy^2 + dz^2) with
+# a = ((1 - rs/4r) / (1 + rs/4r))^2 and b = (1 + rs/4r)^4. multiplying the null geodesic Hamiltonian by b gives
+# the separable Hamiltonian H = |p|^2/2 - n(r)^2/2 = 0 with the refractive index n = sqrt(b/a) = (1 + rs/4r)^3 / (1 - rs/4r).
+# it traces the same rays (with a different parameter s) and has the form kinetic + potential, so leapfrog and
+# yoshida integrate it symplectically. p is the true photon 3-momentum (|p| = n) and needs no renormalization.
+def refractive_index(ray_positions, mass_positions, schwarzschild_radii):
+    """ returns the refractive index n of the Schwarzschild metric in isotropic coordinates at the (N,3) ray positions """
+    x = ray_positions - mass_positions
+    r = np.sqrt(np.sum(x*x, axis = 1))
+    u = schwarzschild_radii/(4*r)
+    return (1+u)**3/(1-u)
+
+def refractive_index_gradient(ray_positions, mass_positions, schwarzschild_radii):
+    """ returns the refractive index n and its (N,3) gradient dn/dr x/r at the (N,3) ray positions """
+    x = ray_positions - mass_positions
+    r = np.sqrt(np.sum(x*x, axis = 1))
+    u = schwarzschild_radii/(4*r)
+
+    n = (1+u)**3/(1-u)
+    dn_dr = -(u/r)*(1+u)**2*(4-2*u)/(1-u)**2
+
+    return n, (dn_dr/r)[:, np.newaxis]*x
+
+def schwarzschild_force(ray_positions, mass_positions, schwarzschild_radii):
+    """ returns dp/ds = grad(n^2/2) = n dn/dr x/r at the (N,3) ray positions """
+    n, gradient = refractive_index_gradient(ray_positions, mass_positions, schwarzschild_radii)
+
+    return n[:, np.newaxis]*gradient
+
+def integrate_leapfrog_batch(ray_positions, ray_momenta, mass_positions, schwarzschild_radii, dt, force = schwarzschild_force):
+    """ Takes (N,3) ray positions, (N,3) ray momenta, (N,3) mass positions, (N,) Schwarzschild radii and a step dt.
+    Returns the (N,3) changes in ray position and momentum of one kick-drift-kick leapfrog step (2nd order, symplectic).
+    force is dp/ds of the metric (see metrics.py). """
+    p = ray_momenta + dt/2*force(ray_positions, mass_positions, schwarzschild_radii)
+    x = ray_positions + dt*p
+    p = p + dt/2*force(x, mass_positions, schwarzschild_radii)
+    
+    return x - ray_positions, p - ray_momenta
+
+# yoshida coefficients
+yoshida_w1 = 1/(2 - 2**(1/3))
+yoshida_w0 = -2**(1/3)/(2 - 2**(1/3))
+yoshida_drifts = [yoshida_w1/2, (yoshida_w0 + yoshida_w1)/2, (yoshida_w0 + yoshida_w1)/2, yoshida_w1/2]
+yoshida_kicks = [yoshida_w1, yoshida_w0, yoshida_w1]
+
+def integrate_yoshida_batch(ray_positions, ray_momenta, mass_positions, schwarzschild_radii, dt, force = schwarzschild_force):
+    """ Takes (N,3) ray positions, (N,3) ray momenta, (N,3) mass positions, (N,) Schwarzschild radii and a step dt.
+    Returns the (N,3) changes in ray position and momentum of one 4th order yoshida step (symplectic).
+    force is dp/ds of the metric (see metrics.py). """
+    x = ray_positions
+    p = ray_momenta
+    for i in range(3):
+        x = x + yoshida_drifts[i]*dt*p
+        p = p + yoshida_kicks[i]*dt*force(x, mass_positions, schwarzschild_radii)
+    x = x + yoshida_drifts[3]*dt*p
+    
+    return x - ray_positions, p - ray_momenta
+
+# weak-field sweep through an soi
+# a ray with angular momentum L = n r sin(psi) sweeps the angle dphi = 2 int L dw / sqrt(n^2 - L^2 w^2) (w = 1/r) between
+# entering and leaving a sphere of radius R around the mass. with n^2 = 1 + 2 rs w + 15/8 (rs w)^2 (the isotropic index to
+# second order) the integral has the closed form below, and the next term 9/8 (rs w)^3 is added to first order. for R -> inf
+# the deflection dphi - pi is the post-Newtonian series 2 rs/L + 15 pi/16 (rs/L)^2 + O((rs/L)^3).
+def weak_field_sweep(angular_momenta, schwarzschild_radii, soi_radii):
+    """ returns the angle swept by rays with the angular momenta L between entering and leaving the soi radii """
+    L = angular_momenta
+    rs = schwarzschild_radii
+    w = 1/soi_radii
+    q = np.sqrt(1 - (L*w)**2)
+    
+    A = L**2 - (15/8)*rs**2
+    quadratic_sweep = 2*L/np.sqrt(A)*(np.pi/2 - np.arcsin((A*w - rs)/np.sqrt(rs**2 + A)))
+    cubic_correction = (9/8)*rs**3*(w**2/(L*q) + 2*q/L**3)
+    
+    return quadratic_sweep + cubic_correction
+
+def weak_field_sweep_error(angular_momenta, schwarzschild_radii, soi_radii):
+    """ returns a bound of the error of weak_field_sweep. the coefficient was measured against a numerical quadrature of
+    the exact sweep for rs/L <= 0.1. rays that graze the soi (q -> 0) have larger errors. """
+    q_squared = np.maximum(1 - (angular_momenta/soi_radii)**2, np.finfo(np.float64).tiny)
+    return 10*(schwarzschild_radii/angular_momenta)**4*(1 + 1/q_squared)
+
+def weak_field_closest_approach(angular_momenta, schwarzschild_radii):
+    """ returns the closest approach of rays with the angular momenta L (the turning point of the quadratic index) """
+    A = angular_momenta**2 - (15/8)*schwarzschild_radii**2
+    return A/(schwarzschild_radii + np.sqrt(schwarzschild_radii**2 + A))
+
 # gravitational wave metric
 
 # plus mode function
@@ -154,6 +293,49 @@ def integrate_gravitational_wave(four_position, four_momentum, dt, a = 0.001, w
     four_momentum += np.array([dpt, 0, 0, dpz])
     
     return four_position, four_momentum
+
+# batched gravitational wave metric
+# plus polarized plane wave travelling in +z (TT gauge): ds^2 = -dt^2 + (1 + h) dx^2 + (1 - h) dy^2 + dz^2, h = fplus(t, z).
+# rays are (N,4) four-positions (t, x, y, z) and (N,4) covariant four-momenta (p_t, p_x, p_y, p_z) evolved with
+# dx^u/dl = g^uv p_v and dp_u/dl = -1/2 d_u g^ab p_a p_b. h does not depend on x or y, so p_x and p_y are conserved,
+# and h only depends on t - z, so p_t + p_z is conserved as well.
+def gravitational_wave_derivatives(four_positions, four_momenta, a, w):
+    """ returns the (N,4) derivatives of the four-positions and covariant four-momenta of rays in the plus polarized gravitational wave metric """
+    t = four_positions[:, 0]
+    z = four_positions[:, 3]
+    h = fplus(t, z, a, w)
+    dh_dt = dfplus_dt(t, z, a, w)
+    
+    pt = four_momenta[:, 0]
+    px = four_momenta[:, 1]
+    py = four_momenta[:, 2]
+    pz = four_momenta[:, 3]
+    
+    # inverse metric: g^tt = -1, g^xx = 1/(1 + h), g^yy = 1/(1 - h), g^zz = 1
+    dx_dl = np.stack([-pt, px/(1 + h), py/(1 - h), pz], axis = 1)
+    
+    # -1/2 d_u (g^xx px^2 + g^yy py^2) with d_t h = -d_z h
+    dp_dt = (1/2)*dh_dt*(px**2/(1 + h)**2 - py**2/(1 - h)**2)
+    dp_dl = np.stack([dp_dt, np.zeros_like(px), np.zeros_like(py), -dp_dt], axis = 1)
+    
+    return dx_dl, dp_dl
+
+def gravitational_wave_momenta(four_positions, ray_directions, a, w):
+    """ returns the (N,4) covariant four-momenta of rays at the four-positions that travel back in time along the (N,3) unit ray directions """
+    h = fplus(four_positions[:, 0], four_positions[:, 3], a, w)
+    
+    # spatial tangent k with g_ij k^i k^j = 1 and k^t = -1 (the ray is traced back from the camera), lowered with the metric
+    k = ray_directions / np.sqrt((1 + h)*ray_directions[:, 0]**2 + (1 - h)*ray_directions[:, 1]**2 + ray_directions[:, 2]**2)[:, np.newaxis]
+    
+    return np.stack([np.ones_like(h), (1 + h)*k[:, 0], (1 - h)*k[:, 1], k[:, 2]], axis = 1)
+
+def integrate_gravitational_wave_batch(four_positions, four_momenta, dt, a = 0.001, w = 0.001):
+    """ Takes (N,4) four-positions, (N,4) covariant four-momenta and a step dt.
+    Returns the (N,4) changes in four-position and four-momentum of one midpoint (2nd order) step. The inputs are not modified. """
+    dx_dl, dp_dl = gravitational_wave_derivatives(four_positions, four_momenta, a, w)
+    dx_dl, dp_dl = gravitational_wave_derivatives(four_positions + dt/2*dx_dl, four_momenta + dt/2*dp_dl, a, w)
+    
+    return dt*dx_dl, dt*dp_dl
     
 
 # simple color finding algorithm. change later
@@ -184,4 +366,37 @@ def calculate_mass_surface_color(intersection_point, mass):
     else:
         color = np.array(mass.color2, dtype = np.int64)
     
-    return color
\ No newline at end of file
+    return color
+
+def calculate_surface_angles(intersection_points, mass_positions, mass_radii):
+    """ takes (N,3) intersection points and the positions and radii of the intersected masses and returns the (N,) sphere angles theta (from the +y pole) and phi (around the y axis from +x towards +z, [0, 2 pi)) """
+    
+    # the positions of the intersections in the masses' coordinates
+    surface_coordinates = intersection_points - mass_positions
+    x = surface_coordinates[:, 0]
+    y = surface_coordinates[:, 1]
+    z = surface_coordinates[:, 2]
+    
+    sphere_theta = np.arccos(np.clip(y / mass_radii, -1, 1))
+    
+    # same quadrant handling as arctan(z, x). the poles (x == 0 or z == 0) get phi = 0 as in calculate_mass_surface_color
+    on_pole = (x == 0) | (z == 0)
+    safe_x = np.where(on_pole, 1, x)
+    sphere_phi = np.arctan(z / safe_x) + np.where(x < 0, np.pi, np.where(z < 0, 2*np.pi, 0))
+    sphere_phi = np.where(on_pole, 0, sphere_phi)
+    
+    return sphere_theta, sphere_phi
+
+def calculate_mass_surface_colors(intersection_points, mass_positions, mass_radii, checkered_subdivisions, colors1, colors2):
+    """ batched form of calculate_mass_surface_color. takes (N,3) intersection points and the per-ray properties of the intersected masses and returns (N,3) colors """
+    
+    sphere_theta, sphere_phi = calculate_surface_angles(intersection_points, mass_positions, mass_radii)
+    
+    texture_angle = 2*np.pi / checkered_subdivisions
+    
+    theta_condition = ((sphere_theta / texture_angle).astype(np.int64) % 2 == 0)
+    phi_condition = ((sphere_phi / texture_angle).astype(np.int64) % 2 == 0)
+    
+    colors = np.where((theta_condition ^ phi_condition)[:, np.newaxis], colors1, colors2)
+    
+    return colors
\ No newline at end of file
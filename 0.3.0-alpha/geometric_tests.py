@@ -50,4 +50,55 @@ def ray_sphere_intersection(ray_position, ray_direction, sphere_position, sphere
     
     #surface_coordinate = intersection_point - sphere_position # intersection point of sphere surface in object space (origin is the sphere center)
     
-    
\ No newline at end of file
+    
+def ray_sphere_intersection_distances(ray_positions, ray_directions, sphere_positions, sphere_radii):
+    """ batched form of ray_sphere_intersection. takes arrays of ray positions, ray directions, sphere positions and sphere radii that broadcast against each other (vec3 on the last axis) and returns t0 for every ray-sphere pair, or nan where there is no intersection """
+    # same algorithm and inside/outside cases as ray_sphere_intersection, evaluated for every pair at once
+    ray_to_sphere = sphere_positions - ray_positions # L
+    tca = np.sum(ray_to_sphere*ray_directions, axis = -1) # tca
+    
+    d_squared = np.sum(ray_to_sphere*ray_to_sphere, axis = -1) - tca**2 # d^2
+    radius_squared = sphere_radii**2
+    
+    # clamp so that the misses (masked out below) don't raise invalid value warnings
+    thc = np.sqrt(np.maximum(radius_squared - d_squared, 0))
+    
+    t0 = tca - thc
+    t1 = thc + tca
+    
+    # ray is outside the sphere => t0, ray is inside the sphere => t1
+    distances = np.where(t0 > 0, t0, t1)
+    
+    # no intersection, ray will not intersect the sphere surface
+    distances = np.where(d_squared > radius_squared, np.nan, distances)
+    
+    return distances
+
+def cone_sphere_overlaps(apex, cone_axes, cone_half_angles, sphere_positions, sphere_radii):
+    """ takes a cone apex (vec3), (T,3) unit cone axes, (T,) cone half angles [radians], (M,3) sphere positions and (M,) sphere radii and returns the (T,M) mask of cone-sphere pairs that overlap.
+    a sphere overlaps a cone if the angle between the cone axis and the sphere center is at most the half angle plus the sphere's angular radius, or if the apex is inside of the sphere. """
+    apex_to_sphere = sphere_positions - apex
+    distances = np.linalg.norm(apex_to_sphere, axis = -1)
+    is_inside = distances <= sphere_radii
+
+    # angle between every axis and sphere center, angular radius of every sphere seen from the apex
+    safe_distances = np.where(is_inside, 1, distances)
+    cosines = (cone_axes @ apex_to_sphere.T) / safe_distances
+    angles = np.arccos(np.clip(cosines, -1, 1))
+    angular_radii = np.arcsin(np.where(is_inside, 1, sphere_radii / safe_distances))
+
+    return is_inside | (angles <= cone_half_angles[:, np.newaxis] + angular_radii)
+
+def spherical_rectangle_half_angles(axis_latitudes, half_widths, latitude_lows, latitude_highs):
+    """ takes axis latitudes, longitude half-widths (at most pi) and latitude ranges [radians] of rectangles of longitude and latitude on the unit sphere and returns the largest angle
+    between every axis (on the center longitude of its rectangle) and the points of its rectangle, the half angle of the cone around the axis that contains the rectangle. """
+    # the farthest point is on an edge of the rectangle at the largest longitude difference. along that edge, the cosine of the angle to the axis
+    # is sin(axis latitude)*sin(latitude) + cos(axis latitude)*cos(half width)*cos(latitude), which is smallest at a corner or half a turn from its peak.
+    a = np.sin(axis_latitudes)
+    b = np.cos(axis_latitudes)*np.cos(half_widths)
+    peak_latitudes = np.arctan2(a, b)
+    far_latitudes = np.clip(peak_latitudes - np.pi*np.sign(peak_latitudes), latitude_lows, latitude_highs)
+    latitudes = np.stack(np.broadcast_arrays(latitude_lows, latitude_highs, far_latitudes))
+    cosines = a*np.sin(latitudes) + b*np.cos(latitudes)
+
+    return np.arccos(np.clip(np.min(cosines, axis = 0), -1, 1))
\ No newline at end of file
@@ -0,0 +1,119 @@
+# Handles batched ray tracing through a gravitational wave
+
+# a plus polarized gravitational plane wave (see functions.py) travels through the scene along +z. the masses are
+# opaque spheres in the flat background of the wave; their own curvature is left out in this mode.
+# rays are (N,4) four-positions and covariant four-momenta traced back in time from the camera, so the time at
+# which the rays leave the camera sets the phase of the wave they see. the frames of an animation reuse the same
+# rays with a shifted time (see Camera.capture_frames).
+
+import numpy as np
+
+from constants import background_color, gravitational_wave_dt, gravitational_wave_steps_per_wavelength, max_iterations
+from geometric_tests import ray_sphere_intersection_distances
+from functions import gravitational_wave_momenta, integrate_gravitational_wave_batch
+from tracer import closest_intersections
+from aovs import count_aov, record_hits, record_escapes
+from trajectories import record_trajectories, record_trajectory_escapes
+
+def gravitational_wave_step_size(frequency):
+    """ returns the step size for a wave of the (angular) frequency """
+    if (frequency == 0):
+        return gravitational_wave_dt
+    return min(gravitational_wave_dt, 2*np.pi/abs(frequency) / gravitational_wave_steps_per_wavelength)
+
+def trace_rays_gravitational_wave(ray_positions, ray_directions, scene, color_array, masses, amplitude, frequency, time = 0.0, show_progress = True, aovs = None, trajectories = None):
+    """ traces every ray through the gravitational wave of the amplitude and (angular) frequency, leaving the camera at time,
+    and stores the color of every ray in color_array (and the optional aovs, see aovs.py. there are no sois to visit in this mode.)
+    trajectories records the paths of the rays (see trajectories.py). """
+    ray_count = ray_positions.shape[0]
+    float_type = ray_positions.dtype.type
+
+    """ There Are No Masses in the Scene """
+    if (masses.count == 0):
+        color_array[:] = background_color
+        return color_array
+
+    # bounding sphere of the masses. rays leaving it can't hit anything anymore.
+    bound_center = (np.min(masses.position - masses.radius[:, np.newaxis], axis = 0) + np.max(masses.position + masses.radius[:, np.newaxis], axis = 0))/2
+    bound_radius = np.max(np.linalg.norm(masses.position - bound_center, axis = 1) + masses.radius)
+
+    """ Initialization """
+    four_positions = np.concatenate([np.full([ray_count, 1], time, dtype = float_type), ray_positions], axis = 1)
+    four_momenta = gravitational_wave_momenta(four_positions, ray_directions, amplitude, frequency).astype(float_type)
+    ray_indices = np.arange(ray_count)
+    record_trajectories(trajectories, ray_indices, ray_positions, 0)
+
+    # the wave bends rays by about its amplitude. rays that pass far from the bounding sphere are background.
+    is_missing = ~(ray_sphere_intersection_distances(ray_positions, ray_directions, bound_center, bound_radius*(1 + 10*abs(amplitude))) >= 0)
+    color_array[is_missing] = background_color
+    record_escapes(aovs, np.flatnonzero(is_missing), ray_directions[is_missing], ray_directions[is_missing])
+    record_trajectory_escapes(trajectories, np.flatnonzero(is_missing), ray_directions[is_missing])
+
+    ray_indices = ray_indices[~is_missing]
+    four_positions = four_positions[~is_missing]
+    four_momenta = four_momenta[~is_missing]
+
+    step_size = gravitational_wave_step_size(frequency)
+
+    progress = -1
+    iteration = 0
+
+    """ For Every Active Ray """
+    while (ray_indices.shape[0] > 0):
+        """ Progress Bar """
+        # progress percentage, printed once per whole percent
+        percentage = int((ray_count - ray_indices.shape[0]) / ray_count*100)
+        if (show_progress and percentage != progress):
+            progress = percentage
+            print("{:.2f}".format(percentage), "%")
+
+        if (iteration == max_iterations):
+            # rays that are still active are colored black
+            color_array[ray_indices] = 0
+            break
+        iteration += 1
+        count_aov(aovs, 'steps', ray_indices)
+
+        dx, dp = integrate_gravitational_wave_batch(four_positions, four_momenta, step_size, amplitude, frequency)
+
+        """ Hits """
+        # the closest mass that the step's chord reaches is hit
+        positions = four_positions[:, 1:4]
+        chords = dx[:, 1:4]
+        chord_lengths = np.linalg.norm(chords, axis = 1)
+        chord_directions = chords / chord_lengths[:, np.newaxis]
+
+        mass_indices, mass_distances = closest_intersections(ray_sphere_intersection_distances(positions[:, np.newaxis], chord_directions[:, np.newaxis], masses.position, masses.radius))
+        is_hit = mass_distances <= chord_lengths
+
+        hit_points = positions[is_hit] + mass_distances[is_hit, np.newaxis]*chord_directions[is_hit]
+        color_array[ray_indices[is_hit]] = masses.surface_colors(hit_points, mass_indices[is_hit])
+        record_hits(aovs, ray_indices[is_hit], mass_indices[is_hit], hit_points, chords[is_hit], ray_directions[ray_indices[is_hit]], masses)
+        record_trajectories(trajectories, ray_indices[is_hit], hit_points, iteration, True)
+
+        """ Escapes """
+        # rays outside of the bounding sphere that move away from it are background
+        four_positions = four_positions + dx
+        four_momenta = four_momenta + dp
+
+        offsets = four_positions[:, 1:4] - bound_center
+        is_escaping = ~is_hit & (np.sum(offsets*offsets, axis = 1) > bound_radius**2) & (np.sum(offsets*chords, axis = 1) > 0)
+        color_array[ray_indices[is_escaping]] = background_color
+        record_escapes(aovs, ray_indices[is_escaping], chords[is_escaping], ray_directions[ray_indices[is_escaping]])
+        record_trajectory_escapes(trajectories, ray_indices[is_escaping], chords[is_escaping])
+
+        # the hit rays were recorded at their hit points
+        if (trajectories is not None):
+            record_trajectories(trajectories, ray_indices[~is_hit], four_positions[~is_hit, 1:4], iteration, is_escaping[~is_hit])
+
+        """ Update Active Rays """
+        is_active = ~is_hit & ~is_escaping
+        ray_indices = ray_indices[is_active]
+        four_positions = four_positions[is_active]
+        four_momenta = four_momenta[is_active]
+
+    # progress percentage
+    if (show_progress):
+        print("{:.2f}".format(100), "%")
+
+    return color_array
\ No newline at end of file
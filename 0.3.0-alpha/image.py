@@ -4,6 +4,46 @@ import os
 from datetime import datetime
 import numpy as np
 
+def image_file_path(file_name, file_type):
+    """ returns a path in the Images folder for a new image file, renamed to file_name(i) if the file already exists """
+    # make folder for images if images folder does not exist
+    if not os.path.exists("Images"):
+        os.mkdir("Images")
+    
+    file_path = os.path.join("Images", "{0}.{1}".format(file_name, file_type))
+    
+    # rename images that have the same name to file_name(i) to prevent overwriting files
+    i = 0
+    while os.path.exists(file_path):
+        i += 1
+        file_path = os.path.join("Images", "{0}({1}).{2}".format(file_name, i, file_type))
+    
+    return file_path
+
+def create_ppm_memmap(width, height, file_name = None):
+    """ creates a binary (P6) ppm image file of the given size and returns its path and a writable memory map of its pixels with shape [height, width, 3].
+    pixels written to the memory map go straight to the file, so the image never needs to fit in memory. """
+    if (file_name is None):
+        file_name = datetime.now().strftime("%d-%m-%Y_%H-%M-%S-%f")
+    file_path = image_file_path(file_name, 'ppm')
+    
+    header = ppm_header(width, height)
+    
+    # write the header and extend the file to its full size without writing the pixel data
+    with open(file_path, "wb") as file:
+        file.write(header)
+        file.truncate(len(header) + width*height*3)
+    
+    return file_path, open_ppm_memmap(file_path, width, height)
+
+def ppm_header(width, height):
+    """ returns the header of a binary (P6) ppm image file """
+    return "P6\n{0} {1}\n255\n".format(width, height).encode("ascii")
+
+def open_ppm_memmap(file_path, width, height):
+    """ returns a writable memory map with shape [height, width, 3] of the pixels of an existing binary ppm image file made by create_ppm_memmap """
+    return np.memmap(file_path, dtype = np.uint8, mode = "r+", offset = len(ppm_header(width, height)), shape = (height, width, 3))
+
 class Image():
     def __init__(self, width, height, color_data):
         """ takes an image width, image height, a list of RGB vectors, and a file type and generates an image object """
@@ -12,20 +52,10 @@ class Image():
         self.color_data = np.array(color_data)
         
     def save(self, file_name = datetime.now().strftime("%d-%m-%Y_%H-%M-%S-%f"), file_type = 'ppm'):
-        """ saves the image object's data to an image file """
+        """ saves the image object's data to an image file and returns the path of the file """
         # "Building a Ray Tracer in Python" Series by Arun Ravindran "ArunRocks" on Youtube
         
-        # make folder for images if images folder does not exist
-        if not os.path.exists("Images"):
-            os.mkdir("Images")
-        
-        file_path = "Images\{0}.{1}".format(file_name, file_type)
-        
-        # rename images that have the same name to file_name(i) to prevent overwriting files
-        i = 0
-        while os.path.exists(file_path):
-            i += 1
-            file_path = "Images\{0}({1}).{2}".format(file_name, i, file_type)
+        file_path = image_file_path(file_name, file_type)
         
         # resize the array into a 2D array of color vectors for indexing
         resized_color_data = self.color_data.reshape([self.width, self.height, 3])
@@ -48,4 +78,6 @@ class Image():
                     file.write("\n")
             else:
                 raise Exception("Cannot save image. '{0}' is not a supported file type.".format(file_type))
-        print("Saved Image Successfully")
\ No newline at end of file
+        print("Saved Image Successfully")
+        
+        return file_path
\ No newline at end of file
@@ -0,0 +1,76 @@
+# Measures the import time of the core render path
+
+# python import_budget.py
+#
+# short renders and worker processes pay the import time on every launch, so the modules a render needs
+# are kept cheap to import. numpy is unavoidable and is reported separately. everything else that
+# "import camera, mass, scene" pulls in must stay within the budget, and the optional heavy modules
+# must not be imported at all (they are imported lazily by the code that needs them).
+
+import os
+import sys
+import subprocess
+
+import numpy as np
+
+# modules imported by a render
+render_modules = ['camera', 'mass', 'scene']
+
+# import time of the render modules, without numpy [milliseconds]
+render_path_budget = 20.0
+
+# modules that the render path must not import
+lazy_modules = ['pyrr', 'socket', 'asyncio', 'multiprocessing', 'concurrent', 'skimage', 'joblib', 'matplotlib']
+
+# the budget is checked against the median of this many fresh interpreters
+run_count = 5
+
+def measure_imports():
+    """ imports the render modules in a fresh interpreter and returns a dictionary of module name => cumulative import time [milliseconds] and the total import time of the render modules """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + ", ".join(render_modules)], cwd = os.path.dirname(os.path.abspath(__file__)), capture_output = True, text = True, check = True)
+
+    # lines look like "import time:   self [us] | cumulative | <indentation>package", with two spaces of
+    # indentation per level. a module's line comes after the lines of the modules it imports.
+    modules = {}
+    total = 0.0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, cumulative, name = line[len("import time:"):].split("|")
+        name = name[1:]
+        modules.setdefault(name.strip(), int(cumulative) / 1000)
+        if (name.strip() in render_modules and not name.startswith(" ")):
+            total += int(cumulative) / 1000
+
+    return modules, total
+
+def main():
+    runs = [measure_imports() for r in range(run_count)]
+
+    totals = np.array([total for modules, total in runs])
+    numpy_times = np.array([modules.get('numpy', 0.0) for modules, total in runs])
+    render_path = np.median(totals - numpy_times)
+
+    modules = runs[int(np.argsort(totals - numpy_times)[run_count // 2])][0]
+    imported_lazy_modules = [name for name in lazy_modules if name in modules]
+
+    """ Report """
+    print("import {0}".format(", ".join(render_modules)))
+    print("  total:       {:7.2f} ms".format(np.median(totals)))
+    print("  numpy:       {:7.2f} ms".format(np.median(numpy_times)))
+    print("  render path: {:7.2f} ms (budget {:.2f} ms)".format(render_path, render_path_budget))
+
+    print("render modules (cumulative, including numpy for the first module that imports it):")
+    for name in sorted(modules, key = lambda name: -modules[name]):
+        if (name in render_modules):
+            print("  {0:<30} {1:7.2f} ms".format(name, modules[name]))
+
+    is_within_budget = render_path <= render_path_budget and len(imported_lazy_modules) == 0
+    if (len(imported_lazy_modules) > 0):
+        print("modules that should be imported lazily: {0}".format(", ".join(imported_lazy_modules)))
+    print("within budget" if is_within_budget else "OVER BUDGET")
+
+    return 0 if is_within_budget else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
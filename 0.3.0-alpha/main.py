@@ -21,16 +21,16 @@ def main():
     start_time = datetime.now()
     
     # define a scene
-    scene = Scene()
+    scene = Scene(bind = False)
     
-    # create a camera
-    camera = Camera(position = [0,0,10], target = [0, 0, -1], up = [0,1,0], resolution = [1080/4, 720/4], fov = 90.0)
+    # create a camera of the scene
+    camera = Camera(position = [0,0,10], target = [0, 0, -1], up = [0,1,0], resolution = [1080/4, 720/4], fov = 90.0, scene = scene)
     
     # create a mass
-    center_mass = Mass(position = [0, 0, 0], radius = 2, mass = 0.5, color = [50, 225, 225], texture = 'checkered', checkered_subdivision = 12)
+    center_mass = Mass(position = [0, 0, 0], radius = 2, mass = 0.5, color = [50, 225, 225], texture = 'checkered', checkered_subdivision = 12, scene = scene)
     
     # create a test mass
-    test_mass = Mass(position = [-5, 0, -10], radius = 5, mass = 0, color = [230, 200, 50], texture = 'checkered', checkered_subdivision = 12)
+    test_mass = Mass(position = [-5, 0, -10], radius = 5, mass = 0, color = [230, 200, 50], texture = 'checkered', checkered_subdivision = 12, scene = scene)
     
     # capture scene
     camera.capture()
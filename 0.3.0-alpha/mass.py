@@ -3,7 +3,17 @@
 import numpy as np
 from scene import Scene
 
-from constants import soi_factor
+def texture_colors(color, texture):
+    """ returns the two colors of the texture's pattern for a mass of the color """
+    color = np.array(color, dtype = np.int64)
+    if (texture == 'solid'):
+        return color, color
+    elif (texture == 'checkered'):
+        return color // (5/4), color // (5/1)
+    
+    # display error color
+    error_color = np.array([255, 0, 255], dtype = np.int64)
+    return error_color, error_color
 
 class Mass():
     def __init__(self, **kwargs):
@@ -17,38 +27,18 @@ class Mass():
         self.texture = kwargs['texture']
         self.checkered_subdivision = kwargs['checkered_subdivision'] # implement later
         
-        if (self.texture == 'solid'):
-            self.color1 = self.color
-            self.color2 = self.color
-        elif (self.texture == 'checkered'):
-            self.color1 = self.color // (5/4)
-            self.color2 = self.color // (5/1)
-        else:
-            # display error color
-            self.color1 = np.array([255, 0, 255], dtype = np.int64)
-            self.color2 = self.color1
+        self.color1, self.color2 = texture_colors(self.color, self.texture)
         
-        # add mass to bound scene
-        if (Scene.bound_scene == -1):
-            raise Exception("A Scene Must Be Bound Before Masses May Be Initialized")
+        # add mass to its scene, or to the bound scene if no scene is given
+        scene = kwargs.get('scene', None)
+        if (scene is None):
+            scene = Scene.bound()
+        if (scene is None):
+            raise Exception("A Scene Must Be Given or Bound Before Masses May Be Initialized")
         
-        masses = Scene.scenes[Scene.bound_scene].masses
+        # the mass must be outside of its horizon
+        if (self.rs > 0 and self.radius <= scene.metric.horizon_radius(self.rs)):
+            raise Exception("The radius of a mass must be larger than the radius of its horizon ({0}).".format(scene.metric.horizon_radius(self.rs)))
         
-        # check that the added mass and its soi does not intersect or touch any other mass or soi
-        # (assure masses are sufficiently far so that the space-time between them is sufficiently flat)
-        
-        max_radius1 = max(self.rs*soi_factor, self.radius)
-        
-        masses_too_close = False
-        
-        for m in range(len(masses)):
-            max_radius2 = max(masses[m].rs*soi_factor, masses[m].radius)
-            
-            seperation_distance = np.linalg.norm(self.position - masses[m].position)
-            
-            masses_too_close = max_radius1 + max_radius2 >= seperation_distance
-        
-            if (masses_too_close):
-                raise Exception("A Mass-Mass, SOI-SOI, or Mass-SOI Intersection Has Occured. Masses must be sufficiently distance such that the masses and or their spheres of influence are not touching or intersecting.")
-        
-        Scene.scenes[Scene.bound_scene].masses = np.append(Scene.scenes[Scene.bound_scene].masses, self)
+        # the scene checks that the added mass and its soi does not intersect or touch any other mass or soi (see Scene.add_mass)
+        scene.add_mass(self)
\ No newline at end of file
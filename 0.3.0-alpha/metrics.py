@@ -0,0 +1,160 @@
+# Handles the metrics that rays are traced through
+
+# a metric describes the static, spherically symmetric spacetime around every mass of a scene in isotropic coordinates,
+# ds^2 = -a(r) dt^2 + b(r) (dx^2 + dy^2 + dz^2). light follows the refractive index n = sqrt(b/a), so a metric only has to
+# supply batched kernels of n and its gradient (and the metadata below) to be traced by every integrator, the soi binning,
+# event location, culling and AOVs of tracer.py and superposed.py:
+# - refractive_index_gradient(ray_positions, mass_positions, schwarzschild_radii) => n, (N,3) gradient. required.
+# - refractive_index, force and direction_step are derived from it and may be replaced by faster or exact forms.
+# - horizon_radius(schwarzschild_radii): isotropic radius of the event horizon. masses must be larger than it.
+# - soi_radius(schwarzschild_radii, soi_factor): radius outside of which the rays are straight lines.
+# - has_weak_field_sweep: rays may pass through an soi in closed form (the series of functions.weak_field_sweep).
+# every kernel takes (N,3) ray positions and (N,3) or (3,) mass positions and (N,) or scalar Schwarzschild radii.
+# parameters of a metric other than the mass (a charge, ...) are members of the metric object, as ratios to the mass.
+#
+# rotating metrics (Kerr) are not static and have no refractive index. they need another contract and are not covered here.
+# the gravitational wave (see gravitational_wave.py) is a time dependent metric and is traced with four-momenta instead.
+
+import numpy as np
+
+from functions import integrate_schwarzschild_batch, integrate_leapfrog_batch, integrate_yoshida_batch, refractive_index, refractive_index_gradient, schwarzschild_force
+
+class Metric():
+    """
+    The base of the metrics. a metric implements refractive_index_gradient and may replace the other kernels.
+
+    members:
+    + name : string
+    + has_weak_field_sweep : bool
+
+    methods:
+    + parameters() => dictionary, the description of the metric (see create_metric)
+    + refractive_index_gradient(ray_positions, mass_positions, schwarzschild_radii) => n : np array, gradient : np array of np vec3
+    + refractive_index(ray_positions, mass_positions, schwarzschild_radii) => n : np array
+    + force(ray_positions, mass_positions, schwarzschild_radii) => dp/ds : np array of np vec3
+    + direction_step(ray_positions, ray_directions, mass_positions, schwarzschild_radii, dt) => dx, dd : np arrays of np vec3
+    + horizon_radius(schwarzschild_radii) => np array
+    + soi_radius(schwarzschild_radii, soi_factor) => np array
+    """
+
+    name = None
+    has_weak_field_sweep = False
+
+    def parameters(self):
+        return {'name' : self.name}
+
+    def refractive_index_gradient(self, ray_positions, mass_positions, schwarzschild_radii):
+        raise Exception("A metric must implement refractive_index_gradient.")
+
+    def refractive_index(self, ray_positions, mass_positions, schwarzschild_radii):
+        return self.refractive_index_gradient(ray_positions, mass_positions, schwarzschild_radii)[0]
+
+    def force(self, ray_positions, mass_positions, schwarzschild_radii):
+        """ returns dp/ds = grad(n^2/2) = n grad(n) of the optical Hamiltonian H = |p|^2/2 - n^2/2 (see functions.py) """
+        n, gradient = self.refractive_index_gradient(ray_positions, mass_positions, schwarzschild_radii)
+        return n[:, np.newaxis]*gradient
+
+    def direction_step(self, ray_positions, ray_directions, mass_positions, schwarzschild_radii, dt):
+        """ returns the changes in position and unit direction of an euler step. the parameter is the one of integrate_schwarzschild_batch:
+        rays move dt/n^2 and turn by the gradient of n across the ray, grad(n)/n per unit length. """
+        n, gradient = self.refractive_index_gradient(ray_positions, mass_positions, schwarzschild_radii)
+        across = gradient - np.sum(gradient*ray_directions, axis = 1)[:, np.newaxis]*ray_directions
+
+        # dt is a step size or an (N,1) array of step sizes
+        dx = dt*ray_directions/(n**2)[:, np.newaxis]
+        dd = dt*across/(n**3)[:, np.newaxis]
+        return dx, dd
+
+    def horizon_radius(self, schwarzschild_radii):
+        raise Exception("A metric must implement horizon_radius.")
+
+    def soi_radius(self, schwarzschild_radii, soi_factor):
+        return schwarzschild_radii*soi_factor
+
+class SchwarzschildMetric(Metric):
+    """ the uncharged, non-rotating mass. n = (1 + rs/4r)^3 / (1 - rs/4r) """
+
+    name = 'schwarzschild'
+    has_weak_field_sweep = True
+
+    def refractive_index_gradient(self, ray_positions, mass_positions, schwarzschild_radii):
+        return refractive_index_gradient(ray_positions, mass_positions, schwarzschild_radii)
+
+    def refractive_index(self, ray_positions, mass_positions, schwarzschild_radii):
+        return refractive_index(ray_positions, mass_positions, schwarzschild_radii)
+
+    def force(self, ray_positions, mass_positions, schwarzschild_radii):
+        return schwarzschild_force(ray_positions, mass_positions, schwarzschild_radii)
+
+    def direction_step(self, ray_positions, ray_directions, mass_positions, schwarzschild_radii, dt):
+        # the original equations of motion in coordinate time
+        return integrate_schwarzschild_batch(ray_positions, ray_directions, mass_positions, schwarzschild_radii, dt)
+
+    def horizon_radius(self, schwarzschild_radii):
+        return schwarzschild_radii/4
+
+class ReissnerNordstromMetric(Metric):
+    """
+    the charged, non-rotating mass with the charge Q = charge_ratio M (|charge_ratio| <= 1).
+    with the areal radius r = rho + M + c/rho of the isotropic radius rho and c = (M^2 - Q^2)/4, the index is n = r^2 / (rho^2 - c).
+    it is the Schwarzschild index for Q = 0.
+
+    members:
+    + charge_ratio : double
+    """
+
+    name = 'reissner_nordstrom'
+
+    def __init__(self, charge_ratio = 0.0):
+        if (abs(charge_ratio) > 1):
+            raise Exception("A charge_ratio above 1 has no horizon (a naked singularity). Use |charge_ratio| <= 1.")
+        self.charge_ratio = charge_ratio
+
+    def parameters(self):
+        return {'name' : self.name, 'charge_ratio' : self.charge_ratio}
+
+    def refractive_index_gradient(self, ray_positions, mass_positions, schwarzschild_radii):
+        x = ray_positions - mass_positions
+        rho = np.sqrt(np.sum(x*x, axis = 1))
+        M = schwarzschild_radii/2
+        c = M**2*(1 - self.charge_ratio**2)/4
+
+        r = rho + M + c/rho
+        dr_drho = 1 - c/rho**2
+        n = r**2/(rho**2 - c)
+        dn_drho = 2*r*(dr_drho*(rho**2 - c) - r*rho)/(rho**2 - c)**2
+
+        return n, (dn_drho/rho)[:, np.newaxis]*x
+
+    def horizon_radius(self, schwarzschild_radii):
+        return schwarzschild_radii/4*np.sqrt(1 - self.charge_ratio**2)
+
+# name => metric class
+metric_types = {
+    'schwarzschild' : SchwarzschildMetric,
+    'reissner_nordstrom' : ReissnerNordstromMetric,
+}
+
+# the metric of scenes that don't name one
+schwarzschild = SchwarzschildMetric()
+
+def create_metric(name = 'schwarzschild', **parameters):
+    """ returns a metric for its description, for example create_metric('reissner_nordstrom', charge_ratio = 0.5) """
+    if (name not in metric_types):
+        raise Exception("'{0}' is not a supported metric. Use one of: {1}".format(name, ", ".join(metric_types)))
+    return metric_types[name](**parameters)
+
+""" Steps """
+# the integrators of tracer.py. they take the metric of the scene last and default to the Schwarzschild metric.
+
+def euler_step(ray_positions, ray_directions, mass_positions, schwarzschild_radii, dt, metric = schwarzschild):
+    """ returns the changes in position and unit direction of an euler step (the directions are renormalized by the tracer) """
+    return metric.direction_step(ray_positions, ray_directions, mass_positions, schwarzschild_radii, dt)
+
+def leapfrog_step(ray_positions, ray_momenta, mass_positions, schwarzschild_radii, dt, metric = schwarzschild):
+    """ returns the changes in position and momentum of a kick-drift-kick leapfrog step """
+    return integrate_leapfrog_batch(ray_positions, ray_momenta, mass_positions, schwarzschild_radii, dt, metric.force)
+
+def yoshida_step(ray_positions, ray_momenta, mass_positions, schwarzschild_radii, dt, metric = schwarzschild):
+    """ returns the changes in position and momentum of a 4th order yoshida step """
+    return integrate_yoshida_batch(ray_positions, ray_momenta, mass_positions, schwarzschild_radii, dt, metric.force)
\ No newline at end of file
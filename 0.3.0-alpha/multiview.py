@@ -0,0 +1,92 @@
+# Handles captures of one scene from many cameras
+
+# stereo pairs and multi-angle datasets view the same scene from many cameras. capturing them one at a time traces
+# a small batch of rays per camera, and every batch pays for the same per-step overhead. capture_views builds the
+# scene dependent data (the MassArrays and the octree of superposed scenes, see tracer.mass_arrays and
+# superposed.scene_octree) once and traces the rays of every camera together, so the cost follows the total ray count.
+#
+# cameras with the same trace settings (precision, integrator, gravitational wave, time and weak field tolerance) share
+# batches. a batch takes cameras until it holds multiview_batch_rays rays, which bounds the memory of the working arrays.
+# a batch holds three 640x480 views or about fifty 160x120 views. views larger than a batch are traced alone and only
+# share the scene data.
+
+import numpy as np
+
+from tracer import mass_arrays
+from aovs import create_aovs
+from constants import precisions, multiview_batch_rays
+
+def trace_settings(camera):
+    """ returns the camera members that change how its rays are traced. cameras with the same settings can share a batch. """
+    gravitational_wave = None if camera.gravitational_wave is None else (camera.gravitational_wave['amplitude'], camera.gravitational_wave['frequency'])
+    return (camera.precision, camera.integrator, gravitational_wave, camera.time, camera.weak_field_tolerance)
+
+def capture_views(cameras, file_names = None, aovs = None, output = 'file', scene = None):
+    """ captures the scene from every camera in shared batches and returns a list with the result of every camera, in order:
+    the path of its image file, or (pixels, aov_arrays) with output = 'array' (see Camera.capture).
+    file_names is a list with a file name (or None) for every camera. aovs is a list of auxiliary channels (see aovs.py).
+    scene is the scene to capture. without one, the scene of the cameras (which must all have the same scene) or else the bound scene is captured. """
+    if (output not in ('file', 'array')):
+        raise Exception("'{0}' is not a supported capture output. Use 'file' or 'array'.".format(output))
+    if (file_names is None):
+        file_names = [None]*len(cameras)
+    if (len(file_names) != len(cameras)):
+        raise Exception("capture_views needs one file name for every camera.")
+
+    # the rays of every camera are traced through one scene
+    scenes = [camera.capture_scene(scene) for camera in cameras]
+    if (any(camera_scene is not scenes[0] for camera_scene in scenes)):
+        raise Exception("capture_views captures one scene. Every camera must have the same scene, or a scene must be passed.")
+    scene = scenes[0]
+
+    """ Schedule """
+    # camera indices of every batch, in order of their first camera
+    groups = {}
+    for c, camera in enumerate(cameras):
+        groups.setdefault(trace_settings(camera), []).append(c)
+
+    batches = []
+    for camera_indices in groups.values():
+        batch, batch_rays = [], 0
+        for c in camera_indices:
+            ray_count = int(cameras[c].resolution[0]*cameras[c].resolution[1])
+            if (len(batch) > 0 and batch_rays + ray_count > multiview_batch_rays):
+                batches.append(batch)
+                batch, batch_rays = [], 0
+            batch.append(c)
+            batch_rays += ray_count
+        batches.append(batch)
+
+    results = [None]*len(cameras)
+
+    """ For Every Batch """
+    for b, camera_indices in enumerate(batches):
+        print("Tracing batch {0} of {1} with {2} cameras".format(b + 1, len(batches), len(camera_indices)))
+
+        float_type, color_type = precisions[cameras[camera_indices[0]].precision]
+
+        # scene dependent data is built once and shared by every camera of the scene
+        masses = mass_arrays(scene, float_type)
+
+        # the rays of every camera, one after the other
+        ray_positions, ray_directions, is_traced = [], [], []
+        for c in camera_indices:
+            positions, directions = cameras[c].initialize_rays()
+            ray_positions.append(positions)
+            ray_directions.append(directions)
+            is_traced.append(cameras[c].traced_pixels(scene, masses))
+        offsets = np.cumsum([0] + [positions.shape[0] for positions in ray_positions])
+
+        color_array = np.zeros([offsets[-1], 3], dtype = color_type)
+        aov_arrays = None if aovs is None else create_aovs(aovs, offsets[-1])
+
+        # every camera of the batch traces rays the same way
+        cameras[camera_indices[0]].trace_culled(np.concatenate(ray_positions), np.concatenate(ray_directions), scene, color_array, masses, np.concatenate(is_traced), aovs = aov_arrays)
+
+        """ Results """
+        for i, c in enumerate(camera_indices):
+            view = slice(offsets[i], offsets[i + 1])
+            view_aovs = None if aov_arrays is None else {name : values[view] for name, values in aov_arrays.items()}
+            results[c] = cameras[c].capture_result(color_array[view], view_aovs, file_names[c], output)
+
+    return results
\ No newline at end of file
@@ -0,0 +1,165 @@
+# Handles Barnes-Hut octrees of masses
+
+# the octree is built once per scene and flattened into numpy arrays, so that it can be traversed
+# for many points at once: every (point, node) pair is either accepted (the node is far enough to be
+# treated as one mass at its center of mass, or it is a leaf) or replaced by the pairs of its children.
+# each point visits O(log n) nodes instead of all n masses.
+
+import numpy as np
+
+# nodes are opened while their size is larger than opening_angle times their distance
+opening_angle = 0.5
+
+# nodes deeper than this are leaves even if they hold several (nearly coincident) masses
+max_depth = 32
+
+class Octree():
+    """
+    A Barnes-Hut octree of point masses.
+
+    members:
+    + center : np vec3, center of the root cube
+    + half_size : double, half the side length of the root cube
+    + center_of_mass : np array of np vec3, rs weighted center of every node
+    + rs : np array of double, total Schwarzschild radius of every node
+    + size : np array of double, side length of every node
+    + extent : np array of double, distance from the center of mass to the farthest mass of every node
+    + radius : np array of double, largest mass radius of the masses in every node
+    + reach : np array of double, largest reach (soi or mass radius) of the masses in every node
+    + children : np array of [8] int, child nodes of every node (-1 where missing)
+    + mass_index : np array of int, the mass of every leaf (-1 for internal nodes)
+
+    methods:
+    + evaluate(points : np array of np vec3) => potential, gradient, nearest_mass, clearance
+    """
+
+    def __init__(self, positions, rs, radii, reach):
+        self.positions = np.array(positions, dtype = np.float64).reshape([-1, 3])
+        self.mass_rs = np.array(rs, dtype = np.float64)
+        self.mass_radius = np.array(radii, dtype = np.float64)
+        self.mass_reach = np.array(reach, dtype = np.float64)
+
+        # root cube
+        low = self.positions.min(axis = 0)
+        high = self.positions.max(axis = 0)
+        self.center = (low + high)/2
+        self.half_size = max(np.max(high - low)/2, 1e-12)*(1 + 1e-9)
+
+        # nodes are appended to these lists while building and then converted to arrays
+        self._center_of_mass = []
+        self._rs = []
+        self._size = []
+        self._extent = []
+        self._radius = []
+        self._reach = []
+        self._children = []
+        self._mass_index = []
+
+        self.build(np.arange(self.positions.shape[0]), self.center, self.half_size, 0)
+
+        self.center_of_mass = np.array(self._center_of_mass).reshape([-1, 3])
+        self.rs = np.array(self._rs)
+        self.size = np.array(self._size)
+        self.extent = np.array(self._extent)
+        self.radius = np.array(self._radius)
+        self.reach = np.array(self._reach)
+        self.children = np.array(self._children, dtype = np.int64).reshape([-1, 8])
+        self.mass_index = np.array(self._mass_index, dtype = np.int64)
+
+        del self._center_of_mass, self._rs, self._size, self._extent, self._radius, self._reach, self._children, self._mass_index
+
+    def build(self, indices, center, half_size, depth):
+        """ adds the node of the masses indices inside of the cube at center with half_size and returns the node index """
+        node = len(self._rs)
+
+        rs = self.mass_rs[indices]
+        total_rs = np.sum(rs)
+        if (total_rs > 0):
+            center_of_mass = np.sum(self.positions[indices]*rs[:, np.newaxis], axis = 0) / total_rs
+        else:
+            # massless objects (that can still be hit) are placed at their mean position
+            center_of_mass = np.mean(self.positions[indices], axis = 0)
+
+        self._center_of_mass.append(center_of_mass)
+        self._rs.append(total_rs)
+        self._size.append(2*half_size)
+        self._extent.append(np.max(np.linalg.norm(self.positions[indices] - center_of_mass, axis = 1)))
+        self._radius.append(np.max(self.mass_radius[indices]))
+        self._reach.append(np.max(self.mass_reach[indices]))
+        self._children.append(np.full(8, -1))
+
+        if (indices.shape[0] == 1 or depth == max_depth):
+            # coincident masses at the maximum depth act as one leaf at their center of mass
+            self._mass_index.append(indices[np.argmax(self.mass_reach[indices])])
+            return node
+
+        self._mass_index.append(-1)
+
+        # octant of every mass: bit 0 => x, bit 1 => y, bit 2 => z
+        octants = np.sum((self.positions[indices] >= center)*np.array([1, 2, 4]), axis = 1)
+
+        children = np.full(8, -1)
+        for octant in range(8):
+            child_indices = indices[octants == octant]
+            if (child_indices.shape[0] == 0):
+                continue
+            offset = (np.array([octant & 1, (octant >> 1) & 1, (octant >> 2) & 1])*2 - 1)*half_size/2
+            children[octant] = self.build(child_indices, center + offset, half_size/2, depth + 1)
+        self._children[node] = children
+
+        return node
+
+    def evaluate(self, points):
+        """ takes (N,3) points and returns for every point:
+        the weak-field potential sum(rs/r), its (N,3) gradient, the mass with the closest surface
+        (-1 if no leaf was reached) and a lower bound of the distance to the closest mass surface (clearance). """
+        point_count = points.shape[0]
+        potential = np.zeros(point_count)
+        gradient = np.zeros([point_count, 3])
+        nearest_mass = np.full(point_count, -1, dtype = np.int64)
+        clearance = np.full(point_count, np.inf)
+
+        # (point, node) pairs, starting at the root
+        point_indices = np.arange(point_count)
+        nodes = np.zeros(point_count, dtype = np.int64)
+
+        while (point_indices.shape[0] > 0):
+            offsets = points[point_indices] - self.center_of_mass[nodes]
+            distances = np.sqrt(np.einsum('ij,ij->i', offsets, offsets))
+
+            is_leaf = self.mass_index[nodes] >= 0
+
+            # every mass of a node lies within its extent of its center of mass. nodes that a point may be
+            # within the reach of are always opened, so that close masses are resolved individually.
+            distance_bound = distances - self.extent[nodes]
+            is_far = (self.size[nodes] < opening_angle*distances) & (distance_bound > self.reach[nodes])
+            is_accepted = is_leaf | is_far
+
+            """ Accepted Nodes """
+            accepted_points = point_indices[is_accepted]
+            accepted_nodes = nodes[is_accepted]
+            accepted_distances = distances[is_accepted]
+
+            # bincount sums the contributions of the pairs of every point (much faster than np.add.at)
+            potential += np.bincount(accepted_points, self.rs[accepted_nodes] / accepted_distances, point_count)
+            weights = -self.rs[accepted_nodes] / accepted_distances**3
+            accepted_offsets = offsets[is_accepted]
+            for axis in range(3):
+                gradient[:, axis] += np.bincount(accepted_points, weights*accepted_offsets[:, axis], point_count)
+
+            # leaves know their surface. far nodes only give a lower bound.
+            leaf_mass = self.mass_index[accepted_nodes]
+            surface_distances = np.where(leaf_mass >= 0, accepted_distances - self.mass_radius[leaf_mass], distance_bound[is_accepted] - self.radius[accepted_nodes])
+            np.minimum.at(clearance, accepted_points, surface_distances)
+
+            is_nearest = (leaf_mass >= 0) & (surface_distances == clearance[accepted_points])
+            nearest_mass[accepted_points[is_nearest]] = leaf_mass[is_nearest]
+
+            """ Opened Nodes """
+            children = self.children[nodes[~is_accepted]]
+            has_child = children >= 0
+            point_indices = np.repeat(point_indices[~is_accepted], np.sum(has_child, axis = 1))
+            nodes = children[has_child]
+
+        # a far node may have lowered the clearance below the nearest leaf's surface distance
+        return potential, gradient, nearest_mass, clearance
\ No newline at end of file
@@ -0,0 +1,87 @@
+# Compares single precision renders against the double precision reference
+
+import numpy as np
+
+from scene import Scene
+from camera import Camera
+from mass import Mass
+from constants import precisions
+
+# closest approach bins in units of the Schwarzschild radius
+impact_parameter_bins = np.array([0, 2, 3, 5, 10, 20, np.inf])
+
+def render_colors(camera, scene, precision):
+    """ traces the camera's rays through the scene at the given precision and returns the ray positions, ray directions and colors without saving an image """
+    original_precision = camera.precision
+    camera.precision = precision
+    try:
+        ray_positions, ray_directions = camera.initialize_rays()
+    finally:
+        camera.precision = original_precision
+
+    color_array = np.zeros([ray_positions.shape[0], 3], dtype = precisions[precision][1])
+    camera.trace(ray_positions, ray_directions, scene, color_array)
+
+    return ray_positions, ray_directions, color_array
+
+def impact_parameters(ray_positions, ray_directions, scene):
+    """ returns the straight line closest approach of every ray to any gravitating mass in units of that mass' Schwarzschild radius (inf if there are none) """
+    closest = np.full(ray_positions.shape[0], np.inf)
+
+    for mass in scene.masses:
+        if (mass.rs == 0):
+            continue
+        ray_to_mass = mass.position - ray_positions
+        tca = np.sum(ray_to_mass*ray_directions, axis = 1)
+        # rays pointing away from the mass are closest at their start
+        closest_point = ray_to_mass - np.maximum(tca, 0)[:, np.newaxis]*ray_directions
+        closest = np.minimum(closest, np.linalg.norm(closest_point, axis = 1) / mass.rs)
+
+    return closest
+
+def precision_report(camera, scene = None):
+    """ renders the scene in double and single precision and prints where single precision differs from the double precision reference.
+    returns a dictionary of the per-bin results. """
+    scene = camera.capture_scene(scene)
+
+    """ Render Both Precisions """
+    reference_positions, reference_directions, reference_colors = render_colors(camera, scene, 'double')
+    single_positions, single_directions, single_colors = render_colors(camera, scene, 'single')
+
+    """ Compare """
+    # ray generation error (chord length between unit vectors, equal to the angle for small angles)
+    direction_error = np.linalg.norm(reference_directions - single_directions.astype(np.float64), axis = 1)
+
+    color_difference = np.abs(reference_colors - single_colors.astype(np.int64)).max(axis = 1)
+    is_mismatch = color_difference > 0
+
+    closest = impact_parameters(reference_positions, reference_directions, scene)
+    bin_indices = np.digitize(closest, impact_parameter_bins) - 1
+
+    """ Report """
+    print("closest approach [rs]   rays      mismatched   max color error")
+    results = []
+    for b in range(impact_parameter_bins.shape[0] - 1):
+        in_bin = bin_indices == b
+        ray_count = int(np.sum(in_bin))
+        mismatch_count = int(np.sum(is_mismatch[in_bin]))
+        max_error = int(color_difference[in_bin].max()) if ray_count > 0 else 0
+        results.append({'low' : impact_parameter_bins[b], 'high' : impact_parameter_bins[b + 1], 'rays' : ray_count, 'mismatched' : mismatch_count, 'max_color_error' : max_error})
+
+        fraction = mismatch_count / ray_count*100 if ray_count > 0 else 0
+        print("{0:>7.1f} - {1:<7.1f}      {2:<9d} {3:>6.2f} %     {4}".format(impact_parameter_bins[b], impact_parameter_bins[b + 1], ray_count, fraction, max_error))
+
+    print("total mismatched pixels: {0} of {1}".format(int(np.sum(is_mismatch)), is_mismatch.shape[0]))
+    print("max ray direction error: {:.3e} rad".format(direction_error.max()))
+    print("color buffer: {0} bytes (double) vs {1} bytes (single)".format(reference_colors.nbytes, single_colors.nbytes))
+
+    return {'bins' : results, 'mismatched' : int(np.sum(is_mismatch)), 'max_direction_error' : direction_error.max()}
+
+if __name__ == "__main__":
+    # the scene from main.py
+    scene = Scene()
+    camera = Camera(position = [0,0,10], target = [0, 0, -1], up = [0,1,0], resolution = [1080/4, 720/4], fov = 90.0)
+    center_mass = Mass(position = [0, 0, 0], radius = 2, mass = 0.5, color = [50, 225, 225], texture = 'checkered', checkered_subdivision = 12)
+    test_mass = Mass(position = [-5, 0, -10], radius = 5, mass = 0, color = [230, 200, 50], texture = 'checkered', checkered_subdivision = 12)
+
+    precision_report(camera, scene)
\ No newline at end of file
@@ -1,26 +1,146 @@
 # a scene is a container for masses
 # consider removing for simplicity
 
+# masses and cameras take their scene explicitly (Mass(scene = ...), Camera(scene = ...) or capture(scene = ...)), so
+# captures of different scenes can run at once in threads of one process.
+# binding is a compatibility layer for code that doesn't pass a scene: it is the default scene of masses and captures.
+# a binding is kept per thread (falling back to the last scene bound in any thread), and only bound scenes are kept
+# in Scene.scenes.
+
+import itertools
+import threading
+
 import numpy as np
 
+from metrics import schwarzschild
+from constants import soi_factor
+
+# the offsets of a spatial hash cell and its 26 neighbors (see Scene.add_mass)
+neighbor_offsets = list(itertools.product((-1, 0, 1), repeat = 3))
+
 class Scene():
     scenes = np.array([])
     bound_scene = -1
     
-    def __init__(self, masses = np.array([])):
+    # guards Scene.scenes
+    _lock = threading.Lock()
+    # the scene bound by each thread
+    _thread_binding = threading.local()
+    
+    def __init__(self, masses = np.array([]), superposed = False, metric = schwarzschild, soi_factor = soi_factor, bind = True):
         self.masses = masses
-        # append the scene to the scenes array
-        Scene.scenes = np.append(Scene.scenes, self)
+        # superposed scenes allow overlapping spheres of influence. their masses bend rays together
+        # in the weak-field limit (see superposed.py) instead of one soi at a time.
+        self.superposed = superposed
+        # the spacetime around every mass (see metrics.py)
+        self.metric = metric
+        # the soi radius of every mass in units of its schwarzschild radius. larger sois let more rays pass through
+        # them in closed form (see tracer.weak_field_passes), but need the masses to be farther apart.
+        self.soi_factor = soi_factor
+        
+        # the index of the scene in the scenes array, once it is bound
+        self._index = None
+        
+        # the masses and the centers and radii of their bounding spheres, with spare capacity (see add_mass).
+        # masses is a view of the first masses of the buffer and is replaced by a new view when a mass is added.
+        self._mass_buffer = np.empty(0, dtype = object)
+        self._bound_positions = np.zeros([0, 3])
+        self._bound_radii = np.zeros(0)
+        self._masses_view = None
+        # a spatial hash of the bounding spheres: grid cell => indices of the masses centered in it. the cells are at
+        # least twice as wide as the largest bounding sphere, so touching spheres are always in neighboring cells.
+        self._bound_cells = {}
+        self._bound_cell_size = 0.0
         
         # bind the generated scene
-        # find the index of the scene in the scenes array:
-        self._index = self.scenes.shape[0] - 1
-        # bind the scene
-        self.bind()
+        if (bind):
+            self.bind()
         
     
     def bind(self):
-        Scene.bound_scene = self._index
+        # append the scene to the scenes array the first time it is bound
+        with Scene._lock:
+            if (self._index is None):
+                Scene.scenes = np.append(Scene.scenes, self)
+                self._index = Scene.scenes.shape[0] - 1
+            Scene.bound_scene = self._index
+        Scene._thread_binding.scene = self
+    
+    def bound_radius(self, mass):
+        """ returns the radius of the sphere around a mass that no other mass may touch: the mass itself in superposed scenes, else the larger of the mass and its soi """
+        if (self.superposed):
+            return mass.radius
+        return max(self.metric.soi_radius(mass.rs, self.soi_factor), mass.radius)
+    
+    def sois_overlap(self, soi_factor):
+        """ returns True if the sois (or surfaces) of any two masses would overlap at the soi_factor. the masses of superposed scenes may overlap. """
+        if (self.superposed or len(self.masses) < 2):
+            return False
+        positions = np.array([mass.position for mass in self.masses], dtype = np.float64)
+        bound_radii = np.array([max(self.metric.soi_radius(mass.rs, soi_factor), mass.radius) for mass in self.masses])
+        is_overlapping = np.linalg.norm(positions[:, np.newaxis] - positions, axis = 2) <= bound_radii[:, np.newaxis] + bound_radii
+        np.fill_diagonal(is_overlapping, False)
+        return bool(np.any(is_overlapping))
+    
+    def _bound_cell(self, position):
+        """ returns the spatial hash cell of a position """
+        return tuple(int(c) for c in np.floor(np.asarray(position, dtype = np.float64) / self._bound_cell_size))
+    
+    def _hash_bounds(self, cell_size):
+        """ rebuilds the spatial hash of the bounding spheres with cells of the size """
+        self._bound_cell_size = cell_size
+        self._bound_cells = {}
+        for m in range(len(self.masses)):
+            self._bound_cells.setdefault(self._bound_cell(self._bound_positions[m]), []).append(m)
+    
+    def add_mass(self, mass):
+        """ adds a mass to the scene. raises an exception if it or its soi intersects or touches any other mass or soi
+        (the masses must be far enough apart that the space-time between them is flat). superposed scenes only require
+        that the masses themselves do not intersect or touch.
+        a mass is only tested against the masses in the neighboring cells of a spatial hash, so adding n masses of
+        similar sizes takes O(n) time. the hash is rebuilt when a mass is too large for its cells. """
+        count = len(self.masses)
+        if (self.masses is not self._masses_view):
+            # the masses were given to the scene or replaced. the buffers are rebuilt from them.
+            self._mass_buffer = np.array(list(self.masses) + [None], dtype = object)
+            self._bound_positions = np.array([m.position for m in self.masses] + [np.zeros(3)], dtype = np.float64)
+            self._bound_radii = np.array([self.bound_radius(m) for m in self.masses] + [0.0])
+            self._hash_bounds(2*np.max(self._bound_radii) or 1.0)
+        elif (count == self._mass_buffer.shape[0]):
+            # the buffers double when they are full, so adding n masses copies O(n) masses in total
+            capacity = max(16, 2*count)
+            self._mass_buffer = np.concatenate([self._mass_buffer, np.empty(capacity - count, dtype = object)])
+            self._bound_positions = np.concatenate([self._bound_positions, np.zeros([capacity - count, 3])])
+            self._bound_radii = np.concatenate([self._bound_radii, np.zeros(capacity - count)])
+        
+        bound_radius = self.bound_radius(mass)
+        if (2*bound_radius > self._bound_cell_size or self._bound_cell_size == 0):
+            # the cells grow at least twofold, so a scene of growing masses is rehashed O(log) times
+            self._hash_bounds(max(2*bound_radius, 2*self._bound_cell_size) or 1.0)
+        
+        # the bounding sphere of the mass against the bounding spheres of the masses in the 27 cells around it at once
+        cell = self._bound_cell(mass.position)
+        neighbors = [m for x, y, z in neighbor_offsets for m in self._bound_cells.get((cell[0] + x, cell[1] + y, cell[2] + z), ())]
+        separation_distances = np.linalg.norm(self._bound_positions[neighbors] - mass.position, axis = 1)
+        if (np.any(bound_radius + self._bound_radii[neighbors] >= separation_distances)):
+            raise Exception("A Mass-Mass, SOI-SOI, or Mass-SOI Intersection Has Occured. Masses must be sufficiently distance such that the masses and or their spheres of influence are not touching or intersecting.")
+        
+        self._mass_buffer[count] = mass
+        self._bound_positions[count] = mass.position
+        self._bound_radii[count] = bound_radius
+        self._bound_cells.setdefault(cell, []).append(count)
+        
+        # a new view, so the per-mass arrays cached on the scene are rebuilt (see tracer.mass_arrays)
+        self.masses = self._mass_buffer[:count + 1]
+        self._masses_view = self.masses
+    
+    @staticmethod
+    def bound():
+        """ returns the scene bound in this thread, or else the last scene bound in any thread, or None if no scene is bound """
+        scene = getattr(Scene._thread_binding, 'scene', None)
+        if (scene is None and Scene.bound_scene != -1):
+            scene = Scene.scenes[Scene.bound_scene]
+        return scene
         
     def delete(self):
         # delete scene and free memory
@@ -30,4 +150,12 @@ class Scene():
     """
     def generate_random_mass_field():
         pass
-    """
\ No newline at end of file
+    """
+
+def resolve_scene(scene = None, action = "capture"):
+    """ returns the scene, or the bound scene if scene is None. raises an exception if there is neither. """
+    if (scene is None):
+        scene = Scene.bound()
+    if (scene is None):
+        raise Exception("No scene is given and no scene is bound. A scene must be passed or bound to {0}.".format(action))
+    return scene
\ No newline at end of file
@@ -0,0 +1,376 @@
+# Handles a long running render service
+
+# python service.py [port] [worker_count]
+#
+# render jobs are queued by priority and run on a pool of warm worker processes, so the imports and
+# scene setup are paid once per worker instead of once per render. jobs of the same priority are
+# taken from the submitting clients in turn, so one client cannot starve the others.
+#
+# HTTP API on localhost (JSON bodies, see description.py for the scene and camera description):
+#   POST /jobs               {"description" : {...}, "priority" : 0, "client" : "name"} => {"job" : id}
+#   GET  /jobs/<id>          => status of the job
+#   GET  /jobs/<id>/events   => newline delimited JSON progress events, streamed until the job finishes
+#   GET  /jobs/<id>/image    => the finished ppm image
+#   GET  /stats              => queue depth, running jobs and throughput
+#
+# finished jobs are dropped once their result was fetched (the image of a done job, the status of a failed job)
+# or finished_job_lifetime seconds after they ended, so a long running service doesn't collect every job it ran.
+
+import sys
+import json
+import time
+import heapq
+import asyncio
+import collections
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# jobs without a tile size are traced in tiles of this size so that they report progress
+default_tile_size = 64
+
+# completed jobs within this many seconds are used for the throughput
+throughput_window = 60.0
+
+# finished jobs whose result is never fetched are dropped this many seconds after they end
+finished_job_lifetime = 3600.0
+
+# events kept per job for clients that start streaming late. the last event holds the full status.
+job_event_history = 100
+
+""" Worker Processes """
+def warm_worker():
+    """ imports the render modules when a worker process starts """
+    global description
+    import description
+
+def render_job(job_id, job_description, events):
+    """ renders a job description in a worker process and returns the path of the image file. progress is put on the events queue. """
+    def progress(fraction):
+        events.put((job_id, fraction))
+
+    job_description = dict(job_description)
+    job_description.setdefault('tile_size', default_tile_size)
+
+    # scenes are cached by the worker process (see description.cached_scene)
+    return description.render(job_description, progress)
+
+""" Jobs """
+class Job():
+    """
+    A render job and its status.
+
+    members:
+    + id : int
+    + client : string
+    + priority : int, higher priorities run first
+    + description : dictionary
+    + status : string ('queued', 'running', 'done' or 'failed')
+    + progress : double [0, 1]
+    + file_path : string
+    + error : string
+    + is_fetched : bool, the result of the finished job was sent to a client
+    """
+
+    def __init__(self, id, client, priority, description):
+        self.id = id
+        self.client = client
+        self.priority = priority
+        self.description = description
+        self.status = 'queued'
+        self.progress = 0.0
+        self.file_path = None
+        self.error = None
+        self.is_fetched = False
+
+        resolution = description['camera']['resolution']
+        self.ray_count = int(resolution[0])*int(resolution[1])
+
+        self.submit_time = time.time()
+        self.start_time = None
+        self.end_time = None
+
+        # recent events and the queues of the clients streaming the events
+        self.events = collections.deque(maxlen = job_event_history)
+        self.listeners = []
+
+    def summary(self):
+        """ returns the job status as a dictionary """
+        return {'job' : self.id, 'client' : self.client, 'priority' : self.priority, 'status' : self.status, 'progress' : self.progress, 'file_path' : self.file_path, 'error' : self.error}
+
+    def publish(self):
+        """ sends the current status to every listener """
+        event = self.summary()
+        self.events.append(event)
+        for listener in self.listeners:
+            listener.put_nowait(event)
+
+    def is_finished(self):
+        return self.status in ('done', 'failed')
+
+class JobQueue():
+    """ a priority queue of jobs that takes jobs of equal priority from each client in turn """
+
+    def __init__(self):
+        self._clients = {} # client => heap of (-priority, sequence number, job)
+        self._last_served = {} # client => turn the client was last served
+        self._sequence = 0
+        self._turn = 0
+
+    def push(self, job):
+        self._sequence += 1
+        heapq.heappush(self._clients.setdefault(job.client, []), (-job.priority, self._sequence, job))
+
+    def pop(self):
+        """ removes and returns the highest priority job. ties go to the client that was served least recently. """
+        client = min(self._clients, key = lambda c: (self._clients[c][0][0], self._last_served.get(c, -1)))
+        job = heapq.heappop(self._clients[client])[2]
+        if (len(self._clients[client]) == 0):
+            del self._clients[client]
+
+        self._turn += 1
+        self._last_served[client] = self._turn
+
+        return job
+
+    def __len__(self):
+        return sum(len(jobs) for jobs in self._clients.values())
+
+""" Service """
+class RenderService():
+    """
+    Queues render jobs and runs them on a pool of warm worker processes.
+
+    members:
+    + worker_count : int
+    + jobs : dictionary of job id => job, the queued, running and unfetched finished jobs
+    - queue : JobQueue
+    - finished : deque of (end time, status, ray count) of the jobs that finished within the throughput window
+    - finished_counts : dictionary of status => number of finished jobs
+    """
+
+    def __init__(self, worker_count = 2):
+        self.worker_count = worker_count
+        self.jobs = {}
+        self.queue = JobQueue()
+        self._next_id = 1
+        self._running = 0
+        self._finished = collections.deque()
+        self._finished_counts = {'done' : 0, 'failed' : 0}
+
+        # writers of the connections that started their response (see handle_connection)
+        self._responding = set()
+
+        # spawn instead of fork, so that workers don't inherit the event loop and threads of the service
+        context = multiprocessing.get_context("spawn")
+        self._executor = ProcessPoolExecutor(worker_count, mp_context = context, initializer = warm_worker)
+        self._manager = context.Manager()
+        self._events = self._manager.Queue()
+
+    async def serve(self, host = "localhost", port = 8080):
+        """ runs the service until it is cancelled """
+        self._loop = asyncio.get_running_loop()
+        self._job_available = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.worker_count)
+
+        # start the worker processes now instead of on the first job
+        await asyncio.gather(*[self._loop.run_in_executor(self._executor, time.sleep, 0.1) for w in range(self.worker_count)])
+
+        threading.Thread(target = self.pump_events, daemon = True).start()
+        dispatcher = asyncio.create_task(self.dispatch())
+
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print("Render service listening on {0}:{1} with {2} workers".format(host, port, self.worker_count))
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            dispatcher.cancel()
+            self._events.put(None)
+            self._executor.shutdown(cancel_futures = True)
+            self._manager.shutdown()
+
+    def submit(self, client, priority, description):
+        """ queues a new job and returns it """
+        self.evict_jobs()
+        job = Job(self._next_id, client, priority, description)
+        self._next_id += 1
+
+        self.jobs[job.id] = job
+        self.queue.push(job)
+        job.publish()
+        self._job_available.set()
+
+        return job
+
+    async def dispatch(self):
+        """ starts queued jobs whenever a worker is free """
+        while True:
+            await self._slots.acquire()
+            while (len(self.queue) == 0):
+                self._job_available.clear()
+                await self._job_available.wait()
+            asyncio.create_task(self.run_job(self.queue.pop()))
+
+    async def run_job(self, job):
+        """ runs a job on the worker pool """
+        job.status = 'running'
+        job.start_time = time.time()
+        self._running += 1
+        job.publish()
+
+        try:
+            job.file_path = await self._loop.run_in_executor(self._executor, render_job, job.id, job.description, self._events)
+            job.status = 'done'
+            job.progress = 1.0
+        except Exception as error:
+            job.status = 'failed'
+            job.error = str(error)
+        finally:
+            job.end_time = time.time()
+            self._running -= 1
+            self._slots.release()
+
+        self._finished.append((job.end_time, job.status, job.ray_count))
+        self._finished_counts[job.status] += 1
+        job.publish()
+
+    def evict_jobs(self):
+        """ drops the finished jobs whose result was fetched or that ended more than finished_job_lifetime seconds ago """
+        now = time.time()
+        evicted = [job.id for job in self.jobs.values() if job.is_finished() and (job.is_fetched or job.end_time < now - finished_job_lifetime)]
+        for job_id in evicted:
+            del self.jobs[job_id]
+
+        while (len(self._finished) > 0 and self._finished[0][0] <= now - throughput_window):
+            self._finished.popleft()
+
+    def pump_events(self):
+        """ forwards progress events from the worker processes to the event loop (runs in a thread) """
+        while True:
+            event = self._events.get()
+            if (event is None):
+                break
+            self._loop.call_soon_threadsafe(self.update_progress, event[0], event[1])
+
+    def update_progress(self, job_id, fraction):
+        job = self.jobs.get(job_id)
+        if (job is not None and job.status == 'running'):
+            job.progress = fraction
+            job.publish()
+
+    def stats(self):
+        """ returns the queue depth, running jobs and throughput of the service """
+        self.evict_jobs()
+
+        return {
+            'queued' : len(self.queue),
+            'running' : self._running,
+            'done' : self._finished_counts['done'],
+            'failed' : self._finished_counts['failed'],
+            'workers' : self.worker_count,
+            'jobs_per_minute' : len(self._finished) / throughput_window*60,
+            'rays_per_second' : sum(ray_count for end_time, status, ray_count in self._finished if status == 'done') / throughput_window,
+        }
+
+    """ HTTP """
+    async def handle_connection(self, reader, writer):
+        """ handles one HTTP request """
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            if (len(request_line) < 2):
+                return
+            method, path = request_line[0], request_line[1]
+
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1")
+                if (line.strip() == ""):
+                    break
+                key, value = line.split(":", 1)
+                headers[key.strip().lower()] = value.strip()
+
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+            await self.route(method, path.strip("/").split("/"), body, writer)
+        except Exception as error:
+            # a response that already started can't be replaced, and a client that disconnected can't be answered
+            if (writer not in self._responding):
+                try:
+                    await self.send_json(writer, 400, {'error' : str(error)})
+                except ConnectionError:
+                    pass
+        finally:
+            self._responding.discard(writer)
+            writer.close()
+
+    async def route(self, method, path, body, writer):
+        """ answers a request for the path (a list of path segments) """
+        self.evict_jobs()
+
+        if (method == 'POST' and path == ['jobs']):
+            request = json.loads(body)
+            job = self.submit(str(request.get('client', 'anonymous')), int(request.get('priority', 0)), request['description'])
+            await self.send_json(writer, 201, {'job' : job.id})
+
+        elif (method == 'GET' and path == ['stats']):
+            await self.send_json(writer, 200, self.stats())
+
+        elif (method == 'GET' and len(path) >= 2 and path[0] == 'jobs' and path[1].isdigit() and int(path[1]) in self.jobs):
+            job = self.jobs[int(path[1])]
+            if (len(path) == 2):
+                await self.send_json(writer, 200, job.summary())
+                job.is_fetched = job.is_fetched or job.status == 'failed'
+            elif (path[2:] == ['events']):
+                await self.stream_events(job, writer)
+            elif (path[2:] == ['image'] and job.status == 'done'):
+                with open(job.file_path, "rb") as file:
+                    data = file.read()
+                await self.send(writer, 200, "image/x-portable-pixmap", data)
+                job.is_fetched = True
+            else:
+                await self.send_json(writer, 404, {'error' : "not found"})
+
+        else:
+            await self.send_json(writer, 404, {'error' : "not found"})
+
+    async def stream_events(self, job, writer):
+        """ streams the events of a job as newline delimited JSON until the job finishes """
+        self._responding.add(writer)
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nConnection: close\r\n\r\n")
+
+        listener = asyncio.Queue()
+        job.listeners.append(listener)
+        try:
+            events = list(job.events)
+            while True:
+                for event in events:
+                    writer.write((json.dumps(event) + "\n").encode())
+                    if (event['status'] in ('done', 'failed')):
+                        await writer.drain()
+                        job.is_fetched = job.is_fetched or job.status == 'failed'
+                        return
+                await writer.drain()
+                events = [await listener.get()]
+        finally:
+            job.listeners.remove(listener)
+
+    async def send_json(self, writer, status, data):
+        await self.send(writer, status, "application/json", json.dumps(data).encode())
+
+    async def send(self, writer, status, content_type, data):
+        reasons = {200 : "OK", 201 : "Created", 400 : "Bad Request", 404 : "Not Found"}
+        self._responding.add(writer)
+        writer.write("HTTP/1.1 {0} {1}\r\nContent-Type: {2}\r\nContent-Length: {3}\r\nConnection: close\r\n\r\n".format(status, reasons[status], content_type, len(data)).encode())
+        writer.write(data)
+        await writer.drain()
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+    worker_count = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+
+    try:
+        asyncio.run(RenderService(worker_count).serve(port = port))
+    except KeyboardInterrupt:
+        pass
\ No newline at end of file
@@ -0,0 +1,86 @@
+# Handles deferred shading of captured geometry buffers
+
+# the colors, textures and checkered subdivisions of the masses and the background color don't change the path of any
+# ray, so a capture only has to be traced once for all of them. a capture with aovs = gbuffer_channels saves a geometry
+# buffer next to the image (see aovs.py): the hit mass and hit point of every ray that hits a mass, the escape
+# direction of every ray that escapes and the fill color of the pixels outside of a region capture. shade re-colors it
+# with other materials without tracing a ray.
+#
+# the hit points are kept in the tracing precision, so shading with the materials of the capture reproduces its image
+# exactly. changing the position, radius or mass of a mass, or the camera, needs a new capture.
+
+import os
+
+import numpy as np
+
+from aovs import aov_directory
+from tracer import mass_arrays
+from mass import texture_colors
+from functions import calculate_mass_surface_colors
+from image import create_ppm_memmap
+from constants import precisions, background_color
+
+# the AOV channels of a geometry buffer
+gbuffer_channels = ['mass_id', 'surface_point', 'escape_direction', 'fill_color']
+
+def load_gbuffer(image_file_path):
+    """ returns the geometry buffer saved next to an image file as a dictionary of channel name => [height, width(, 3)] array """
+    directory = aov_directory(image_file_path)
+    missing = [name for name in gbuffer_channels if not os.path.exists(os.path.join(directory, name + ".npy"))]
+    if (len(missing) > 0):
+        raise Exception("{0} has no geometry buffer channels {1}. Capture it with aovs = gbuffer_channels.".format(image_file_path, ", ".join(missing)))
+
+    return {name : np.load(os.path.join(directory, name + ".npy")) for name in gbuffer_channels}
+
+def shade(gbuffer, scene, precision = 'double', materials = None, background = background_color):
+    """ returns the [height, width, 3] uint8 pixels of a geometry buffer of the scene, captured with the precision.
+    materials is a dictionary of mass index => {'color', 'texture', 'checkered_subdivision'} that replaces the properties of the
+    masses (properties that are left out are kept). background is a color or a function of the (N,3) escape directions that returns (N,3) colors.
+    pixels outside of a region capture keep its fill color. rays that neither hit a mass nor escape were trapped and stay black. """
+    float_type = precisions[precision][0]
+    masses = mass_arrays(scene, float_type)
+
+    """ Materials """
+    checkered_subdivisions = np.array(masses.checkered_subdivision)
+    colors1 = np.array(masses.color1)
+    colors2 = np.array(masses.color2)
+    for m, material in ({} if materials is None else materials).items():
+        mass = scene.masses[m]
+        colors1[m], colors2[m] = texture_colors(material.get('color', mass.color), material.get('texture', mass.texture))
+        checkered_subdivisions[m] = material.get('checkered_subdivision', mass.checkered_subdivision)
+
+    mass_ids = gbuffer['mass_id'].reshape(-1)
+    surface_points = gbuffer['surface_point'].reshape(-1, 3)
+    escape_directions = gbuffer['escape_direction'].reshape(-1, 3)
+    pixels = np.zeros([mass_ids.shape[0], 3], dtype = np.uint8)
+
+    """ Hits """
+    # the hit points were recorded relative to the mass centers. they are shaded around the origin in the tracing precision.
+    is_hit = mass_ids >= 0
+    hit_masses = mass_ids[is_hit]
+    pixels[is_hit] = calculate_mass_surface_colors(surface_points[is_hit].astype(float_type), np.zeros(3, dtype = float_type), masses.radius[hit_masses], checkered_subdivisions[hit_masses], colors1[hit_masses], colors2[hit_masses])
+
+    """ Escapes """
+    is_escaped = ~is_hit & ~np.isnan(escape_directions[:, 0])
+    if (callable(background)):
+        pixels[is_escaped] = background(escape_directions[is_escaped])
+    else:
+        pixels[is_escaped] = background
+
+    """ Region Fill """
+    fill_colors = gbuffer['fill_color'].reshape(-1, 3)
+    is_filled = fill_colors[:, 0] >= 0
+    pixels[is_filled] = fill_colors[is_filled]
+
+    return pixels.reshape(gbuffer['mass_id'].shape + (3,))
+
+def shade_file(image_file_path, scene, file_name = None, precision = 'double', materials = None, background = background_color):
+    """ shades the geometry buffer saved next to an image file (see shade) into a new binary ppm image file and returns its path """
+    pixels = shade(load_gbuffer(image_file_path), scene, precision, materials, background)
+
+    file_path, image = create_ppm_memmap(pixels.shape[1], pixels.shape[0], file_name)
+    image[:] = pixels
+    image.flush()
+    del image
+
+    return file_path
\ No newline at end of file
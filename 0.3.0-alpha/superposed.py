@@ -0,0 +1,183 @@
+# Handles batched ray tracing through superposed scenes
+
+# superposed scenes may hold many masses with overlapping spheres of influence, so rays can't be traced
+# one soi at a time. instead every mass bends the rays at once in the weak-field limit: the refractive
+# index is superposed, n = 1 + sum(rs/r), and rays follow the optical Hamiltonian H = |p|^2/2 - n^2/2
+# (see functions.py). the sum and its gradient are evaluated with a Barnes-Hut octree (see octree.py),
+# so a step costs O(log n) per ray instead of O(n).
+#
+# close to a compact object the weak-field term of the closest mass is replaced by its exact isotropic
+# refractive index of the scene's metric (see metrics.py), so rays inside of its soi follow the same path as in an
+# isolated scene (plus the weak pull of the other masses). every metric has the weak-field index 1 + rs/r far away.
+#
+# steps are kick-drift-kick leapfrog steps. the field at the end of a step is reused for the first kick of the
+# next step, so a step costs one octree evaluation. the step size follows the distance to the closest mass
+# surface, which keeps steps from jumping over masses. the state is traced in float64.
+
+import numpy as np
+
+from constants import background_color, superposed_step_factor, superposed_min_step, superposed_deflection_tolerance, max_iterations
+from geometric_tests import ray_sphere_intersection_distances
+from octree import Octree
+from aovs import count_aov, record_hits, record_escapes
+from trajectories import record_trajectories, record_trajectory_escapes
+
+def scene_octree(scene, masses):
+    """ returns the Octree of the scene. it is kept on the scene and rebuilt only when masses are added. """
+    cached = getattr(scene, '_octree', None)
+    if (cached is None or cached[0] is not scene.masses):
+        cached = (scene.masses, Octree(masses.position, masses.rs, masses.radius, np.maximum(masses.soi_radius, masses.radius)))
+        scene._octree = cached
+
+    return cached[1]
+
+def superposed_field(positions, tree, masses):
+    """ returns the refractive index n, its (N,3) gradient, the closest mass, the clearance (distance to the closest mass surface) and
+    the soi the position is inside of (the closest mass, or -1) at the (N,3) positions """
+    potential, gradient, nearest_mass, clearance = tree.evaluate(positions)
+    n = 1 + potential
+
+    # inside of the soi of the closest mass, its weak-field term is replaced by the exact refractive index
+    near_positions = masses.position[np.maximum(nearest_mass, 0)].astype(np.float64)
+    near_offsets = positions - near_positions
+    near_distances = np.linalg.norm(near_offsets, axis = 1)
+    is_near = (nearest_mass >= 0) & (near_distances < masses.soi_radius[np.maximum(nearest_mass, 0)])
+
+    if (np.any(is_near)):
+        near_rs = masses.rs[nearest_mass[is_near]].astype(np.float64)
+        exact_n, exact_gradient = masses.metric.refractive_index_gradient(positions[is_near], near_positions[is_near], near_rs)
+        r = near_distances[is_near]
+
+        n[is_near] += exact_n - 1 - near_rs/r
+        gradient[is_near] += exact_gradient + (near_rs/r**3)[:, np.newaxis]*near_offsets[is_near]
+
+    return n, gradient, nearest_mass, clearance, np.where(is_near, nearest_mass, -1)
+
+def step_sizes(n, clearance):
+    """ returns the leapfrog step sizes. a step moves a ray about n*step, a fraction of its clearance. """
+    return np.maximum(superposed_step_factor*clearance, superposed_min_step) / n
+
+def trace_rays_superposed(ray_positions, ray_directions, scene, color_array, masses, show_progress = True, aovs = None, trajectories = None):
+    """ traces every ray through the superposed scene and stores the color of every ray in color_array (and the optional aovs, see aovs.py,
+    and paths, see trajectories.py) """
+    ray_count = ray_positions.shape[0]
+
+    """ There Are No Masses in the Scene """
+    if (masses.count == 0):
+        color_array[:] = background_color
+        return color_array
+
+    tree = scene_octree(scene, masses)
+
+    """ Initialization """
+    positions = np.array(ray_positions, dtype = np.float64)
+    directions = np.array(ray_directions, dtype = np.float64)
+    ray_indices = np.arange(ray_count)
+    record_trajectories(trajectories, ray_indices, positions, 0)
+
+    # outside of the bounding sphere of the masses and their sois, the field is weak enough to be left out:
+    # a ray leaving a sphere of radius R is bent by less than sum(rs)/R from there on.
+    # rays start on the bounding sphere, and rays that miss it are background.
+    bound_center = tree.center
+    bound_radius = max(tree.half_size*np.sqrt(3) + np.max(tree.reach), tree.rs[0] / superposed_deflection_tolerance)
+
+    is_outside = np.linalg.norm(positions - bound_center, axis = 1) > bound_radius
+    distances = ray_sphere_intersection_distances(positions[is_outside], directions[is_outside], bound_center, bound_radius)
+    is_missing = ~(distances >= 0)
+    positions[is_outside] += np.where(is_missing, 0, distances)[:, np.newaxis]*directions[is_outside]
+
+    is_done = np.full(ray_count, False)
+    is_done[np.flatnonzero(is_outside)[is_missing]] = True
+    color_array[is_done] = background_color
+    record_escapes(aovs, np.flatnonzero(is_done), directions[is_done], ray_directions[is_done])
+    record_trajectory_escapes(trajectories, np.flatnonzero(is_done), directions[is_done])
+
+    ray_indices = ray_indices[~is_done]
+    positions = positions[~is_done]
+    directions = directions[~is_done]
+
+    # photon momenta (|p| = n) and the field at the start
+    n, gradient, nearest_mass, clearance, soi_indices = superposed_field(positions, tree, masses)
+    count_aov(aovs, 'soi_visits', ray_indices[soi_indices != -1])
+    momenta = directions*n[:, np.newaxis]
+    forces = n[:, np.newaxis]*gradient
+
+    progress = -1
+    iteration = 0
+
+    """ For Every Active Ray """
+    while (ray_indices.shape[0] > 0):
+        """ Progress Bar """
+        # progress percentage, printed once per whole percent
+        percentage = int((ray_count - ray_indices.shape[0]) / ray_count*100)
+        if (show_progress and percentage != progress):
+            progress = percentage
+            print("{:.2f}".format(percentage), "%")
+
+        if (iteration == max_iterations):
+            # rays that are still active are trapped. they are colored black.
+            color_array[ray_indices] = 0
+            break
+        iteration += 1
+        count_aov(aovs, 'steps', ray_indices)
+
+        """ Leapfrog Step """
+        h = step_sizes(n, clearance)[:, np.newaxis]
+        momenta = momenta + h/2*forces
+        previous_positions = positions
+        positions = positions + h*momenta
+        previous_soi_indices = soi_indices
+        n, gradient, nearest_mass, clearance, soi_indices = superposed_field(positions, tree, masses)
+        forces = n[:, np.newaxis]*gradient
+        momenta = momenta + h/2*forces
+        count_aov(aovs, 'soi_visits', ray_indices[(soi_indices != -1) & (soi_indices != previous_soi_indices)])
+
+        """ Hits """
+        # the closest mass is hit if the step ends inside of it. the hit point is where the step's chord enters the mass.
+        is_hit = (nearest_mass >= 0) & (clearance <= 0)
+        if (np.any(is_hit)):
+            hit_masses = nearest_mass[is_hit]
+            hit_mass_positions = masses.position[hit_masses].astype(np.float64)
+            hit_radii = masses.radius[hit_masses].astype(np.float64)
+
+            chords = positions[is_hit] - previous_positions[is_hit]
+            chord_lengths = np.linalg.norm(chords, axis = 1)
+            hit_distances = ray_sphere_intersection_distances(previous_positions[is_hit], chords / chord_lengths[:, np.newaxis], hit_mass_positions, hit_radii)
+            hit_points = previous_positions[is_hit] + np.where(np.isfinite(hit_distances), np.clip(hit_distances, 0, chord_lengths), chord_lengths)[:, np.newaxis]*chords / chord_lengths[:, np.newaxis]
+
+            # hits are put exactly on the mass surface
+            surface_normals = hit_points - hit_mass_positions
+            surface_normals /= np.linalg.norm(surface_normals, axis = 1)[:, np.newaxis]
+            hit_points = hit_mass_positions + hit_radii[:, np.newaxis]*surface_normals
+
+            color_array[ray_indices[is_hit]] = masses.surface_colors(hit_points.astype(masses.position.dtype), hit_masses)
+            record_hits(aovs, ray_indices[is_hit], hit_masses, hit_points.astype(masses.position.dtype), momenta[is_hit], ray_directions[ray_indices[is_hit]], masses)
+            record_trajectories(trajectories, ray_indices[is_hit], hit_points, iteration, True)
+
+        """ Escapes """
+        # rays leaving the bounding sphere are background
+        offsets = positions - bound_center
+        is_escaping = ~is_hit & (np.sum(offsets*offsets, axis = 1) > bound_radius**2) & (np.sum(offsets*momenta, axis = 1) > 0)
+        color_array[ray_indices[is_escaping]] = background_color
+        record_escapes(aovs, ray_indices[is_escaping], momenta[is_escaping], ray_directions[ray_indices[is_escaping]])
+        record_trajectory_escapes(trajectories, ray_indices[is_escaping], momenta[is_escaping])
+
+        # the hit rays were recorded at their hit points
+        if (trajectories is not None):
+            record_trajectories(trajectories, ray_indices[~is_hit], positions[~is_hit], iteration, is_escaping[~is_hit])
+
+        """ Update Active Rays """
+        is_active = ~is_hit & ~is_escaping
+        ray_indices = ray_indices[is_active]
+        positions = positions[is_active]
+        momenta = momenta[is_active]
+        forces = forces[is_active]
+        n = n[is_active]
+        clearance = clearance[is_active]
+        soi_indices = soi_indices[is_active]
+
+    # progress percentage
+    if (show_progress):
+        print("{:.2f}".format(100), "%")
+
+    return color_array
\ No newline at end of file
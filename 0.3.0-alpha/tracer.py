@@ -0,0 +1,461 @@
+# Handles batched ray tracing
+
+# the outside soi / inside soi algorithm of non_linear_ray_tracer_functions.py, but every ray is advanced
+# at once with numpy arrays instead of one ray at a time. ray state is kept in the dtype of the ray arrays,
+# so float32 rays are traced in float32.
+
+# outside of the sois, rays travel in straight lines to the closest mass or soi (ray-sphere intersections).
+# inside of an soi, there are no intersection tests. the mass surface and the soi boundary are events:
+# r - radius and r - soi radius are monitored for sign changes, and the crossing is located within the
+# last step with a few root finding iterations (see locate_crossings).
+
+# rays that enter an soi far from the mass (rs/L small) may skip the steps inside of it: their exit position and
+# direction follow in closed form from the angle they sweep (see weak_field_passes), if its error bound is within
+# the weak-field tolerance.
+
+# integrators:
+# 'euler' evolves a unit direction with the direction_step of the scene's metric and renormalizes it after every step.
+# 'leapfrog' and 'yoshida' evolve the photon momentum (|p| = n) with a symplectic scheme (see functions.py).
+# every step goes through the metric of the scene (see metrics.py), Schwarzschild by default.
+# inside of an soi their "directions" hold the momentum, which is normalized back to a direction when the ray leaves.
+
+# the working set of trace_rays only holds rays that are still being traced, ordered by the soi they are in: the rays
+# outside of every soi come first, followed by one contiguous bin per mass (see mass_bins). steps inside of an soi
+# run once per bin on slices of the working set with the parameters of that one mass. sois holding only a few rays
+# are stepped together with per ray mass parameters, where a call per mass would cost more than it saves. finished
+# rays are compacted out (and the bins reordered) only on iterations where a ray finished or entered or left an soi.
+
+import numpy as np
+
+from constants import background_color, dt, symplectic_dt, max_iterations, event_iterations, weak_field_tolerance, weak_field_max_ratio, min_bin_rays
+from geometric_tests import ray_sphere_intersection_distances
+from aovs import count_aov, record_hits, record_escapes
+from trajectories import record_trajectories, record_trajectory_escapes
+from functions import calculate_mass_surface_colors, weak_field_sweep, weak_field_sweep_error, weak_field_closest_approach
+from metrics import euler_step, leapfrog_step, yoshida_step
+
+# integrator => step function (taking the metric last), step size
+integrators = {
+    'euler' : (euler_step, dt),
+    'leapfrog' : (leapfrog_step, symplectic_dt),
+    'yoshida' : (yoshida_step, symplectic_dt),
+}
+
+def integrator_step(integrator, step_size = None):
+    """ returns the step function of the integrator and the step size, which is the integrator's own (see integrators) if step_size is None """
+    integrate, default_step_size = integrators[integrator]
+    return integrate, default_step_size if step_size is None else step_size
+
+class MassArrays():
+    """
+    The per-mass constants of a scene packed into numpy arrays for batched tracing.
+    soi_factor is the scene's by default. it may be changed to study its effect (see convergence.py).
+
+    members:
+    + count : int
+    + metric : Metric (see metrics.py)
+    + position : np array of np vec3
+    + radius : np array of double
+    + rs : np array of double
+    + soi_radius : np array of double
+    + checkered_subdivision : np array of double
+    + color1 : np array of np vec3 (int64)
+    + color2 : np array of np vec3 (int64)
+    """
+
+    def __init__(self, scene, dtype = np.float64, soi_factor = None):
+        masses = scene.masses
+        if (soi_factor is None):
+            soi_factor = scene.soi_factor
+
+        self.count = masses.shape[0]
+        self.metric = scene.metric
+        self.position = np.array([mass.position for mass in masses], dtype = dtype).reshape([self.count, 3])
+        self.radius = np.array([mass.radius for mass in masses], dtype = dtype)
+        self.rs = np.array([mass.rs for mass in masses], dtype = dtype)
+        self.soi_radius = self.metric.soi_radius(self.rs, dtype(soi_factor)).astype(dtype)
+        self.checkered_subdivision = np.array([mass.checkered_subdivision for mass in masses], dtype = dtype)
+        self.color1 = np.array([mass.color1 for mass in masses], dtype = np.int64).reshape([self.count, 3])
+        self.color2 = np.array([mass.color2 for mass in masses], dtype = np.int64).reshape([self.count, 3])
+
+    def surface_colors(self, intersection_points, mass_indices):
+        """ returns the surface colors of the masses mass_indices at the intersection points """
+        return calculate_mass_surface_colors(intersection_points, self.position[mass_indices], self.radius[mass_indices], self.checkered_subdivision[mass_indices], self.color1[mass_indices], self.color2[mass_indices])
+
+def mass_arrays(scene, dtype = np.float64, soi_factor = None):
+    """ returns the MassArrays of the scene for the dtype and soi_factor (the scene's by default). they are kept on the scene and rebuilt only when masses are added. """
+    if not hasattr(scene, '_mass_arrays'):
+        scene._mass_arrays = {}
+    
+    # adding a mass replaces the scene's masses array
+    key = (dtype, scene.soi_factor if soi_factor is None else soi_factor)
+    cached = scene._mass_arrays.get(key)
+    if (cached is None or cached[0] is not scene.masses):
+        cached = (scene.masses, MassArrays(scene, dtype, key[1]))
+        scene._mass_arrays[key] = cached
+    
+    return cached[1]
+
+def closest_intersections(distances):
+    """ takes an array of ray-sphere distances (one row per ray) and returns the index and distance of the closest forward intersection of every row (distance is inf when there is none) """
+    # negative and nan distances are not intersections. set them to +infinity so that the lowest non-negative one may be easily found.
+    distances = np.where(distances >= 0, distances, np.inf)
+    indices = np.argmin(distances, axis = 1)
+    return indices, distances[np.arange(distances.shape[0]), indices]
+
+def find_soi_indices(ray_positions, masses):
+    """ returns the index of the soi every ray starts inside of, or -1 if the ray starts outside of every soi """
+    soi_indices = np.full(ray_positions.shape[0], -1, dtype = np.int64)
+
+    # the first soi containing the ray wins, as in Camera.capture
+    for m in reversed(range(masses.count)):
+        inside = np.linalg.norm(ray_positions - masses.position[m], axis = 1) < masses.soi_radius[m]
+        soi_indices[inside] = m
+
+    return soi_indices
+
+def mass_bins(soi_indices):
+    """ returns the (soi indices, rays) bins of soi indices that are ordered by soi. rays selects the rays of a bin from the working set.
+    the rays outside of every soi are one bin with soi index -1, and the rays of every soi with at least min_bin_rays rays
+    are a slice with its mass index. the rays of the smaller sois are put together in one bin with their array of soi indices. """
+    starts = np.concatenate([[0], np.flatnonzero(soi_indices[1:] != soi_indices[:-1]) + 1])
+    ends = np.append(starts[1:], soi_indices.shape[0])
+
+    bins = []
+    is_mixed = np.full(soi_indices.shape[0], False)
+    for soi_index, start, end in zip(soi_indices[starts], starts, ends):
+        if (soi_index != -1 and end - start < min_bin_rays):
+            is_mixed[start:end] = True
+        else:
+            bins.append((soi_index, slice(start, end)))
+
+    if (np.any(is_mixed)):
+        bins.append((soi_indices[is_mixed], is_mixed))
+
+    return bins
+
+def normalize_rows(vectors):
+    """ returns the (N,3) vectors divided by their lengths """
+    return vectors / np.linalg.norm(vectors, axis = 1)[:, np.newaxis]
+
+def to_momenta(ray_positions, ray_directions, soi_indices, masses):
+    """ returns the photon momenta (|p| = n) of rays with unit directions inside of the soi of the masses soi_indices """
+    n = masses.metric.refractive_index(ray_positions, masses.position[soi_indices], masses.rs[soi_indices])
+    return ray_directions*n[:, np.newaxis]
+
+def weak_field_passes(ray_positions, ray_directions, soi_indices, masses, tolerance):
+    """ takes rays on the boundary of the soi of the masses soi_indices that are heading in.
+    returns the mask of the rays that pass through the soi in closed form within the tolerance [radians] and their exit positions and directions.
+    the impact parameter threshold follows from the tolerance: rays pass if 10 (rs/L)^4 (1 + 1/cos(psi)^2) <= tolerance (see weak_field_sweep_error).
+    L is at most about the soi radius, so rays only pass through the sois of scenes with a large soi_factor (about 50 or more for the default tolerance). """
+    mass_positions = masses.position[soi_indices].astype(np.float64)
+    rs = masses.rs[soi_indices].astype(np.float64)
+    soi_radii = masses.soi_radius[soi_indices].astype(np.float64)
+    radii = masses.radius[soi_indices].astype(np.float64)
+
+    # orbital plane: the radial direction at entry and the tangential direction of motion
+    x = ray_positions.astype(np.float64) - mass_positions
+    radial = normalize_rows(x)
+    cos_psi = -np.sum(ray_directions*radial, axis = 1)
+    tangent = ray_directions + cos_psi[:, np.newaxis]*radial
+    sin_psi = np.linalg.norm(tangent, axis = 1)
+    tangent = tangent / np.maximum(sin_psi, np.finfo(np.float64).tiny)[:, np.newaxis]
+
+    # angular momentum L = n R sin(psi), conserved along the ray
+    u = rs/(4*soi_radii)
+    L = (1+u)**3/(1-u)*soi_radii*sin_psi
+
+    # the series only holds for rs << L. the error bound and closest approach are only evaluated where it does.
+    is_passing = rs <= weak_field_max_ratio*L
+    is_passing[is_passing] = (weak_field_sweep_error(L[is_passing], rs[is_passing], soi_radii[is_passing]) <= tolerance) & (weak_field_closest_approach(L[is_passing], rs[is_passing]) > radii[is_passing])
+
+    # the ray leaves the soi at the swept angle, at the same angle to the radial direction as it entered (n is the same)
+    sweep = weak_field_sweep(L[is_passing], rs[is_passing], soi_radii[is_passing])[:, np.newaxis]
+    exit_radial = np.cos(sweep)*radial[is_passing] + np.sin(sweep)*tangent[is_passing]
+    exit_tangent = -np.sin(sweep)*radial[is_passing] + np.cos(sweep)*tangent[is_passing]
+
+    # exits are put just outside of the soi so that the next outside step does not find it again
+    dtype = ray_positions.dtype
+    exit_positions = mass_positions[is_passing] + (soi_radii[is_passing]*(1 + 8*np.finfo(dtype).eps))[:, np.newaxis]*exit_radial
+    exit_directions = cos_psi[is_passing, np.newaxis]*exit_radial + sin_psi[is_passing, np.newaxis]*exit_tangent
+
+    return is_passing, exit_positions.astype(dtype), exit_directions.astype(dtype)
+
+def outside_soi_step(ray_positions, ray_directions, masses, integrator = 'euler', weak_field_tolerance = None):
+    """ batched outside_soi. moves rays to the closest mass or soi intersection.
+    rays that can pass through the soi they reach in closed form within the weak_field_tolerance are moved to its exit instead.
+    returns the hit mask, hit mass indices, entered soi mask, entered soi indices, passed soi mask and the advanced ray positions and directions """
+    # every ray against every mass: (N,1,3) against (1,M,3) => (N,M)
+    mass_indices, mass_distances = closest_intersections(ray_sphere_intersection_distances(ray_positions[:, np.newaxis], ray_directions[:, np.newaxis], masses.position, masses.radius))
+    soi_indices, soi_distances = closest_intersections(ray_sphere_intersection_distances(ray_positions[:, np.newaxis], ray_directions[:, np.newaxis], masses.position, masses.soi_radius))
+
+    is_mass_intersection = np.isfinite(mass_distances)
+    is_soi_intersection = np.isfinite(soi_distances)
+
+    # the mass wins ties with the soi
+    is_hit = is_mass_intersection & (~is_soi_intersection | (mass_distances <= soi_distances))
+    is_entering = is_soi_intersection & ~is_hit
+
+    # move the hits to the mass surface
+    ray_positions = ray_positions.copy()
+    ray_directions = ray_directions.copy()
+    ray_positions[is_hit] += mass_distances[is_hit, np.newaxis]*ray_directions[is_hit]
+
+    # move the entering rays to the soi boundary. the steps inside of the soi start from there.
+    ray_positions[is_entering] += soi_distances[is_entering, np.newaxis]*ray_directions[is_entering]
+
+    # rays far from the mass skip the steps and leave the soi in closed form
+    is_passing = np.full(ray_positions.shape[0], False)
+    if (weak_field_tolerance is not None and np.any(is_entering)):
+        is_passing[is_entering], exit_positions, exit_directions = weak_field_passes(ray_positions[is_entering], ray_directions[is_entering], soi_indices[is_entering], masses, weak_field_tolerance)
+        ray_positions[is_passing] = exit_positions
+        ray_directions[is_passing] = exit_directions
+        is_entering &= ~is_passing
+
+    entering_indices = soi_indices[is_entering]
+    if (integrator != 'euler'):
+        ray_directions[is_entering] = to_momenta(ray_positions[is_entering], ray_directions[is_entering], entering_indices, masses)
+
+    return is_hit, mass_indices, is_entering, soi_indices, is_passing, ray_positions, ray_directions
+
+def partial_steps(ray_positions, ray_directions, mass_positions, schwarzschild_radii, integrator, fractions, metric, step_size = None):
+    """ returns the ray positions and directions after a step of fractions*step_size of the integrator in the metric (fractions has one value per ray) """
+    integrate, step_size = integrator_step(integrator, step_size)
+    dx, dp = integrate(ray_positions, ray_directions, mass_positions, schwarzschild_radii, step_size*fractions[:, np.newaxis], metric)
+    return ray_positions + dx, ray_directions + dp
+
+def locate_crossings(ray_positions, ray_directions, mass_positions, schwarzschild_radii, integrator, metric, radii, low, high, g_low, g_high, step_size = None):
+    """ finds the fraction of a step at which g = |x - mass position| - radius changes sign between the fractions low and high (g_low and g_high have opposite signs).
+    uses a few iterations of the illinois (modified false position) method and returns the narrowed low and high fractions. """
+    # which end was kept by the last iteration, for the illinois modification
+    side = np.zeros(low.shape[0], dtype = np.int64)
+
+    for i in range(event_iterations):
+        fractions = high - g_high*(high - low)/(g_high - g_low)
+        fractions = np.where(np.isfinite(fractions), fractions, (low + high)/2)
+
+        positions, directions = partial_steps(ray_positions, ray_directions, mass_positions, schwarzschild_radii, integrator, fractions, metric, step_size)
+        g = np.linalg.norm(positions - mass_positions, axis = 1) - radii
+
+        is_low_side = np.sign(g) == np.sign(g_low)
+
+        # replace the end with the same sign. if the same end is replaced twice in a row, the other end's g is halved.
+        g_high = np.where(is_low_side & (side == 1), g_high/2, g_high)
+        g_low = np.where(~is_low_side & (side == -1), g_low/2, g_low)
+
+        low = np.where(is_low_side, fractions, low)
+        g_low = np.where(is_low_side, g, g_low)
+        high = np.where(is_low_side, high, fractions)
+        g_high = np.where(is_low_side, g_high, g)
+
+        side = np.where(is_low_side, 1, -1)
+
+    return low, high
+
+def inside_soi_step(ray_positions, ray_directions, soi_indices, masses, integrator = 'euler', step_size = None):
+    """ batched inside_soi. takes one integration step for every ray inside of the soi of the mass soi_indices
+    (one mass index for every ray, or an array with the mass index of each ray). step_size replaces the integrator's step size if it is given.
+    returns the hit mask, exited soi mask and the advanced ray positions and directions (momenta for the symplectic integrators, until the ray exits) """
+    # this code assumes that there are no masses within the sphere of influence (except the central mass).
+    # the parameters of a single mass are broadcast to every ray instead of being gathered per ray.
+    mass_position = masses.position[soi_indices]
+    schwarzschild_radius = masses.rs[soi_indices]
+    radius = masses.radius[soi_indices]
+    soi_radius = masses.soi_radius[soi_indices]
+
+    is_per_ray = np.ndim(soi_indices) > 0
+    def select(values, mask):
+        """ returns the mass parameter values of the masked rays """
+        return values[mask] if is_per_ray else values
+
+    # integration for the following steps
+    integrate, step_size = integrator_step(integrator, step_size)
+    dx, dp = integrate(ray_positions, ray_directions, mass_position, schwarzschild_radius, step_size, masses.metric)
+
+    # the boundaries are events: r - radius and r - soi radius change sign within the step
+    x0 = ray_positions - mass_position
+    x1 = x0 + dx
+    r0 = np.linalg.norm(x0, axis = 1)
+    r1 = np.linalg.norm(x1, axis = 1)
+
+    ray_positions = ray_positions.copy()
+    ray_directions = ray_directions.copy()
+
+    """ Mass Events """
+    # the mass is hit if the step ends inside of it. rays that dip below the surface in the middle of the
+    # step and come back out are caught with the closest approach of the step's chord to the mass.
+    chord_fractions = np.clip(-np.sum(x0*dx, axis = 1) / np.maximum(np.sum(dx*dx, axis = 1), np.finfo(dx.dtype).tiny), 0, 1)
+    chord_distances = np.linalg.norm(x0 + chord_fractions[:, np.newaxis]*dx, axis = 1)
+
+    is_hit = r1 <= radius
+    hit_fractions = np.ones(r1.shape[0], dtype = dx.dtype)
+    hit_g = r1 - radius
+
+    is_dipping = ~is_hit & (chord_distances < radius)
+    if (np.any(is_dipping)):
+        # the chord only approximates a curved step. check the real position at that fraction of the step.
+        dipping_positions, dipping_directions = partial_steps(ray_positions[is_dipping], ray_directions[is_dipping], select(mass_position, is_dipping), select(schwarzschild_radius, is_dipping), integrator, chord_fractions[is_dipping], masses.metric, step_size)
+        dipping_g = np.linalg.norm(dipping_positions - select(mass_position, is_dipping), axis = 1) - select(radius, is_dipping)
+
+        is_dipping[is_dipping] = dipping_g <= 0
+        hit_fractions[is_dipping] = chord_fractions[is_dipping]
+        hit_g[is_dipping] = dipping_g[dipping_g <= 0]
+        is_hit |= is_dipping
+
+    if (np.any(is_hit)):
+        low, high = locate_crossings(ray_positions[is_hit], ray_directions[is_hit], select(mass_position, is_hit), select(schwarzschild_radius, is_hit), integrator, masses.metric, select(radius, is_hit), np.zeros(np.sum(is_hit), dtype = dx.dtype), hit_fractions[is_hit], (r0 - radius)[is_hit], hit_g[is_hit], step_size)
+        hit_positions, hit_directions = partial_steps(ray_positions[is_hit], ray_directions[is_hit], select(mass_position, is_hit), select(schwarzschild_radius, is_hit), integrator, (low + high)/2, masses.metric, step_size)
+
+        # hits are put exactly on the mass surface
+        surface_normals = normalize_rows(hit_positions - select(mass_position, is_hit))
+        ray_positions[is_hit] = select(mass_position, is_hit) + np.reshape(select(radius, is_hit), (-1, 1))*surface_normals
+        ray_directions[is_hit] = hit_directions
+
+    """ SOI Events """
+    # the ray exits if the step ends outside of the soi
+    is_exiting = ~is_hit & (r1 >= soi_radius)
+
+    # rays that started inside are moved to just outside of the boundary crossing.
+    # rays that started on the boundary (they just entered and are grazing the soi) keep the whole step.
+    is_crossing = is_exiting & (r0 < soi_radius)
+    if (np.any(is_crossing)):
+        low, high = locate_crossings(ray_positions[is_crossing], ray_directions[is_crossing], select(mass_position, is_crossing), select(schwarzschild_radius, is_crossing), integrator, masses.metric, select(soi_radius, is_crossing), np.zeros(np.sum(is_crossing), dtype = dx.dtype), np.ones(np.sum(is_crossing), dtype = dx.dtype), (r0 - soi_radius)[is_crossing], (r1 - soi_radius)[is_crossing], step_size)
+        ray_positions[is_crossing], ray_directions[is_crossing] = partial_steps(ray_positions[is_crossing], ray_directions[is_crossing], select(mass_position, is_crossing), select(schwarzschild_radius, is_crossing), integrator, high, masses.metric, step_size)
+
+    """ Steps """
+    is_moving = (is_exiting & ~is_crossing) | (~is_hit & ~is_exiting)
+    ray_positions[is_moving] += dx[is_moving]
+    ray_directions[is_moving] += dp[is_moving]
+
+    if (integrator == 'euler'):
+        ray_directions[~is_hit] = normalize_rows(ray_directions[~is_hit])
+    else:
+        # the symplectic integrators conserve |p| = n and are not renormalized. rays leaving the soi get their direction back.
+        ray_directions[is_exiting] = normalize_rows(ray_directions[is_exiting])
+
+    return is_hit, is_exiting, ray_positions, ray_directions
+
+def trace_rays(ray_positions, ray_directions, scene, color_array, masses = None, show_progress = True, integrator = 'euler', gravitational_wave = None, time = 0.0, weak_field_tolerance = weak_field_tolerance, aovs = None, trajectories = None, step_size = None):
+    """ traces every ray through the scene and stores the color of every ray in color_array.
+    masses may be passed in to use other MassArrays than the ones cached on the scene.
+    integrator is 'euler', 'leapfrog' or 'yoshida'. superposed scenes are always traced with leapfrog steps.
+    with a gravitational_wave {'amplitude' : a, 'frequency' : w}, rays are traced through a plus polarized
+    gravitational wave instead, leaving the camera at time (see gravitational_wave.py).
+    rays pass through an soi in closed form where that is accurate to weak_field_tolerance [radians] (None integrates every ray, as do metrics without a weak-field sweep).
+    aovs is an optional dictionary of channel name => array with one value per ray that is filled in the same pass (see aovs.py).
+    trajectories is an optional TrajectoryRecorder that records the paths of every ray (see trajectories.py).
+    step_size replaces the step size of the integrator (see integrators) for this trace. superposed scenes and gravitational waves take their own steps. """
+    if (integrator not in integrators):
+        raise Exception("'{0}' is not a supported integrator. Use one of: {1}".format(integrator, ", ".join(integrators)))
+    if (masses is None):
+        masses = mass_arrays(scene, ray_positions.dtype.type)
+
+    if (gravitational_wave is not None):
+        from gravitational_wave import trace_rays_gravitational_wave
+        return trace_rays_gravitational_wave(ray_positions, ray_directions, scene, color_array, masses, gravitational_wave['amplitude'], gravitational_wave['frequency'], time, show_progress, aovs, trajectories)
+
+    # superposed scenes bend rays with every mass at once (see superposed.py)
+    if (scene.superposed):
+        from superposed import trace_rays_superposed
+        return trace_rays_superposed(ray_positions, ray_directions, scene, color_array, masses, show_progress, aovs, trajectories)
+
+    ray_count = ray_positions.shape[0]
+
+    """ There Are No Masses in the Scene """
+    if (masses.count == 0):
+        color_array[:] = background_color
+        return color_array
+
+    # the closed form sweep through an soi is a series of the Schwarzschild metric
+    if (not masses.metric.has_weak_field_sweep):
+        weak_field_tolerance = None
+
+    """ Initialization """
+    # working copies of the ray state for the rays that are still being traced
+    positions = np.array(ray_positions)
+    directions = np.array(ray_directions)
+    ray_indices = np.arange(ray_count)
+    soi_indices = find_soi_indices(positions, masses)
+    count_aov(aovs, 'soi_visits', ray_indices[soi_indices != -1])
+    record_trajectories(trajectories, ray_indices, positions, 0)
+
+    # rays that start inside of an soi need a momentum for the symplectic integrators
+    if (integrator != 'euler'):
+        inside = soi_indices != -1
+        directions[inside] = to_momenta(positions[inside], directions[inside], soi_indices[inside], masses)
+
+    # order the working set by soi (see mass_bins)
+    order = np.argsort(soi_indices, kind = 'stable')
+    ray_indices, positions, directions, soi_indices = ray_indices[order], positions[order], directions[order], soi_indices[order]
+
+    progress = -1
+    iteration = 0
+
+    """ For Every Active Ray """
+    while (ray_indices.shape[0] > 0):
+        """ Progress Bar """
+        # progress percentage, printed once per whole percent
+        percentage = int((ray_count - ray_indices.shape[0]) / ray_count*100)
+        if (show_progress and percentage != progress):
+            progress = percentage
+            print("{:.2f}".format(percentage), "%")
+
+        if (iteration == max_iterations):
+            # rays that are still active are trapped (orbiting the mass). they are colored black.
+            color_array[ray_indices] = 0
+            break
+        iteration += 1
+        count_aov(aovs, 'steps', ray_indices)
+
+        is_done = np.full(ray_indices.shape[0], False)
+
+        """ For Every Bin """
+        for bin_soi_indices, rays in mass_bins(soi_indices):
+            bin_indices = ray_indices[rays]
+
+            if (np.ndim(bin_soi_indices) == 0 and bin_soi_indices == -1):
+                """ Outside of Every SOI """
+                is_hit, mass_indices, is_entering, entered_indices, is_passing, positions[rays], directions[rays] = outside_soi_step(positions[rays], directions[rays], masses, integrator, weak_field_tolerance)
+
+                is_background = ~is_hit & ~is_entering & ~is_passing
+                color_array[bin_indices[is_background]] = background_color
+                color_array[bin_indices[is_hit]] = masses.surface_colors(positions[rays][is_hit], mass_indices[is_hit])
+
+                record_escapes(aovs, bin_indices[is_background], directions[rays][is_background], ray_directions[bin_indices[is_background]])
+                record_trajectory_escapes(trajectories, bin_indices[is_background], directions[rays][is_background])
+                record_hits(aovs, bin_indices[is_hit], mass_indices[is_hit], positions[rays][is_hit], directions[rays][is_hit], ray_directions[bin_indices[is_hit]], masses)
+                count_aov(aovs, 'soi_visits', bin_indices[is_entering | is_passing])
+
+                soi_indices[rays] = np.where(is_entering, entered_indices, -1)
+                is_done[rays] = is_hit | is_background
+            else:
+                """ Inside of an SOI """
+                is_hit, is_exiting, positions[rays], directions[rays] = inside_soi_step(positions[rays], directions[rays], bin_soi_indices, masses, integrator, step_size)
+
+                hit_masses = np.broadcast_to(bin_soi_indices, is_hit.shape)[is_hit]
+                color_array[bin_indices[is_hit]] = masses.surface_colors(positions[rays][is_hit], hit_masses)
+                record_hits(aovs, bin_indices[is_hit], hit_masses, positions[rays][is_hit], directions[rays][is_hit], ray_directions[bin_indices[is_hit]], masses)
+
+                soi_indices[rays] = np.where(is_exiting, -1, bin_soi_indices)
+                is_done[rays] = is_hit
+
+        record_trajectories(trajectories, ray_indices, positions, iteration, is_done)
+
+        """ Update Active Rays """
+        # remove finished rays from the working set and move rays that entered or left an soi to their bin
+        is_binned = np.all(soi_indices[1:] >= soi_indices[:-1])
+        if (np.any(is_done) or not is_binned):
+            order = np.flatnonzero(~is_done)
+            if (not is_binned):
+                order = order[np.argsort(soi_indices[order], kind = 'stable')]
+
+            ray_indices = ray_indices[order]
+            positions = positions[order]
+            directions = directions[order]
+            soi_indices = soi_indices[order]
+
+    # progress percentage
+    if (show_progress):
+        print("{:.2f}".format(100), "%")
+
+    return color_array
\ No newline at end of file
@@ -0,0 +1,138 @@
+# Handles recording the photon paths of selected pixels
+
+# debugging an odd pixel means looking at the path its photon took. the vpython arrows of camera_11-2-23.py drew every
+# step of every ray and are far too slow for real images. a TrajectoryRecorder is passed to a capture with a few pixels
+# (see Camera.capture): their rays are split off and traced in a batch of their own, which records the position of every
+# ray every decimation-th tracer iteration (and where it starts and ends). rays that escape to the background end where
+# they leave the masses behind and continue in a straight line along their escape direction. the rays of every other
+# pixel are traced exactly as without a recorder.
+#
+# the paths are saved to a compressed .npz file:
+# - pixels : (R,2) int32, [x, y] of every recorded pixel
+# - offsets : (R+1,) int64, the points of pixels[r] are points[offsets[r]:offsets[r + 1]]
+# - points : (P,3) float32, the recorded positions
+# - iterations : (P,) uint32, the tracer iteration of every point (0 is the camera)
+# - escape_directions : (R,3) float32, the unit direction in which the ray of pixels[r] escapes (nan if it hits a mass or is trapped)
+#
+# rays that pass through an soi in closed form jump across it (see tracer.weak_field_passes). capture with
+# weak_field_tolerance = None to record those steps too.
+
+import os
+
+import numpy as np
+
+from constants import trajectory_decimation
+
+class TrajectoryRecorder():
+    """
+    Records the photon paths of selected pixels during a capture.
+
+    members:
+    + pixels : np array of [x, y]
+    + decimation : int, every decimation-th tracer iteration is recorded
+    - ray_pixels : np array, the index into pixels of every ray of the recorded batch
+    - records : list of (pixel indices, iterations, points)
+    - escape_directions : np array of [x, y, z], the escape direction of every pixel (nan if its ray doesn't escape)
+
+    methods:
+    - ray_mask(ray_pixels : np array of flat pixel indices, width : int) => np array of bool
+    - start(ray_pixels : np array of flat pixel indices, width : int)
+    - record(ray_indices, positions, iteration : int, is_final : bool or np array of bool)
+    - record_escapes(ray_indices, directions)
+    + arrays() => dictionary of the .npz arrays
+    + trajectories() => dictionary (x, y) => (iterations, points, escape direction)
+    + save(file_path : string) => file path
+    """
+
+    def __init__(self, pixels, decimation = trajectory_decimation):
+        self.pixels = np.array(pixels, dtype = np.int64).reshape([-1, 2])
+        self.decimation = int(decimation)
+        if (self.decimation < 1):
+            raise Exception("A trajectory decimation must be at least 1.")
+
+        # every pixel has one ray, so a repeated pixel would leave one of its entries without a path
+        unique_pixels, counts = np.unique(self.pixels, axis = 0, return_counts = True)
+        if (np.any(counts > 1)):
+            raise Exception("The trajectory pixels {0} are listed more than once.".format(unique_pixels[counts > 1].tolist()))
+
+        self.ray_pixels = np.zeros(0, dtype = np.int64)
+        self.records = []
+        self.escape_directions = np.full([self.pixels.shape[0], 3], np.nan, dtype = np.float32)
+
+    def ray_mask(self, ray_pixels, width):
+        """ returns which of the rays with the flat pixel indices y*width + x are recorded """
+        return np.isin(ray_pixels, self.pixels[:, 1]*width + self.pixels[:, 0])
+
+    def start(self, ray_pixels, width):
+        """ starts recording the batch of rays with the flat pixel indices (see ray_mask). earlier records are dropped. """
+        flat_pixels = self.pixels[:, 1]*width + self.pixels[:, 0]
+        order = np.argsort(flat_pixels, kind = 'stable')
+        self.ray_pixels = order[np.searchsorted(flat_pixels[order], ray_pixels)]
+        self.records = []
+        self.escape_directions[:] = np.nan
+
+    def record(self, ray_indices, positions, iteration, is_final = False):
+        """ records the (N,3) positions of the rays of the batch at the iteration. rays that are final (True, False or a mask)
+        end at the iteration and are recorded even between the decimated iterations. """
+        if (iteration % self.decimation != 0):
+            if (is_final is False):
+                return
+            if (is_final is not True):
+                ray_indices, positions = ray_indices[is_final], positions[is_final]
+        if (ray_indices.shape[0] == 0):
+            return
+
+        self.records.append((self.ray_pixels[ray_indices], np.full(ray_indices.shape[0], iteration, dtype = np.uint32), np.array(positions, dtype = np.float32)))
+
+    def record_escapes(self, ray_indices, directions):
+        """ records the (N,3) directions (or momenta) in which the rays of the batch escape to the background """
+        if (ray_indices.shape[0] == 0):
+            return
+        directions = np.array(directions, dtype = np.float64)
+        self.escape_directions[self.ray_pixels[ray_indices]] = directions / np.linalg.norm(directions, axis = 1)[:, np.newaxis]
+
+    def arrays(self):
+        """ returns the recorded points ordered by pixel (in the order of pixels) and iteration, as the arrays of the .npz file """
+        if (len(self.records) == 0):
+            pixel_indices, iterations, points = np.zeros(0, dtype = np.int64), np.zeros(0, dtype = np.uint32), np.zeros([0, 3], dtype = np.float32)
+        else:
+            pixel_indices, iterations, points = [np.concatenate(values) for values in zip(*self.records)]
+
+        # the records are in order of the iterations, so a stable sort keeps every path in order
+        order = np.argsort(pixel_indices, kind = 'stable')
+        pixel_indices, iterations, points = pixel_indices[order], iterations[order], points[order]
+
+        # rays that escape don't move on their last iteration, so their last point repeats the point before it
+        is_repeated = np.concatenate([[False], (pixel_indices[1:] == pixel_indices[:-1]) & np.all(points[1:] == points[:-1], axis = 1)])
+        pixel_indices, iterations, points = pixel_indices[~is_repeated], iterations[~is_repeated], points[~is_repeated]
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(pixel_indices, minlength = self.pixels.shape[0]))])
+
+        return {'pixels' : self.pixels.astype(np.int32), 'offsets' : offsets.astype(np.int64), 'points' : points, 'iterations' : iterations, 'escape_directions' : self.escape_directions.copy()}
+
+    def trajectories(self):
+        """ returns a dictionary of pixel (x, y) => (iterations, (N,3) points, escape direction) of the recorded paths """
+        arrays = self.arrays()
+        offsets = arrays['offsets']
+        return {(int(x), int(y)) : (arrays['iterations'][offsets[r]:offsets[r + 1]], arrays['points'][offsets[r]:offsets[r + 1]], arrays['escape_directions'][r]) for r, (x, y) in enumerate(self.pixels)}
+
+    def save(self, file_path):
+        """ saves the recorded paths to a compressed .npz file (see the top of trajectories.py) and returns its path """
+        np.savez_compressed(file_path, **self.arrays())
+        return file_path
+
+def trajectory_file_path(image_file_path):
+    """ returns the path of the paths recorded by the capture of an image file """
+    return os.path.splitext(image_file_path)[0] + "_trajectories.npz"
+
+""" Recording """
+# the tracers call these with the indices (into the batch) of the rays and their positions or escape directions. they do nothing without a recorder.
+
+def record_trajectories(trajectories, ray_indices, positions, iteration, is_final = False):
+    """ records the positions of the rays at the iteration (see TrajectoryRecorder.record) """
+    if (trajectories is not None):
+        trajectories.record(ray_indices, positions, iteration, is_final)
+
+def record_trajectory_escapes(trajectories, ray_indices, directions):
+    """ records the directions in which the rays escape to the background (see TrajectoryRecorder.record_escapes) """
+    if (trajectories is not None):
+        trajectories.record_escapes(ray_indices, directions)
\ No newline at end of file